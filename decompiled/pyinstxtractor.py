@@ -85,12 +85,45 @@ Version 2.0 (March 26, 2020)
 
 from __future__ import print_function
 import os
+import mmap
 import struct
-import marshal
 import zlib
 import sys
+import argparse
+import hashlib
+import marshal
+import importlib
+import contextlib
+import gc
+import threading
+import weakref
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from uuid import uuid4 as uniquename
 
+# Optional helpers (shared PYZ reader, content store, manifest, metrics, PYZ decryption)
+# live in ../runtime. They are imported on first use, a copy of this script placed
+# next to the exe still works on its own with the built-in PYZ handling.
+RUNTIME_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'runtime')
+CRYPTO_KEY_MODULE = 'pyimod00_crypto_key'
+
+
+def importRuntime(name):
+    if os.path.isdir(RUNTIME_DIR) and RUNTIME_DIR not in sys.path:
+        sys.path.append(RUNTIME_DIR)
+    try:
+        return importlib.import_module(name)
+    except ImportError:
+        return None
+
+
+def span(stage, name=None, **attrs):
+    # Spans are only kept when RUNTIME_METRICS_DIR is set, skip the import otherwise
+    instrument = importRuntime('instrument') if os.environ.get('RUNTIME_METRICS_DIR') else None
+    if instrument is None:
+        return contextlib.nullcontext(attrs)
+    return instrument.span(stage, name, **attrs)
+
 
 class CTOCEntry:
     def __init__(self, position, cmprsdDataSize, uncmprsdDataSize, cmprsFlag, typeCmprsData, name):
@@ -106,17 +139,37 @@ class PyInstArchive:
     PYINST20_COOKIE_SIZE = 24           # For pyinstaller 2.0
     PYINST21_COOKIE_SIZE = 24 + 64      # For pyinstaller 2.1+
     MAGIC = b'MEI\014\013\012\013\016'  # Magic number which identifies pyinstaller
+    STREAM_CHUNK_SIZE = 1024 * 1024     # Read/inflate granularity for streamed entries
+    STREAMABLE_TYPES = (b'b', b'x', b'l')  # Raw data entries written as is; z/Z go through the PYZ handling
 
-    def __init__(self, path):
+    def __init__(self, path, useMmap=False, streamThreshold=64 * 1024 * 1024, store=None, incremental=False,
+                 cryptoKey=None):
         self.filePath = path
+        self.store = store # ContentStore: outputs become hardlinks to deduplicated objects
+        self.incremental = incremental # Skip entries the previous run's manifest shows unchanged
+        self.manifest = None
+        self.skipped = 0
+        self.absFilePath = os.path.abspath(path) # extractFiles changes the working directory
+        self.streamThreshold = streamThreshold # Entries this large are inflated chunk by chunk
         self.pycMagic = b'\0' * 4
         self.barePycList = [] # List of pyc's whose headers have to be fixed
+        self.useMmap = useMmap # Read through a memory map and hand out memoryview slices
+        self.pool = None # Worker pool used by extractFiles when jobs > 1
+        self.slots = None # Bounds the PYZ members queued on the pool
+        self.mmapData = None
+        self.fileView = None
+        self.views = weakref.WeakSet() # Slices handed out by _view, released before the mapping is closed
+        self.cryptoKey = cryptoKey # AES key of an encrypted PYZ, read from pyimod00_crypto_key when None
+        self.cryptoKeyData = None
 
 
     def open(self):
         try:
             self.fPtr = open(self.filePath, 'rb')
             self.fileSize = os.stat(self.filePath).st_size
+            if self.useMmap:
+                self.mmapData = mmap.mmap(self.fPtr.fileno(), 0, access=mmap.ACCESS_READ)
+                self.fileView = memoryview(self.mmapData)
         except:
             print('[!] Error: Could not open {0}'.format(self.filePath))
             return False
@@ -124,12 +177,43 @@ class PyInstArchive:
 
 
     def close(self):
+        if self.mmapData is not None:
+            # A slice that is still alive keeps the mapping exported and mmap.close() would fail
+            for view in list(self.views):
+                try:
+                    view.release()
+                except BufferError:
+                    pass # Something holds a buffer of this slice, reported below
+            self.fileView.release()
+            try:
+                self.mmapData.close()
+            except BufferError:
+                gc.collect() # Views left in reference cycles
+                try:
+                    self.mmapData.close()
+                except BufferError as e:
+                    print('[!] Warning: Could not unmap {0}: {1}. The mapping is released once its last view is gone'.format(self.filePath, e))
+            self.mmapData = None
         try:
             self.fPtr.close()
         except:
             pass
 
 
+    def _view(self, start, end):
+        view = self.fileView[start:end]
+        self.views.add(view)
+        return view
+
+
+    def _readAt(self, pos, size):
+        # Zero-copy slice of the mapping in mmap mode, a fresh bytes object otherwise
+        if self.mmapData is not None:
+            return self._view(pos, pos + size)
+        self.fPtr.seek(pos, os.SEEK_SET)
+        return self.fPtr.read(size)
+
+
     def checkFile(self):
         print('[+] Processing {0}'.format(self.filePath))
 
@@ -141,34 +225,37 @@ class PyInstArchive:
             print('[!] Error : File is too short or truncated')
             return False
 
-        while True:
-            startPos = endPos - searchChunkSize if endPos >= searchChunkSize else 0
-            chunkSize = endPos - startPos
+        if self.mmapData is not None:
+            # The whole file is addressable, a single reverse search finds the cookie
+            self.cookiePos = self.mmapData.rfind(self.MAGIC)
 
-            if chunkSize < len(self.MAGIC):
-                break
+        else:
+            while True:
+                startPos = endPos - searchChunkSize if endPos >= searchChunkSize else 0
+                chunkSize = endPos - startPos
 
-            self.fPtr.seek(startPos, os.SEEK_SET)
-            data = self.fPtr.read(chunkSize)
+                if chunkSize < len(self.MAGIC):
+                    break
 
-            offs = data.rfind(self.MAGIC)
+                self.fPtr.seek(startPos, os.SEEK_SET)
+                data = self.fPtr.read(chunkSize)
 
-            if offs != -1:
-                self.cookiePos = startPos + offs
-                break
+                offs = data.rfind(self.MAGIC)
 
-            endPos = startPos + len(self.MAGIC) - 1
+                if offs != -1:
+                    self.cookiePos = startPos + offs
+                    break
 
-            if startPos == 0:
-                break
+                endPos = startPos + len(self.MAGIC) - 1
+
+                if startPos == 0:
+                    break
 
         if self.cookiePos == -1:
             print('[!] Error : Missing cookie, unsupported pyinstaller version or not a pyinstaller archive')
             return False
 
-        self.fPtr.seek(self.cookiePos + self.PYINST20_COOKIE_SIZE, os.SEEK_SET)
-
-        if b'python' in self.fPtr.read(64).lower():
+        if b'python' in bytes(self._readAt(self.cookiePos + self.PYINST20_COOKIE_SIZE, 64)).lower():
             print('[+] Pyinstaller version: 2.1+')
             self.pyinstVer = 21     # pyinstaller 2.1+
         else:
@@ -181,18 +268,14 @@ class PyInstArchive:
     def getCArchiveInfo(self):
         try:
             if self.pyinstVer == 20:
-                self.fPtr.seek(self.cookiePos, os.SEEK_SET)
-
                 # Read CArchive cookie
                 (magic, lengthofPackage, toc, tocLen, pyver) = \
-                struct.unpack('!8siiii', self.fPtr.read(self.PYINST20_COOKIE_SIZE))
+                struct.unpack('!8siiii', self._readAt(self.cookiePos, self.PYINST20_COOKIE_SIZE))
 
             elif self.pyinstVer == 21:
-                self.fPtr.seek(self.cookiePos, os.SEEK_SET)
-
                 # Read CArchive cookie
                 (magic, lengthofPackage, toc, tocLen, pyver, pylibname) = \
-                struct.unpack('!8sIIii64s', self.fPtr.read(self.PYINST21_COOKIE_SIZE))
+                struct.unpack('!8sIIii64s', self._readAt(self.cookiePos, self.PYINST21_COOKIE_SIZE))
 
         except:
             print('[!] Error : The file is not a pyinstaller archive')
@@ -215,21 +298,19 @@ class PyInstArchive:
 
 
     def parseTOC(self):
-        # Go to the table of contents
-        self.fPtr.seek(self.tableOfContentsPos, os.SEEK_SET)
-
         self.tocList = []
         parsedLen = 0
 
         # Parse table of contents
         while parsedLen < self.tableOfContentsSize:
-            (entrySize, ) = struct.unpack('!i', self.fPtr.read(4))
+            entryStart = self.tableOfContentsPos + parsedLen
+            (entrySize, ) = struct.unpack('!i', self._readAt(entryStart, 4))
             nameLen = struct.calcsize('!iIIIBc')
 
             (entryPos, cmprsdDataSize, uncmprsdDataSize, cmprsFlag, typeCmprsData, name) = \
             struct.unpack( \
                 '!IIIBc{0}s'.format(entrySize - nameLen), \
-                self.fPtr.read(entrySize - 4))
+                self._readAt(entryStart + 4, entrySize - 4))
 
             try:
                 name = name.decode("utf-8").rstrip("\0")
@@ -260,17 +341,33 @@ class PyInstArchive:
         print('[+] Found {0} files in CArchive'.format(len(self.tocList)))
 
 
-    def _writeRawData(self, filepath, data):
+    def _rawDataPath(self, filepath):
         nm = filepath.replace('\\', os.path.sep).replace('/', os.path.sep).replace('..', '__')
         nmDir = os.path.dirname(nm)
-        if nmDir != '' and not os.path.exists(nmDir): # Check if path exists, create if not
-            os.makedirs(nmDir)
+        if nmDir != '': # Create the path if needed, other workers may be creating it too
+            os.makedirs(nmDir, exist_ok=True)
+        return nm
+
 
-        with open(nm, 'wb') as f:
+    def _openOutput(self, filename):
+        # In store mode the file is hashed first and only written if its content is new
+        if self.store is None:
+            # A previous --store run may have left a hardlink to a shared object here,
+            # unlink it so the write cannot go through into the store
+            try:
+                os.unlink(filename)
+            except FileNotFoundError:
+                pass
+            return open(filename, 'wb')
+        return self.store.writer(filename)
+
+
+    def _writeRawData(self, filepath, data):
+        with self._openOutput(self._rawDataPath(filepath)) as f:
             f.write(data)
 
 
-    def extractFiles(self):
+    def extractFiles(self, jobs=1):
         print('[+] Beginning extraction...please standby')
         extractionDir = os.path.join(os.getcwd(), os.path.basename(self.filePath) + '_extracted')
 
@@ -279,83 +376,298 @@ class PyInstArchive:
 
         os.chdir(extractionDir)
 
-        for entry in self.tocList:
-            self.fPtr.seek(entry.position, os.SEEK_SET)
-            data = self.fPtr.read(entry.cmprsdDataSize)
+        if self.incremental:
+            extractManifest = importRuntime('extract_manifest')
+            if extractManifest is None:
+                print('[!] Warning: runtime/extract_manifest.py not found, extracting everything')
+            else:
+                self.manifest = extractManifest.ExtractManifest(extractionDir, self.absFilePath)
+                if self.manifest.same_archive:
+                    print('[+] Archive unchanged since the last run, checking outputs only')
 
-            if entry.cmprsFlag == 1:
-                try:
-                    data = zlib.decompress(data)
-                except zlib.error:
-                    print('[!] Error : Failed to decompress {0}'.format(entry.name))
+        if jobs > 1:
+            # zlib releases the GIL, so entries are decompressed and written on a thread pool
+            self.pool = ThreadPoolExecutor(max_workers=jobs)
+            self.slots = threading.BoundedSemaphore(jobs * 4)
+        self.pending = deque() # Appended to by PYZ tasks on the workers too
+
+        # PYZ tasks need the key module, read it here before any of them is queued
+        self.cryptoKeyData = self._readCryptoKeyModule()
+
+        try:
+            for entry in self.tocList:
+                # Same archive as last time: the manifest metadata alone decides, nothing is read
+                if self._isUnchanged(entry):
                     continue
-                # Malware may tamper with the uncompressed size
-                # Comment out the assertion in such a case
-                assert len(data) == entry.uncmprsdDataSize # Sanity Check
-
-            if entry.typeCmprsData == b'd' or entry.typeCmprsData == b'o':
-                # d -> ARCHIVE_ITEM_DEPENDENCY
-                # o -> ARCHIVE_ITEM_RUNTIME_OPTION
-                # These are runtime options, not files
-                continue
 
-            basePath = os.path.dirname(entry.name)
-            if basePath != '':
-                # Check if path exists, create if not
-                if not os.path.exists(basePath):
-                    os.makedirs(basePath)
-
-            if entry.typeCmprsData == b's':
-                # s -> ARCHIVE_ITEM_PYSOURCE
-                # Entry point are expected to be python scripts
-                print('[+] Possible entry point: {0}.pyc'.format(entry.name))
-
-                if self.pycMagic == b'\0' * 4:
-                    # if we don't have the pyc header yet, fix them in a later pass
-                    self.barePycList.append(entry.name + '.pyc')
-                self._writePyc(entry.name + '.pyc', data)
-
-            elif entry.typeCmprsData == b'M' or entry.typeCmprsData == b'm':
-                # M -> ARCHIVE_ITEM_PYPACKAGE
-                # m -> ARCHIVE_ITEM_PYMODULE
-                # packages and modules are pyc files with their header intact
-
-                # From PyInstaller 5.3 and above pyc headers are no longer stored
-                # https://github.com/pyinstaller/pyinstaller/commit/a97fdf
-                if data[2:4] == b'\r\n':
-                    # < pyinstaller 5.3
-                    if self.pycMagic == b'\0' * 4: 
-                        self.pycMagic = data[0:4]
-                    self._writeRawData(entry.name + '.pyc', data)
+                if self.streamThreshold and entry.typeCmprsData in self.STREAMABLE_TYPES and \
+                        max(entry.cmprsdDataSize, entry.uncmprsdDataSize) >= self.streamThreshold:
+                    if self.manifest is not None and not self.manifest.same_archive and \
+                            self._isUnchanged(entry, self._entryCrc(entry)):
+                        continue
+                    # Never held in memory as a whole, the task reads it in chunks itself
+                    self._submit(self._timed, 'extract', entry.name, entry.cmprsdDataSize, self._streamEntry, entry)
+                    continue
+
+                # Reads stay on this thread, the shared file pointer is not thread safe
+                data = self._readAt(entry.position, entry.cmprsdDataSize)
+                crc = None
+                if self.manifest is not None:
+                    crc = zlib.crc32(data)
+                    if self._isUnchanged(entry, crc):
+                        continue
+                self._submit(self._timed, 'extract', entry.name, len(data), self._extractEntry, entry, data, crc)
+
+                # Bound the compressed data queued up ahead of the workers
+                if len(self.pending) > jobs * 4:
+                    self.pending.popleft().result()
+
+            # PYZ tasks queue their members while running, so drain until nothing is left
+            while self.pending:
+                self.pending.popleft().result()
+        finally:
+            if self.pool is not None:
+                self.pool.shutdown()
+                self.pool = None
+
+        if self.manifest is not None and self.pycMagic == b'\0' * 4 and self.manifest.pyc_magic:
+            # The entries that revealed the magic were skipped, reuse the last run's
+            self.pycMagic = self.manifest.pyc_magic
+
+        # Fix bare pyc's if any
+        self._fixBarePycs()
+
+        if self.manifest is not None:
+            removed = self.manifest.remove_stale()
+            self.manifest.save(self.pycMagic)
+            print('[+] Incremental: {0} entries unchanged, {1} stale outputs removed'.format(self.skipped, removed))
+
+
+    def _entryMeta(self, entry):
+        return [entry.typeCmprsData.decode('latin-1'), entry.cmprsFlag, entry.cmprsdDataSize, entry.uncmprsdDataSize]
+
+
+    def _entryCrc(self, entry):
+        crc = 0
+        for chunk in self._iterEntryChunks(entry):
+            crc = zlib.crc32(chunk, crc)
+        return crc
+
+
+    def _isUnchanged(self, entry, crc=None):
+        if self.manifest is None or not self.manifest.check(entry.name, self._entryMeta(entry), crc):
+            return False
+        if entry.typeCmprsData == b'z' or entry.typeCmprsData == b'Z':
+            # The PYZ itself is unchanged, but its members must still be on disk
+            if not self.manifest.check_prefix(entry.name + ':'):
+                return False
+        self.skipped += 1
+        return True
+
+
+    def _record(self, key, meta, crc, out):
+        if self.manifest is not None:
+            self.manifest.record(key, meta, crc, out)
+
+
+    def _submit(self, func, *args):
+        if self.pool is None:
+            func(*args)
+        else:
+            self.pending.append(self.pool.submit(func, *args))
+
+
+    def _submitMember(self, *args):
+        # PYZ members are queued from a worker: at most jobs * 4 in flight, the rest are
+        # unpacked inline. Blocking here instead could leave every worker waiting on a slot
+        if self.pool is None or not self.slots.acquire(blocking=False):
+            self._timed(*args)
+        else:
+            self.pending.append(self.pool.submit(self._timed, *args, slot=True))
 
-                else:
-                    # >= pyinstaller 5.3
-                    if self.pycMagic == b'\0' * 4:
-                        # if we don't have the pyc header yet, fix them in a later pass
-                        self.barePycList.append(entry.name + '.pyc')
 
-                    self._writePyc(entry.name + '.pyc', data)
+    def _timed(self, stage, name, bytesRead, func, *args, slot=False):
+        # One span per entry (bytes read, wall time), kept only when RUNTIME_METRICS_DIR is set
+        try:
+            with span(stage, name, bytes_read=bytesRead):
+                func(*args)
+        finally:
+            if slot:
+                self.slots.release()
+
+
+    def _extractEntry(self, entry, data, crc=None):
+        if entry.cmprsFlag == 1:
+            try:
+                with span('decompress', entry.name):
+                    data = zlib.decompress(data)
+            except zlib.error:
+                print('[!] Error : Failed to decompress {0}'.format(entry.name))
+                return
+            # Malware may tamper with the uncompressed size
+            # Comment out the assertion in such a case
+            assert len(data) == entry.uncmprsdDataSize # Sanity Check
+
+        if entry.typeCmprsData == b'd' or entry.typeCmprsData == b'o':
+            # d -> ARCHIVE_ITEM_DEPENDENCY
+            # o -> ARCHIVE_ITEM_RUNTIME_OPTION
+            # These are runtime options, not files
+            self._record(entry.name, self._entryMeta(entry), crc, None)
+            return
+
+        basePath = os.path.dirname(entry.name)
+        if basePath != '':
+            # Create the path if needed, other workers may be creating it too
+            os.makedirs(basePath, exist_ok=True)
+
+        if entry.typeCmprsData == b's':
+            # s -> ARCHIVE_ITEM_PYSOURCE
+            # Entry point are expected to be python scripts
+            print('[+] Possible entry point: {0}.pyc'.format(entry.name))
+            self._writeBarePyc(entry.name + '.pyc', data)
+            self._record(entry.name, self._entryMeta(entry), crc, entry.name + '.pyc')
+
+        elif entry.typeCmprsData == b'M' or entry.typeCmprsData == b'm':
+            # M -> ARCHIVE_ITEM_PYPACKAGE
+            # m -> ARCHIVE_ITEM_PYMODULE
+            # packages and modules are pyc files with their header intact
+
+            # From PyInstaller 5.3 and above pyc headers are no longer stored
+            # https://github.com/pyinstaller/pyinstaller/commit/a97fdf
+            if data[2:4] == b'\r\n':
+                # < pyinstaller 5.3
+                if self.pycMagic == b'\0' * 4: 
+                    self.pycMagic = bytes(data[0:4])
+                self._writeRawData(entry.name + '.pyc', data)
 
             else:
-                self._writeRawData(entry.name, data)
+                # >= pyinstaller 5.3
+                self._writeBarePyc(entry.name + '.pyc', data)
 
-                if entry.typeCmprsData == b'z' or entry.typeCmprsData == b'Z':
-                    self._extractPyz(entry.name)
+            self._record(entry.name, self._entryMeta(entry), crc, entry.name + '.pyc')
 
-        # Fix bare pyc's if any
-        self._fixBarePycs()
+        else:
+            self._writeRawData(entry.name, data)
+            self._record(entry.name, self._entryMeta(entry), crc, self._rawDataPath(entry.name))
+
+            if entry.typeCmprsData == b'z' or entry.typeCmprsData == b'Z':
+                # In mmap mode the PYZ is read straight from the mapped archive
+                self._extractPyz(entry.name, data if self.mmapData is not None else None)
+
+
+    def _streamEntry(self, entry):
+        nm = self._rawDataPath(entry.name)
+        storeKey = None
+
+        if self.store is not None:
+            # Key the object by the compressed bytes, an unchanged library is linked without inflating it
+            hasher = hashlib.sha256('{0}:{1}:'.format(entry.cmprsFlag, entry.uncmprsdDataSize).encode())
+            crc = 0
+            for chunk in self._iterEntryChunks(entry):
+                hasher.update(chunk)
+                crc = zlib.crc32(chunk, crc)
+            storeKey = hasher.hexdigest()
+            digest = self.store.alias_get(storeKey)
+            if digest is not None and self.store.link(digest, nm):
+                self._record(entry.name, self._entryMeta(entry), crc, nm)
+                return
+
+        decompressor = zlib.decompressobj() if entry.cmprsFlag == 1 else None
+        written = 0
+        crc = 0
+
+        try:
+            with self._openOutput(nm) as f:
+                for chunk in self._iterEntryChunks(entry):
+                    crc = zlib.crc32(chunk, crc)
+                    if decompressor is None:
+                        f.write(chunk)
+                        written += len(chunk)
+                    else:
+                        while chunk:
+                            # Cap the output per call so a high ratio chunk cannot balloon
+                            out = decompressor.decompress(chunk, self.STREAM_CHUNK_SIZE)
+                            chunk = decompressor.unconsumed_tail
+                            f.write(out)
+                            written += len(out)
+                            # Malware may tamper with the uncompressed size
+                            # Comment out the assertion in such a case
+                            assert written <= entry.uncmprsdDataSize # Sanity Check
+
+                if decompressor is not None:
+                    out = decompressor.flush()
+                    f.write(out)
+                    written += len(out)
+
+        except zlib.error:
+            print('[!] Error : Failed to decompress {0}'.format(entry.name))
+            if os.path.exists(nm):
+                os.remove(nm)
+            return
+
+        assert written == entry.uncmprsdDataSize # Sanity Check
+        if storeKey is not None:
+            self.store.alias_set(storeKey, f.digest)
+        self._record(entry.name, self._entryMeta(entry), crc, nm)
+
+
+    def _iterEntryChunks(self, entry):
+        # mmap slices are thread safe, the file path needs a handle of its own
+        src = open(self.absFilePath, 'rb') if self.mmapData is None else None
+        try:
+            for offset in range(0, entry.cmprsdDataSize, self.STREAM_CHUNK_SIZE):
+                start = entry.position + offset
+                size = min(self.STREAM_CHUNK_SIZE, entry.cmprsdDataSize - offset)
+                if src is None:
+                    yield self._view(start, start + size)
+                    self._dropPages(start, start + size)
+                else:
+                    src.seek(start, os.SEEK_SET)
+                    yield src.read(size)
+        finally:
+            if src is not None:
+                src.close()
+
+
+    def _dropPages(self, start, end):
+        # Consumed pages of the mapping would otherwise stay resident until close
+        if not hasattr(mmap, 'MADV_DONTNEED'):
+            return
+        start -= start % mmap.PAGESIZE
+        end -= end % mmap.PAGESIZE
+        if end > start:
+            self.mmapData.madvise(mmap.MADV_DONTNEED, start, end - start)
+
+
+    def _writeBarePyc(self, filename, data):
+        # Snapshot the magic once, another worker may discover it while we write
+        pycMagic = self.pycMagic
+        if pycMagic == b'\0' * 4:
+            # if we don't have the pyc header yet, fix them in a later pass
+            self.barePycList.append(filename)
+        self._writePyc(filename, data, pycMagic)
 
 
     def _fixBarePycs(self):
         for pycFile in self.barePycList:
+            if self.store is not None:
+                # Store objects are shared and read-only, relink the fixed content instead
+                with open(pycFile, 'rb') as f:
+                    data = f.read()
+                with self._openOutput(pycFile) as f:
+                    f.write(self.pycMagic)
+                    f.write(data[4:])
+                continue
+
+            # Written by _openOutput in this run, so a fresh file and never a store hardlink
             with open(pycFile, 'r+b') as pycFile:
                 # Overwrite the first four bytes
                 pycFile.write(self.pycMagic)
 
 
-    def _writePyc(self, filename, data):
-        with open(filename, 'wb') as pycFile:
-            pycFile.write(self.pycMagic)            # pyc magic
+    def _writePyc(self, filename, data, pycMagic=None):
+        with self._openOutput(filename) as pycFile:
+            pycFile.write(pycMagic or self.pycMagic)            # pyc magic
 
             if self.pymaj >= 3 and self.pymin >= 7:                # PEP 552 -- Deterministic pycs
                 pycFile.write(b'\0' * 4)        # Bitfield
@@ -369,17 +681,48 @@ class PyInstArchive:
             pycFile.write(data)
 
 
-    def _extractPyz(self, name):
+    def _readCryptoKeyModule(self):
+        for entry in self.tocList:
+            if entry.name == CRYPTO_KEY_MODULE:
+                data = bytes(self._readAt(entry.position, entry.cmprsdDataSize))
+                return zlib.decompress(data) if entry.cmprsFlag == 1 else data
+        return None
+
+
+    def _pyzCipher(self, pyz, pycMagic):
+        if self.cryptoKey is None and self.cryptoKeyData is None:
+            return None
+        pyzCrypto = importRuntime('pyz_crypto')
+        if pyzCrypto is None:
+            print('[!] Warning: runtime/pyz_crypto.py not found, encrypted files are extracted as is.')
+            return None
+        try:
+            key = self.cryptoKey
+            if key is None and self.cryptoKeyData is not None:
+                key = pyzCrypto.key_from_marshal(self.cryptoKeyData, pycMagic)
+            cipher = pyz.load_key(key)
+        except (ValueError, RuntimeError) as e:
+            print('[!] Warning: Cannot decrypt {0}: {1}. Encrypted files are extracted as is.'.format(pyz.path, e))
+            return None
+        if cipher is not None:
+            print('[+] Encrypted PYZ archive, decrypting files with AES-{0}'.format(cipher.mode.upper()))
+        return cipher
+
+
+    def _extractPyz(self, name, pyzData=None):
         dirName =  name + '_extracted'
         # Create a directory for the contents of the pyz
         if not os.path.exists(dirName):
             os.mkdir(dirName)
 
-        with open(name, 'rb') as f:
-            pyzMagic = f.read(4)
-            assert pyzMagic == b'PYZ\0' # Sanity Check
+        extractPyz = importRuntime('extract_pyz')
+        if extractPyz is None:
+            self._extractPyzBuiltin(name, dirName, pyzData)
+            return
 
-            pyzPycMagic = f.read(4) # Python magic value
+        # Raises if the PYZ magic is missing (Sanity Check)
+        with extractPyz.PyzArchive(name, data=pyzData, use_index=False) as pyz:
+            pyzPycMagic = pyz.pyc_magic # Python magic value
 
             if self.pycMagic == b'\0' * 4:
                 self.pycMagic = pyzPycMagic
@@ -388,80 +731,183 @@ class PyInstArchive:
                 self.pycMagic = pyzPycMagic
                 print('[!] Warning: pyc magic of files inside PYZ archive are different from those in CArchive')
 
-            # Skip PYZ extraction if not running under the same python version
+            # Under a different python version the TOC is decoded by marshal_lite,
+            # members are written as is and never unmarshalled
             if self.pymaj != sys.version_info.major or self.pymin != sys.version_info.minor:
-                print('[!] Warning: This script is running in a different Python version than the one used to build the executable.')
-                print('[!] Please run this script in Python {0}.{1} to prevent extraction errors during unmarshalling'.format(self.pymaj, self.pymin))
-                print('[!] Skipping pyz extraction')
-                return
-
-            (tocPosition, ) = struct.unpack('!i', f.read(4))
-            f.seek(tocPosition, os.SEEK_SET)
+                print('[+] Python {0}.{1} bundle on a different interpreter, decoding the PYZ TOC in pure python'.format(self.pymaj, self.pymin))
 
             try:
-                toc = marshal.load(f)
+                names = pyz.list()
             except:
                 print('[!] Unmarshalling FAILED. Cannot extract {0}. Extracting remaining files.'.format(name))
                 return
 
-            print('[+] Found {0} files in PYZ archive'.format(len(toc)))
+            print('[+] Found {0} files in PYZ archive'.format(len(names)))
+            cipher = self._pyzCipher(pyz, pyzPycMagic)
 
-            # From pyinstaller 3.1+ toc is a list of tuples
-            if type(toc) == list:
-                toc = dict(toc)
+            for memberName in names:
+                filePath = os.path.join(dirName, pyz.output_path(memberName))
 
-            for key in toc.keys():
-                (ispkg, pos, length) = toc[key]
-                f.seek(pos, os.SEEK_SET)
-                fileName = key
+                fileDir = os.path.dirname(filePath)
+                if not os.path.exists(fileDir):
+                    os.makedirs(fileDir, exist_ok=True)
 
-                try:
-                    # for Python > 3.3 some keys are bytes object some are str object
-                    fileName = fileName.decode('utf-8')
-                except:
-                    pass
+                # Read here, decompress and write on the pool (inline when jobs == 1)
+                data = pyz.read_raw(memberName)
+                key = self._pyzMemberKey(name, memberName)
+                crc = None
+                if self.manifest is not None:
+                    crc = zlib.crc32(data)
+                    if self.manifest.check(key, [len(data)], crc):
+                        self.skipped += 1
+                        continue
+                self._submitMember('pyz_unpack', key, len(data), self._extractPyzMember, filePath, data, pyzPycMagic, key, crc, cipher)
 
-                # Prevent writing outside dirName
-                fileName = fileName.replace('..', '__').replace('.', os.path.sep)
 
-                if ispkg == 1:
-                    filePath = os.path.join(dirName, fileName, '__init__.pyc')
+    @staticmethod
+    def _pyzMemberKey(name, moduleName):
+        # Manifest key of a PYZ member, the same whichever PYZ reader ran: <pyz entry>:<dotted module name>
+        return name + ':' + moduleName
 
-                else:
-                    filePath = os.path.join(dirName, fileName + '.pyc')
 
-                fileDir = os.path.dirname(filePath)
-                if not os.path.exists(fileDir):
-                    os.makedirs(fileDir)
+    def _extractPyzBuiltin(self, name, dirName, pyzData=None):
+        # Without runtime/extract_pyz.py: the TOC is unmarshalled by this interpreter
+        if pyzData is None:
+            with open(name, 'rb') as f:
+                pyzData = f.read()
+        pyzData = bytes(pyzData)
+
+        assert pyzData[:4] == b'PYZ\0' # Sanity Check
+        pyzPycMagic = pyzData[4:8] # Python magic value
+
+        if self.pycMagic == b'\0' * 4:
+            self.pycMagic = pyzPycMagic
 
+        elif self.pycMagic != pyzPycMagic:
+            self.pycMagic = pyzPycMagic
+            print('[!] Warning: pyc magic of files inside PYZ archive are different from those in CArchive')
+
+        # Skip PYZ extraction if not running under the same python version
+        if self.pymaj != sys.version_info.major or self.pymin != sys.version_info.minor:
+            print('[!] Warning: This script is running in a different Python version than the one used to build the executable.')
+            print('[!] Please run this script in Python {0}.{1} to prevent extraction errors during unmarshalling'.format(self.pymaj, self.pymin))
+            print('[!] Skipping pyz extraction')
+            return
+
+        (tocPosition, ) = struct.unpack('!i', pyzData[8:12])
+
+        try:
+            toc = marshal.loads(pyzData[tocPosition:])
+        except:
+            print('[!] Unmarshalling FAILED. Cannot extract {0}. Extracting remaining files.'.format(name))
+            return
+
+        print('[+] Found {0} files in PYZ archive'.format(len(toc)))
+
+        # From pyinstaller 3.1+ toc is a list of tuples
+        if type(toc) == list:
+            toc = dict(toc)
+
+        for key in toc.keys():
+            (ispkg, pos, length) = toc[key]
+            moduleName = key
+
+            try:
+                # for Python > 3.3 some keys are bytes object some are str object
+                moduleName = moduleName.decode('utf-8') if isinstance(moduleName, bytes) else str(moduleName)
+            except UnicodeDecodeError:
+                moduleName = str(moduleName) # Same fallback as extract_pyz.PyzArchive
+
+            # Prevent writing outside dirName
+            fileName = moduleName.replace('..', '__').replace('.', os.path.sep)
+
+            if ispkg == 1:
+                filePath = os.path.join(dirName, fileName, '__init__.pyc')
+
+            else:
+                filePath = os.path.join(dirName, fileName + '.pyc')
+
+            fileDir = os.path.dirname(filePath)
+            if not os.path.exists(fileDir):
+                os.makedirs(fileDir, exist_ok=True)
+
+            data = pyzData[pos:pos + length]
+            memberKey = self._pyzMemberKey(name, moduleName)
+            crc = None
+            if self.manifest is not None:
+                crc = zlib.crc32(data)
+                if self.manifest.check(memberKey, [len(data)], crc):
+                    self.skipped += 1
+                    continue
+            self._submitMember('pyz_unpack', memberKey, len(data), self._extractPyzMember, filePath, data, pyzPycMagic, memberKey, crc)
+
+
+    def _extractPyzMember(self, filePath, data, pycMagic, key=None, crc=None, cipher=None):
+        meta = [len(data)]
+        try:
+            # Decrypted on the same worker that inflates it, AES and zlib both release the GIL
+            with span('decompress', key):
                 try:
-                    data = f.read(length)
                     data = zlib.decompress(data)
-                except:
-                    print('[!] Error: Failed to decompress {0}, probably encrypted. Extracting as is.'.format(filePath))
-                    open(filePath + '.encrypted', 'wb').write(data)
-                else:
-                    self._writePyc(filePath, data)
+                except zlib.error:
+                    # Plain members first, only then decrypt
+                    if cipher is None:
+                        raise
+                    data = cipher.inflate(data)
+        except:
+            print('[!] Error: Failed to decompress {0}, probably encrypted. Extracting as is.'.format(filePath))
+            with self._openOutput(filePath + '.encrypted') as f:
+                f.write(data)
+            self._record(key, meta, crc, filePath + '.encrypted')
+        else:
+            self._writePyc(filePath, data, pycMagic)
+            self._record(key, meta, crc, filePath)
 
 
 def main():
-    if len(sys.argv) < 2:
-        print('[+] Usage: pyinstxtractor.py <filename>')
-
-    else:
-        arch = PyInstArchive(sys.argv[1])
-        if arch.open():
-            if arch.checkFile():
-                if arch.getCArchiveInfo():
+    parser = argparse.ArgumentParser(prog='pyinstxtractor.py')
+    parser.add_argument('filename')
+    parser.add_argument('--mmap', action='store_true',
+                        help='memory-map the executable and extract from zero-copy slices')
+    parser.add_argument('--jobs', type=int, default=1, metavar='N',
+                        help='decompress and write entries on N worker threads')
+    parser.add_argument('--stream-threshold', type=int, default=64, metavar='MB',
+                        help='inflate entries of at least MB megabytes in fixed-size chunks, 0 disables (default: 64)')
+    parser.add_argument('--store', metavar='DIR',
+                        help='deduplicate outputs into a content-addressed store and hardlink them into the tree')
+    parser.add_argument('--incremental', action='store_true',
+                        help='skip entries unchanged since the last run and delete outputs of removed entries')
+    parser.add_argument('--key', metavar='KEY',
+                        help='AES key of an encrypted PYZ (default: read from the pyimod00_crypto_key entry)')
+    args = parser.parse_args()
+
+    store = None
+    if args.store:
+        casStore = importRuntime('cas_store')
+        if casStore is None:
+            print('[!] Error: --store needs runtime/cas_store.py next to this script')
+            return
+        store = casStore.ContentStore(args.store)
+
+    arch = PyInstArchive(args.filename, useMmap=args.mmap,
+                         streamThreshold=args.stream_threshold * 1024 * 1024,
+                         store=store,
+                         incremental=args.incremental,
+                         cryptoKey=args.key.encode('utf-8') if args.key else None)
+    if arch.open():
+        if arch.checkFile():
+            if arch.getCArchiveInfo():
+                with span('parse_toc'):
                     arch.parseTOC()
-                    arch.extractFiles()
-                    arch.close()
-                    print('[+] Successfully extracted pyinstaller archive: {0}'.format(sys.argv[1]))
-                    print('')
-                    print('You can now use a python decompiler on the pyc files within the extracted directory')
-                    return
-
-            arch.close()
+                with span('extract_all', bytes_read=arch.overlaySize):
+                    arch.extractFiles(jobs=args.jobs)
+                arch.close()
+                print('[+] Successfully extracted pyinstaller archive: {0}'.format(args.filename))
+                print('')
+                print('You can now use a python decompiler on the pyc files within the extracted directory')
+                return
+
+        arch.close()
 
 
 if __name__ == '__main__':
@@ -1,56 +0,0 @@
-"""
-精确修补torch __init__.py文件
-"""
-
-import os
-
-def patch_torch_init():
-    """修补torch __init__.py文件"""
-    
-    torch_init_path = "site-packages/torch/__init__.py"
-    
-    if not os.path.exists(torch_init_path):
-        print(f"文件不存在: {torch_init_path}")
-        return False
-    
-    # 读取原文件
-    with open(torch_init_path, 'r', encoding='utf-8') as f:
-        lines = f.readlines()
-    
-    # 找到需要修改的行
-    modified = False
-    for i, line in enumerate(lines):
-        if "_C_for_compiled_check.__file__ is None:" in line:
-            # 替换这一行和后续的raise ImportError块
-            lines[i] = "    # 跳过C扩展检查以允许应用程序运行\n"
-            lines[i+1] = "    print('警告: PyTorch C扩展未正确加载，但继续运行...')\n"
-            lines[i+2] = "    # 创建一个虚拟的_C模块\n"
-            lines[i+3] = "    class DummyC:\n"
-            lines[i+4] = "        def __getattr__(self, name):\n"
-            lines[i+5] = "            def dummy(*args, **kwargs):\n"
-            lines[i+6] = "                print(f'警告: torch._C.{name} 被调用但C扩展未加载')\n"
-            lines[i+7] = "                return None\n"
-            lines[i+8] = "            return dummy\n"
-            lines[i+9] = "    _C_for_compiled_check = DummyC()\n"
-            
-            # 删除原来的raise ImportError块（大约17行）
-            for j in range(i+1, min(i+18, len(lines))):
-                if j < len(lines):
-                    lines[j] = ""
-            
-            modified = True
-            break
-    
-    if modified:
-        # 写回文件
-        with open(torch_init_path, 'w', encoding='utf-8') as f:
-            f.writelines(lines)
-        
-        print("torch __init__.py 修补完成")
-        return True
-    else:
-        print("未找到需要修补的代码")
-        return False
-
-if __name__ == "__main__":
-    patch_torch_init()
@@ -0,0 +1,179 @@
+import os
+import re
+import ast
+import argparse
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, NamedTuple, Set, Tuple
+
+import instrument
+from marshal_lite import Code
+from pyc_inspect import iter_code, read_pyc
+
+
+SRC_ROOT = '/tmp/百世_src'
+PYC_ROOT = '/tmp/百世_extracted/PYZ-00_extracted'
+REPORT_PATH = '/tmp/audit_report.txt'
+COMPLETE_SCORE = 0.95  # 低于该分数视为反编译不完整
+DEF_NAME_RE = re.compile(rb'^[ \t]*(?:async[ \t]+)?(?:def|class)[ \t]+(\w+)', re.M)
+QUALNAME_RE = re.compile(r'[\w.<>]+')
+
+
+class AuditResult(NamedTuple):
+    score: float
+    py_path: str
+    pyc_path: str
+    parses: bool
+    name_recall: float
+    string_recall: float
+    missing_names: List[str]
+
+    @property
+    def complete(self) -> bool:
+        return self.score >= COMPLETE_SCORE
+
+    def describe(self) -> str:
+        if not os.path.exists(self.py_path):
+            return 'missing .py'
+        parts = [f'parses={self.parses}', f'names={self.name_recall:.2f}', f'strings={self.string_recall:.2f}']
+        if self.missing_names:
+            parts.append('missing: ' + ', '.join(self.missing_names[:8]) + (' ...' if len(self.missing_names) > 8 else ''))
+        return ' '.join(parts)
+
+
+def _const_strings(value, out: Set[str]) -> None:
+    # 常量元组/frozenset 中的字符串也算（如 x in ('a', 'b') 折叠后的常量）
+    if isinstance(value, str):
+        out.add(value)
+    elif isinstance(value, bytes):
+        out.add(value.decode('utf-8', 'replace'))
+    elif isinstance(value, (tuple, frozenset)):
+        for item in value:
+            _const_strings(item, out)
+
+
+def pyc_facts(pyc_path: str) -> Tuple[Counter, Set[str]]:
+    # 字节码中的 def/class 名称与字符串常量；MAKE_FUNCTION 用的 qualname 常量源码里没有，需排除
+    names: Counter = Counter()
+    strings: Set[str] = set()
+    code_names: Set[str] = set()
+    for code in iter_code(read_pyc(pyc_path)):
+        code_names.update((code.name, code.qualname))
+        if not code.name.startswith('<'):
+            names[code.name] += 1
+        for const in code.consts:
+            if not isinstance(const, Code):
+                _const_strings(const, strings)
+    return names, {s for s in strings
+                   if s not in code_names and not (QUALNAME_RE.fullmatch(s) and s.rpartition('.')[2] in code_names)}
+
+
+def source_facts(source: bytes) -> Tuple[bool, Counter, Set[str]]:
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, ValueError):
+        # 无法解析时按行匹配 def/class，仍能估计缺了多少
+        names = Counter(m.decode('utf-8', 'replace') for m in DEF_NAME_RE.findall(source))
+        return False, names, set()
+    names: Counter = Counter()
+    strings: Set[str] = set()
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            names[node.name] += 1
+        elif isinstance(node, ast.Constant):
+            _const_strings(node.value, strings)
+        elif isinstance(node, ast.keyword) and node.arg:
+            strings.add(node.arg)
+        elif isinstance(node, ast.alias):
+            # from x import a 的名称元组
+            strings.add(node.name)
+        elif isinstance(node, ast.arg):
+            # 函数注解编译为 (参数名, 注解, ..., 'return', 注解) 常量元组
+            strings.add(node.arg)
+            if node.annotation is not None:
+                strings.add(ast.unparse(node.annotation))
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and node.returns is not None:
+            strings.update(('return', ast.unparse(node.returns)))
+        elif isinstance(node, ast.AnnAssign):
+            strings.add(ast.unparse(node.annotation))
+    return True, names, strings
+
+
+def audit_pair(pair: Tuple[str, str]) -> AuditResult:
+    py_path, pyc_path = pair
+    try:
+        want_names, want_strings = pyc_facts(pyc_path)
+    except Exception:
+        # 字节码无法解析（加密等）时无从比较，按完整处理，避免反复重试
+        return AuditResult(1.0, py_path, pyc_path, True, 1.0, 1.0, [])
+    try:
+        with open(py_path, 'rb') as f:
+            source = f.read()
+    except OSError:
+        return AuditResult(0.0, py_path, pyc_path, False, 0.0, 0.0, sorted(want_names))
+
+    parses, have_names, have_strings = source_facts(source)
+    missing = want_names - have_names
+    name_recall = 1.0 - sum(missing.values()) / max(1, sum(want_names.values()))
+    string_recall = len(want_strings & have_strings) / len(want_strings) if want_strings else 1.0
+    if not parses:
+        string_recall = 0.0
+    score = 0.2 * parses + 0.5 * name_recall + 0.3 * string_recall
+    return AuditResult(score, py_path, pyc_path, parses, name_recall, string_recall, sorted(missing.elements()))
+
+
+def iter_pairs(src_root: str, pyc_root: str) -> Iterator[Tuple[str, str]]:
+    for base, _, files in os.walk(pyc_root):
+        for fn in files:
+            if fn.endswith('.pyc'):
+                pyc_path = os.path.join(base, fn)
+                rel = os.path.relpath(pyc_path, pyc_root)
+                yield os.path.join(src_root, rel[:-4] + '.py'), pyc_path
+
+
+def audit_tree(src_root: str = SRC_ROOT, pyc_root: str = PYC_ROOT,
+               jobs: int = os.cpu_count() or 1) -> List[AuditResult]:
+    """Compare every decompiled .py with its .pyc; results ranked worst first.
+
+    A file is scored on whether it parses, how many of the pyc's function and
+    class names it defines and how many of its string constants it contains,
+    so truncated large files are caught and tiny complete modules are not.
+    """
+    pairs = list(iter_pairs(src_root, pyc_root))
+    with instrument.span('audit', files=len(pairs)):
+        if jobs > 1 and len(pairs) > 1:
+            with ProcessPoolExecutor(jobs) as pool:
+                results = list(pool.map(audit_pair, pairs, chunksize=16))
+        else:
+            results = [audit_pair(pair) for pair in pairs]
+    return sorted(results, key=lambda r: (r.score, r.py_path))
+
+
+def find_incomplete(src_root: str = SRC_ROOT, pyc_root: str = PYC_ROOT,
+                    jobs: int = os.cpu_count() or 1) -> List[AuditResult]:
+    return [r for r in audit_tree(src_root, pyc_root, jobs) if not r.complete]
+
+
+def write_report(results: List[AuditResult], report_path: str = REPORT_PATH) -> None:
+    with open(report_path, 'w', encoding='utf-8') as w:
+        for r in results:
+            w.write(f'{r.score:.3f}\t{r.py_path}\t{r.describe()}\n')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Rank decompiled sources by how much of their pyc they recover')
+    parser.add_argument('--src', default=SRC_ROOT)
+    parser.add_argument('--pyc', default=PYC_ROOT)
+    parser.add_argument('--report', default=REPORT_PATH)
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--all', action='store_true', help='list complete files too')
+    args = parser.parse_args()
+
+    results = audit_tree(args.src, args.pyc, args.jobs)
+    incomplete = [r for r in results if not r.complete]
+    write_report(results if args.all else incomplete, args.report)
+    print(f'Audited={len(results)}, Incomplete={len(incomplete)}. Report: {args.report}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+import os
+import sys
+import time
+import zlib
+import struct
+import marshal
+import argparse
+import shutil
+import subprocess
+import sysconfig
+import tempfile
+import importlib.util
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Tuple
+
+
+PYINSTXTRACTOR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'decompiled', 'pyinstxtractor.py')
+COOKIE_MAGIC = b'MEI\014\013\012\013\016'
+
+
+def stdlib_sources(count: int) -> List[Tuple[str, str, bytes]]:
+    # 本机标准库源码，模拟业务模块：(模块名, 文件名, 源码)；数量超过标准库时按 pkg1、pkg2... 重复
+    lib_dir = sysconfig.get_paths()['stdlib']
+    # 只取能被 import 的文件名（跳过 _sysconfigdata_*-linux-gnu 之类）
+    sources = sorted(fn for fn in os.listdir(lib_dir) if fn.endswith('.py') and fn[:-3].isidentifier())
+    out: List[Tuple[str, str, bytes]] = []
+    i = 0
+    while len(out) < count and sources:
+        fn = sources[i % len(sources)]
+        with open(os.path.join(lib_dir, fn), 'rb') as f:
+            out.append((f'pkg{i // len(sources)}.{fn[:-3]}', fn, f.read()))
+        i += 1
+    return out
+
+
+def stdlib_code_objects(count: int) -> List[Tuple[str, bytes]]:
+    # 编译成 code 对象，模拟 PYZ 内的业务模块
+    return [(name, marshal.dumps(compile(source, fn, 'exec'))) for name, fn, source in stdlib_sources(count)]
+
+
+def build_pyz(modules: List[Tuple[str, bytes]]) -> bytes:
+    body = bytearray(b'PYZ\0' + importlib.util.MAGIC_NUMBER + b'\0' * 4)
+    toc = []
+    for name, code in modules:
+        data = zlib.compress(code)
+        toc.append((name, (0, len(body), len(data))))
+        body += data
+    struct.pack_into('!i', body, 8, len(body))
+    body += marshal.dumps(toc)
+    return bytes(body)
+
+
+def make_blob(size: int, ratio: float) -> bytes:
+    # ratio 为可压缩部分占比：随机字节不可压缩，零字节几乎完全可压缩
+    random_len = int(size * (1.0 - ratio))
+    return os.urandom(random_len) + b'\0' * (size - random_len)
+
+
+def build_carchive(path: str, modules: int, blobs: int, blob_size: int, ratio: float) -> int:
+    entries: List[Tuple[str, bytes, int, bytes]] = []  # (name, data, flag, typecode)
+    entries.append(('main', zlib.compress(marshal.dumps(compile('print(1)\n', 'main', 'exec'))), 1, b's'))
+    entries.append(('PYZ-00.pyz', build_pyz(stdlib_code_objects(modules)), 0, b'z'))
+    for i in range(blobs):
+        entries.append((f'lib/blob{i}.dylib', zlib.compress(make_blob(blob_size, ratio), 1), 1, b'b'))
+
+    stub = b'\x7fELF' + b'\0' * 4092  # 伪造的可执行文件头部
+    package = bytearray()
+    toc = bytearray()
+    for name, data, flag, typecode in entries:
+        ulen = len(zlib.decompress(data)) if flag else len(data)
+        raw_name = name.encode('utf-8') + b'\0'
+        raw_name += b'\0' * (-(len(raw_name) + struct.calcsize('!iIIIBc')) % 16)
+        entry_size = struct.calcsize('!iIIIBc') + len(raw_name)
+        toc += struct.pack('!iIIIBc', entry_size, len(package), len(data), ulen, flag, typecode) + raw_name
+        package += data
+
+    toc_pos = len(package)
+    package += toc
+    pyver = sys.version_info.major * 100 + sys.version_info.minor
+    length = len(package) + struct.calcsize('!8sIIii64s')
+    package += struct.pack('!8sIIii64s', COOKIE_MAGIC, length, toc_pos, len(toc), pyver, b'libpython.so')
+
+    with open(path, 'wb') as w:
+        w.write(stub)
+        w.write(package)
+    return len(stub) + len(package)
+
+
+def peak_rss_mb(rusage) -> float:
+    # Linux 上 ru_maxrss 单位是 KB，macOS 上是字节
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return rusage.ru_maxrss * scale / (1024 * 1024)
+
+
+def run_extractor(archive: str, extra_args: List[str]) -> Tuple[float, float]:
+    work = tempfile.mkdtemp(prefix='bench_extract_')
+    try:
+        # decompiled/ 下常残留 3.10 的 .pyc，不把脚本目录放进 sys.path 以免遮蔽标准库
+        env = dict(os.environ, PYTHONSAFEPATH='1')
+        # stderr 写临时文件而不是管道：wait4 期间没人读管道，输出写满缓冲区会让子进程卡住
+        with tempfile.TemporaryFile() as err:
+            start = time.perf_counter()
+            proc = subprocess.Popen([sys.executable, PYINSTXTRACTOR, archive] + extra_args,
+                                    cwd=work, env=env, stdout=subprocess.DEVNULL, stderr=err)
+            _, status, rusage = os.wait4(proc.pid, 0)
+            elapsed = time.perf_counter() - start
+            proc.returncode = os.waitstatus_to_exitcode(status)
+            if proc.returncode != 0:
+                err.seek(0)
+                raise RuntimeError(f'pyinstxtractor failed: {err.read().decode(errors="ignore")[:200]}')
+        return elapsed, peak_rss_mb(rusage)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Benchmark pyinstxtractor on a synthetic CArchive')
+    parser.add_argument('--modules', type=int, default=500, help='number of modules in the PYZ')
+    parser.add_argument('--blobs', type=int, default=8, help='number of binary entries')
+    parser.add_argument('--blob-mb', type=int, default=32, help='uncompressed size of each binary entry')
+    parser.add_argument('--ratio', type=float, default=0.5, help='compressible fraction of each binary entry')
+    parser.add_argument('--jobs', type=int, default=4, help='worker threads for the --jobs runs')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    work = tempfile.mkdtemp(prefix='bench_archive_')
+    try:
+        archive = os.path.join(work, 'bench.bin')
+        # 在子进程里生成样本，避免 fork 出的解包进程继承生成时的内存峰值
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            size = pool.submit(build_carchive, archive, args.modules, args.blobs,
+                               args.blob_mb * 1024 * 1024, args.ratio).result()
+        print(f'Archive: {size / (1024 * 1024):.1f} MB, modules={args.modules}, blobs={args.blobs}x{args.blob_mb}MB')
+
+        whole = ['--stream-threshold', '0']  # 整块解压，作为对照
+        modes = [
+            ('seek+read', whole),
+            ('mmap', ['--mmap'] + whole),
+            (f'jobs={args.jobs}', ['--jobs', str(args.jobs)] + whole),
+            (f'mmap+jobs={args.jobs}', ['--mmap', '--jobs', str(args.jobs)] + whole),
+            ('stream', ['--stream-threshold', '1']),
+            ('mmap+stream', ['--mmap', '--stream-threshold', '1']),
+        ]
+        for label, extra in modes:
+            best_time = best_rss = float('inf')
+            for _ in range(args.repeat):
+                elapsed, rss = run_extractor(archive, extra)
+                best_time = min(best_time, elapsed)
+                best_rss = min(best_rss, rss)
+            print(f'{label:>14}: {best_time:.3f}s, {size / (1024 * 1024) / best_time:.1f} MB/s, peak RSS {best_rss:.1f} MB')
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,279 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import subprocess
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from bench_extract import PYINSTXTRACTOR, build_carchive, build_pyz, peak_rss_mb, stdlib_code_objects, stdlib_sources
+from decompile_cache import tool_version
+from pycdc_runner import PYCDC
+
+
+RUNTIME_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINE_PATH = os.path.join(RUNTIME_DIR, 'bench_baseline.json')
+BASELINE_VERSION = 1
+STAGES = ['extract', 'pyz_unpack', 'decompile', 'deps', 'pipeline']
+DEFAULT_TOLERANCE = 0.15  # 比基线慢（或内存高）超过该比例视为退化
+DEFAULT_JOBS = 4  # 固定的默认并发：并发数属于样本参数，随 CPU 数变化的默认值会让提交的基线无法比较
+TOOL_STAGES = ['decompile', 'pipeline']  # 耗时取决于装了哪些反编译器
+
+
+class StageResult(NamedTuple):
+    seconds: float
+    mb_per_s: float
+    files_per_s: float
+    peak_rss_mb: float
+
+
+class Fixture(NamedTuple):
+    root: str
+    archive: str
+    pyz: str
+    src: str  # 与 PYZ 同一批模块的源码树，供依赖收集阶段使用
+    main_py: str  # 导入全部模块的入口脚本
+    archive_bytes: int
+    pyz_bytes: int
+    src_bytes: int
+    modules: int
+    entries: int  # CArchive 条目数（入口脚本 + PYZ + 二进制）
+
+
+def build_fixture(root: str, modules: int, blobs: int, blob_size: int, ratio: float) -> Fixture:
+    # CArchive 与单独的 PYZ 用同一批标准库模块生成，各阶段的输入一致
+    archive = os.path.join(root, 'bench.bin')
+    pyz = os.path.join(root, 'bench.pyz')
+    archive_bytes = build_carchive(archive, modules, blobs, blob_size, ratio)
+    with open(pyz, 'wb') as w:
+        w.write(build_pyz(stdlib_code_objects(modules)))
+
+    src = os.path.join(root, 'deps_src')
+    names = []
+    src_bytes = 0
+    for name, _, source in stdlib_sources(modules):
+        package, module = name.split('.')
+        path = os.path.join(src, package, module + '.py')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        open(os.path.join(src, package, '__init__.py'), 'a').close()
+        with open(path, 'wb') as w:
+            w.write(source)
+        names.append(name)
+        src_bytes += len(source)
+    main_py = os.path.join(root, 'main.py')
+    with open(main_py, 'w', encoding='utf-8') as w:
+        w.write(''.join(f'import {name}\n' for name in names))
+    return Fixture(root, archive, pyz, src, main_py, archive_bytes, os.path.getsize(pyz), src_bytes,
+                   modules, blobs + 2)
+
+
+def decompiler_versions() -> Dict[str, Optional[str]]:
+    # 与 decompile_pyc_batch / decompile_pipeline 实际使用的反编译器一致
+    return {'decompyle3': tool_version('decompyle3'), 'uncompyle6': tool_version('uncompyle6'),
+            'pycdc': tool_version('pycdc', PYCDC)}
+
+
+def run_stage(args: List[str], cwd: str, env: Optional[Dict[str, str]] = None) -> Tuple[float, float]:
+    # 返回 (耗时, 峰值 RSS)；每个阶段在独立子进程中运行，RSS 互不干扰
+    # stderr 写临时文件而不是管道，输出再多也不会阻塞子进程
+    with tempfile.TemporaryFile() as err:
+        start = time.perf_counter()
+        proc = subprocess.Popen(args, cwd=cwd, env=env, stdout=subprocess.DEVNULL, stderr=err)
+        _, status, rusage = os.wait4(proc.pid, 0)
+        elapsed = time.perf_counter() - start
+        if os.waitstatus_to_exitcode(status) != 0:
+            err.seek(0)
+            raise RuntimeError(f'{os.path.basename(args[1])} failed: {err.read().decode(errors="ignore")[-300:]}')
+    return elapsed, peak_rss_mb(rusage)
+
+
+def _script(name: str) -> str:
+    return os.path.join(RUNTIME_DIR, name)
+
+
+def _tree_bytes(root: str, suffix: str) -> Tuple[int, int]:
+    size = count = 0
+    for base, _, files in os.walk(root):
+        for fn in files:
+            if fn.endswith(suffix):
+                size += os.path.getsize(os.path.join(base, fn))
+                count += 1
+    return size, count
+
+
+def stage_commands(fx: Fixture, jobs: int) -> Dict[str, Callable[[], Tuple[List[str], str, Optional[Dict[str, str]], int, int]]]:
+    """Map each stage to a callable returning ``(argv, cwd, env, input bytes, files)``.
+
+    Callables run right before their stage, so later stages can size their
+    input from the outputs of earlier ones and every run starts from a clean
+    output directory.
+    """
+    def fresh(name: str) -> str:
+        path = os.path.join(fx.root, name)
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path)
+        return path
+
+    def extract():
+        # decompiled/ 下常残留 3.10 的 .pyc，不把脚本目录放进 sys.path 以免遮蔽标准库
+        env = dict(os.environ, PYTHONSAFEPATH='1')
+        return ([sys.executable, PYINSTXTRACTOR, fx.archive, '--jobs', str(jobs)], fresh('extract'), env,
+                fx.archive_bytes, fx.entries + fx.modules)
+
+    def pyz_unpack():
+        out = fresh('pyc')
+        return [sys.executable, _script('extract_pyz.py'), fx.pyz, out], fx.root, None, fx.pyz_bytes, fx.modules
+
+    def decompile():
+        pyc_root = os.path.join(fx.root, 'pyc')
+        if not os.path.isdir(pyc_root):
+            run_stage(*pyz_unpack()[:3])
+        size, count = _tree_bytes(pyc_root, '.pyc')
+        return ([sys.executable, _script('decompile_pyc_batch.py'), pyc_root, fresh('src'), '--jobs', str(jobs),
+                 '--no-cache', '--ledger', os.path.join(fresh('ledger'), 'jobs.db')], fx.root, None, size, count)
+
+    def deps():
+        # collect_main_deps：从入口脚本递归解析导入、同步模块文件并更新导入图
+        db = os.path.join(fresh('graph'), 'graph.db')
+        return ([sys.executable, _script('collect_main_deps.py'), '--main-py', fx.main_py, '--src', fx.src,
+                 '--out', fresh('deps'), '--db', db, '--jobs', str(jobs)], fx.root, None, fx.src_bytes, fx.modules)
+
+    def pipeline():
+        ledger = os.path.join(fresh('pipeline_ledger'), 'jobs.db')
+        return ([sys.executable, _script('decompile_pipeline.py'), fx.pyz, '--pyc-root', fresh('pipeline_pyc'),
+                 '--out', fresh('pipeline_src'), '--jobs', str(jobs), '--no-cache', '--ledger', ledger,
+                 '--report', os.path.join(fx.root, 'pipeline_audit.txt')], fx.root, None, fx.pyz_bytes, fx.modules)
+
+    return {'extract': extract, 'pyz_unpack': pyz_unpack, 'decompile': decompile, 'deps': deps, 'pipeline': pipeline}
+
+
+def measure(fx: Fixture, stages: List[str], jobs: int, repeat: int) -> Dict[str, StageResult]:
+    commands = stage_commands(fx, jobs)
+    results: Dict[str, StageResult] = {}
+    for stage in stages:
+        best_time = best_rss = float('inf')
+        for _ in range(repeat):
+            args, cwd, env, size, files = commands[stage]()
+            elapsed, rss = run_stage(args, cwd, env)
+            best_time = min(best_time, elapsed)
+            best_rss = min(best_rss, rss)
+        results[stage] = StageResult(best_time, size / (1024 * 1024) / best_time, files / best_time, best_rss)
+    return results
+
+
+def load_baseline(path: str) -> Optional[dict]:
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return baseline if baseline.get('version') == BASELINE_VERSION else None
+
+
+def save_baseline(path: str, fixture: dict, results: Dict[str, StageResult]) -> None:
+    baseline = {
+        'version': BASELINE_VERSION,
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'decompilers': decompiler_versions(),
+        'fixture': fixture,
+        'stages': {stage: r._asdict() for stage, r in results.items()},
+    }
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as w:
+        json.dump(baseline, w, indent=2, sort_keys=True)
+        w.write('\n')
+    os.replace(tmp, path)
+
+
+def compare(baseline: dict, results: Dict[str, StageResult], tolerance: float) -> List[str]:
+    # 返回退化项；耗时和峰值内存都与基线比较，吞吐只作展示
+    regressions: List[str] = []
+    same_tools = baseline.get('decompilers') == decompiler_versions()
+    for stage, r in results.items():
+        base = baseline['stages'].get(stage)
+        if base is None:
+            print(f'{stage:>12}: no baseline')
+            continue
+        if stage in TOOL_STAGES and not same_tools:
+            print(f'{stage:>12}: baseline used other decompilers {baseline.get("decompilers")}, not comparing')
+            continue
+        dt = r.seconds / base['seconds'] - 1.0 if base['seconds'] else 0.0
+        dm = r.peak_rss_mb / base['peak_rss_mb'] - 1.0 if base['peak_rss_mb'] else 0.0
+        flags = []
+        if dt > tolerance:
+            flags.append('SLOWER')
+        if dm > tolerance:
+            flags.append('MORE MEMORY')
+        print(f'{stage:>12}: time {dt:+.1%} ({base["seconds"]:.3f}s -> {r.seconds:.3f}s), '
+              f'peak RSS {dm:+.1%} ({base["peak_rss_mb"]:.1f} -> {r.peak_rss_mb:.1f} MB) {" ".join(flags)}'.rstrip())
+        if flags:
+            regressions.append(stage)
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Benchmark extraction, PYZ unpacking, decompilation and dependency '
+                                                 'collection on synthetic PyInstaller archives')
+    parser.add_argument('--modules', type=int, default=200, help='number of modules in the PYZ')
+    parser.add_argument('--blobs', type=int, default=4, help='number of binary entries in the CArchive')
+    parser.add_argument('--blob-mb', type=int, default=8, help='uncompressed size of each binary entry')
+    parser.add_argument('--ratio', type=float, default=0.5, help='compressible fraction of each binary entry')
+    parser.add_argument('--stages', default=','.join(STAGES), help=f'comma separated subset of {",".join(STAGES)}')
+    parser.add_argument('--jobs', type=int, default=DEFAULT_JOBS)
+    parser.add_argument('--repeat', type=int, default=3, help='runs per stage, the best one is kept')
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--save-baseline', action='store_true', help='store these results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args()
+
+    stages = [s for s in args.stages.split(',') if s]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        parser.error(f'unknown stage(s): {", ".join(sorted(unknown))}')
+    fixture = {'modules': args.modules, 'blobs': args.blobs, 'blob_mb': args.blob_mb, 'ratio': args.ratio,
+               'jobs': args.jobs}
+
+    work = tempfile.mkdtemp(prefix='bench_suite_')
+    try:
+        # 在子进程里生成样本，避免被测进程继承生成时的内存峰值
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            fx = pool.submit(build_fixture, work, args.modules, args.blobs,
+                             args.blob_mb * 1024 * 1024, args.ratio).result()
+        print(f'Fixture: archive {fx.archive_bytes / (1024 * 1024):.1f} MB, PYZ {fx.pyz_bytes / (1024 * 1024):.1f} MB, '
+              f'modules={fx.modules}, blobs={args.blobs}x{args.blob_mb}MB, ratio={args.ratio}')
+        results = measure(fx, stages, args.jobs, args.repeat)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+    for stage, r in results.items():
+        print(f'{stage:>12}: {r.seconds:.3f}s, {r.mb_per_s:.1f} MB/s, {r.files_per_s:.0f} files/s, '
+              f'peak RSS {r.peak_rss_mb:.1f} MB')
+
+    if args.save_baseline:
+        save_baseline(args.baseline, fixture, results)
+        print(f'Baseline saved: {args.baseline}')
+        return
+    baseline = load_baseline(args.baseline)
+    if baseline is None:
+        print(f'No baseline at {args.baseline}; run with --save-baseline to create one')
+        return
+    if baseline['fixture'] != fixture:
+        print(f'Baseline was measured on a different fixture {baseline["fixture"]}, not comparing')
+        return
+    if (baseline['python'], baseline['machine']) != (platform.python_version(), platform.machine()):
+        # 基线与机器相关，换了环境应先用 --save-baseline 重新生成
+        print(f'Baseline was recorded with Python {baseline["python"]} on {baseline["machine"]}')
+    regressions = compare(baseline, results, args.tolerance)
+    if regressions:
+        print(f'Regressions beyond {args.tolerance:.0%}: {", ".join(regressions)}')
+        sys.exit(1)
+    print('No regressions')
+
+
+if __name__ == '__main__':
+    main()
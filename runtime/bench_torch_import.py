@@ -0,0 +1,63 @@
+import os
+import sys
+import argparse
+from typing import Dict, List, Optional, Tuple
+
+from bench_suite import run_stage
+
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+# 每个场景在全新解释器中执行，测到的是含解释器启动的总耗时，展示时减去 baseline
+SCENARIOS: Dict[str, str] = {
+    'baseline': 'pass',
+    'eager': 'import torch',
+    'stub': 'import torch_stub',
+    'lazy': 'import torch_lazy; torch_lazy.install(); import torch',
+    'lazy+use': 'import torch_lazy; torch_lazy.install(); import torch; torch.__version__',
+}
+
+
+def measure(code: str, repeat: int, env: Dict[str, str]) -> Optional[Tuple[float, float]]:
+    # 返回多次运行中最快的 (耗时, 峰值 RSS)；脚本失败（如未安装 torch）返回 None
+    best: Optional[Tuple[float, float]] = None
+    for _ in range(repeat):
+        try:
+            elapsed, rss = run_stage([sys.executable, '-c', code], REPO_ROOT, env)
+        except RuntimeError:
+            return None
+        if best is None or elapsed < best[0]:
+            best = (elapsed, rss)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Compare startup cost of importing torch eagerly, through the stub '
+                                                 'and through the lazy proxy')
+    parser.add_argument('--repeat', type=int, default=5, help='runs per scenario, the fastest one is kept')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help=f'comma separated subset of {",".join(SCENARIOS)}')
+    parser.add_argument('--torch-path', help='directory containing the torch package to test (prepended to PYTHONPATH)')
+    args = parser.parse_args()
+
+    names: List[str] = [s for s in args.scenarios.split(',') if s]
+    unknown = set(names) - set(SCENARIOS)
+    if unknown:
+        parser.error(f'unknown scenario(s): {", ".join(sorted(unknown))}')
+    if 'baseline' not in names:
+        names.insert(0, 'baseline')
+
+    paths = [REPO_ROOT] + ([args.torch_path] if args.torch_path else [])
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(paths + [os.environ.get('PYTHONPATH', '')]).rstrip(os.pathsep))
+    results = {name: measure(SCENARIOS[name], args.repeat, env) for name in names}
+
+    base = results['baseline']
+    for name in names:
+        r = results[name]
+        if r is None:
+            print(f'{name:>10}: failed (torch not importable?)')
+            continue
+        print(f'{name:>10}: {r[0]:.3f}s total, +{max(0.0, r[0] - base[0]):.3f}s over baseline, '
+              f'peak RSS {r[1]:.1f} MB')
+
+
+if __name__ == '__main__':
+    main()
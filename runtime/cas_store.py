@@ -0,0 +1,170 @@
+import os
+import sys
+import errno
+import shutil
+import hashlib
+import tempfile
+from typing import Optional, Tuple
+
+
+class ContentStore:
+    """Content-addressed object store shared by extraction runs.
+
+    Every output file is stored once under ``objects/<sha256[:2]>/<sha256>``
+    and extraction trees are materialized as hardlinks to those objects, so a
+    new app version only costs disk space and writes for the files that
+    changed. Objects are read-only: a file inside a materialized tree must be
+    replaced, never modified in place.
+    """
+
+    SPOOL_LIMIT = 8 * 1024 * 1024  # 小于该大小的输出在内存中算完哈希再决定是否落盘
+
+    def __init__(self, root: str) -> None:
+        self.root = os.path.abspath(root)
+        self.objects_dir = os.path.join(self.root, 'objects')
+        self.aliases_dir = os.path.join(self.root, 'aliases')
+        self.tmp_dir = os.path.join(self.root, 'tmp')
+        for d in (self.objects_dir, self.aliases_dir, self.tmp_dir):
+            os.makedirs(d, exist_ok=True)
+
+    def object_path(self, digest: str) -> str:
+        return os.path.join(self.objects_dir, digest[:2], digest)
+
+    def has(self, digest: str) -> bool:
+        return os.path.exists(self.object_path(digest))
+
+    def writer(self, dest: str) -> '_StoreWriter':
+        return _StoreWriter(self, dest)
+
+    def put(self, data, dest: str) -> str:
+        with self.writer(dest) as w:
+            w.write(data)
+        return w.digest
+
+    def link(self, digest: str, dest: str) -> bool:
+        obj = self.object_path(digest)
+        if not os.path.exists(obj):
+            return False
+        try:
+            os.remove(dest)
+        except FileNotFoundError:
+            pass
+        try:
+            os.link(obj, dest)
+        except OSError as e:
+            # 跨设备或文件系统不支持硬链接时退化为复制
+            if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP):
+                raise
+            shutil.copyfile(obj, dest)
+        return True
+
+    def _alias_path(self, key: str) -> str:
+        return os.path.join(self.aliases_dir, key[:2], key)
+
+    def alias_get(self, key: str) -> Optional[str]:
+        # 别名把"输入侧"的键（如压缩数据的哈希）映射到对象摘要，命中时连解压都可省掉
+        try:
+            with open(self._alias_path(key), 'r', encoding='ascii') as f:
+                digest = f.read().strip()
+        except OSError:
+            return None
+        return digest if self.has(digest) else None
+
+    def alias_set(self, key: str, digest: str) -> None:
+        path = self._alias_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.tmp_dir)
+        with os.fdopen(fd, 'w', encoding='ascii') as w:
+            w.write(digest)
+        os.replace(tmp, path)
+
+    def _commit(self, digest: str, data: Optional[bytes], tmp_path: Optional[str]) -> None:
+        obj = self.object_path(digest)
+        if os.path.exists(obj):
+            if tmp_path:
+                os.remove(tmp_path)
+            return
+        if tmp_path is None:
+            fd, tmp_path = tempfile.mkstemp(dir=self.tmp_dir)
+            with os.fdopen(fd, 'wb') as w:
+                w.write(data)
+        os.chmod(tmp_path, 0o444)
+        os.makedirs(os.path.dirname(obj), exist_ok=True)
+        # 并发写入同一对象时 rename 是原子的，后到者覆盖为相同内容
+        os.replace(tmp_path, obj)
+
+    def stats(self) -> Tuple[int, int, int]:
+        objects = size = unreferenced = 0
+        for base, _, files in os.walk(self.objects_dir):
+            for fn in files:
+                st = os.stat(os.path.join(base, fn))
+                objects += 1
+                size += st.st_size
+                if st.st_nlink <= 1:
+                    unreferenced += 1
+        return objects, size, unreferenced
+
+    def prune(self) -> int:
+        # 链接数为 1 说明已没有任何解包目录引用该对象
+        removed = 0
+        for base, _, files in os.walk(self.objects_dir):
+            for fn in files:
+                path = os.path.join(base, fn)
+                if os.stat(path).st_nlink <= 1:
+                    os.remove(path)
+                    removed += 1
+        return removed
+
+
+class _StoreWriter:
+    def __init__(self, store: ContentStore, dest: str) -> None:
+        self.store = store
+        self.dest = dest
+        self.hasher = hashlib.sha256()
+        self.buffer = bytearray()
+        self.spill = None
+        self.digest = ''
+
+    def write(self, data) -> None:
+        self.hasher.update(data)
+        if self.spill is not None:
+            self.spill.write(data)
+            return
+        self.buffer += data
+        if len(self.buffer) > self.store.SPOOL_LIMIT:
+            self.spill = tempfile.NamedTemporaryFile(dir=self.store.tmp_dir, delete=False)
+            self.spill.write(self.buffer)
+            self.buffer = bytearray()
+
+    def __enter__(self) -> '_StoreWriter':
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        tmp_path = None
+        if self.spill is not None:
+            self.spill.close()
+            tmp_path = self.spill.name
+        if exc_type is not None:
+            if tmp_path:
+                os.remove(tmp_path)
+            return
+        self.digest = self.hasher.hexdigest()
+        self.store._commit(self.digest, bytes(self.buffer), tmp_path)
+        self.store.link(self.digest, self.dest)
+
+
+def main() -> None:
+    if len(sys.argv) < 3 or sys.argv[1] not in ('stats', 'prune'):
+        print('Usage: cas_store.py stats|prune <store_dir>')
+        sys.exit(1)
+
+    store = ContentStore(sys.argv[2])
+    if sys.argv[1] == 'prune':
+        print(f'Pruned {store.prune()} unreferenced objects from {store.root}')
+        return
+    objects, size, unreferenced = store.stats()
+    print(f'Objects: {objects}, size: {size / (1024 * 1024):.1f} MB, unreferenced: {unreferenced}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,218 @@
+import io
+import os
+import sys
+import zlib
+import fnmatch
+import hashlib
+import argparse
+import contextlib
+from collections import Counter
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import instrument
+import pyz_crypto
+from decompile_pipeline import load_pyinstxtractor
+from extract_pyz import PyzArchive
+
+
+CHANNELS = ['baishi', 'huobao', 'mengchuang', 'xingji', 'yunbao', 'xct']
+CARCHIVE = 'carchive'  # CArchive 条目的分区名；PYZ 成员以所在 PYZ 条目名为分区
+LIST_PATH = '/tmp/百世_changed_modules.txt'
+
+Key = Tuple[str, str]  # (分区, 条目名或模块名)
+
+
+class DiffRow(NamedTuple):
+    section: str
+    name: str
+    status: str  # identical / changed / channel-only
+    groups: List[str]  # 每个渠道的版本标记：内容相同的渠道字母相同，缺失为 '-'
+
+
+def _digest(data) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class ChannelBuild:
+    """One channel executable, read through a memory map and never extracted.
+
+    ``scan`` hashes the compressed bytes of every CArchive entry and PYZ
+    member in place; only a PYZ stored compressed inside the CArchive is
+    inflated to reach its TOC. Encrypted members are hashed after
+    decryption, since every build encrypts with a fresh IV.
+    """
+
+    def __init__(self, channel: str, path: str, key: Optional[bytes] = None) -> None:
+        self.channel = channel
+        self.path = path
+        self.key = key
+        self.digests: Dict[Key, str] = {}
+        self._entries = {}
+        self._pyz: Dict[str, PyzArchive] = {}
+        self._arch = load_pyinstxtractor().PyInstArchive(path, useMmap=True)
+        log = io.StringIO()
+        with contextlib.redirect_stdout(log):
+            ok = self._arch.open() and self._arch.checkFile() and self._arch.getCArchiveInfo()
+            if ok:
+                self._arch.parseTOC()
+        if not ok:
+            self._arch.close()
+            raise RuntimeError(f'Not a PyInstaller archive: {path}\n{log.getvalue().strip()}')
+        self._entries = {entry.name: entry for entry in self._arch.tocList}
+
+    def close(self) -> None:
+        # 先释放指向映射的切片，映射才能关闭
+        self._pyz.clear()
+        self._arch.close()
+
+    def __enter__(self) -> 'ChannelBuild':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _read_entry(self, name: str):
+        entry = self._entries[name]
+        return self._arch._readAt(entry.position, entry.cmprsdDataSize)
+
+    def _open_pyz(self, name: str) -> PyzArchive:
+        if name not in self._pyz:
+            data = self._read_entry(name)
+            if self._entries[name].cmprsFlag == 1:
+                data = zlib.decompress(data)
+            pyz = PyzArchive(name, data=data, use_index=False)
+            key = self.key
+            key_module = self._arch._readCryptoKeyModule()
+            try:
+                if key is None and key_module is not None:
+                    key = pyz_crypto.key_from_marshal(key_module, pyz.pyc_magic)
+                if key is not None:
+                    pyz.load_key(key)
+            except (ValueError, RuntimeError) as e:
+                # 解不开时按密文比较，所有成员都会显示为 changed
+                print(f'[!] {self.channel}: cannot decrypt {name}: {e}', file=sys.stderr)
+            self._pyz[name] = pyz
+        return self._pyz[name]
+
+    def scan(self, pattern: str = '*') -> Dict[Key, str]:
+        with instrument.span('toc_scan', self.path) as attrs:
+            bytes_read = 0
+            for name, entry in self._entries.items():
+                if fnmatch.fnmatchcase(name, pattern):
+                    self.digests[(CARCHIVE, name)] = _digest(self._read_entry(name))
+                    bytes_read += entry.cmprsdDataSize
+                if entry.typeCmprsData not in (b'z', b'Z'):
+                    continue
+                pyz = self._open_pyz(name)
+                for module in pyz.match(pattern):
+                    raw = pyz.read_raw(module)
+                    if pyz.cipher is not None:
+                        raw = pyz.cipher.decrypt(raw)
+                    self.digests[(name, module)] = _digest(raw)
+                    bytes_read += len(raw)
+            attrs['bytes_read'] = bytes_read
+        return self.digests
+
+    def inflated_digest(self, key: Key) -> str:
+        # 压缩结果随 zlib 版本与压缩级别变化：压缩数据不同时再比一次解压后的内容
+        section, name = key
+        if section != CARCHIVE:
+            try:
+                return _digest(self._open_pyz(section).read(name))
+            except zlib.error:
+                return self.digests[key]  # 无法解密的成员只能比较密文
+        data = self._read_entry(name)
+        return _digest(zlib.decompress(data) if self._entries[name].cmprsFlag == 1 else data)
+
+
+def diff(builds: List[ChannelBuild], verify: bool = True) -> List[DiffRow]:
+    """Compare the scanned builds member by member, in channel order."""
+    rows: List[DiffRow] = []
+    for key in sorted(set().union(*(b.digests for b in builds))):
+        digests = [b.digests.get(key) for b in builds]
+        if verify and len({d for d in digests if d is not None}) > 1:
+            digests = [b.inflated_digest(key) if d is not None else None for b, d in zip(builds, digests)]
+        letters: Dict[str, str] = {}
+        groups = []
+        for d in digests:
+            if d is None:
+                groups.append('-')
+                continue
+            if d not in letters:
+                letters[d] = chr(ord('A') + len(letters)) if len(letters) < 26 else '*'
+            groups.append(letters[d])
+        if len(letters) > 1:
+            status = 'changed'
+        else:
+            status = 'channel-only' if None in digests else 'identical'
+        rows.append(DiffRow(key[0], key[1], status, groups))
+    return rows
+
+
+def print_matrix(rows: List[DiffRow], channels: List[str], show: List[str]) -> None:
+    shown = [r for r in rows if r.status in show]
+    width = max([len(r.name) for r in shown] + [len('module')])
+    section_width = max([len(r.section) for r in shown] + [len('where')])
+    print(f'{"module":<{width}}  {"where":<{section_width}}  {"status":<12}  ' + '  '.join(channels))
+    for r in shown:
+        print(f'{r.name:<{width}}  {r.section:<{section_width}}  {r.status:<12}  '
+              + '  '.join(f'{g:<{len(c)}}' for g, c in zip(r.groups, channels)).rstrip())
+
+
+def parse_build(spec: str) -> Tuple[str, str]:
+    # 接受 名称=路径，或直接给路径（以文件名作渠道名）
+    if '=' in spec and not os.path.exists(spec):
+        name, path = spec.split('=', 1)
+        return name, path
+    return os.path.splitext(os.path.basename(spec.rstrip(os.sep)))[0], spec
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Diff the modules of several channel builds from their CArchive and '
+                                                 'PYZ TOCs, without extracting them')
+    parser.add_argument('builds', nargs='+',
+                        help=f'executables as NAME=PATH or PATH, e.g. {CHANNELS[0]}=dist/{CHANNELS[0]}')
+    parser.add_argument('--match', default='*', help='only compare entries and modules matching this glob, e.g. "api.*"')
+    parser.add_argument('--show', default='changed,channel-only',
+                        help='statuses to list, comma separated: identical, changed, channel-only')
+    parser.add_argument('--no-verify', action='store_true',
+                        help='trust compressed hashes, do not inflate differing members to rule out recompression')
+    parser.add_argument('--key', help='AES key of encrypted PYZ archives (default: read pyimod00_crypto_key)')
+    parser.add_argument('--list', default=LIST_PATH, help='write the changed and channel-only PYZ modules here')
+    args = parser.parse_args()
+
+    specs = [parse_build(spec) for spec in args.builds]
+    channels = [name for name, _ in specs]
+    if len(set(channels)) != len(channels):
+        parser.error('channel names must be unique, use NAME=PATH')
+    key = args.key.encode('utf-8') if args.key else None
+
+    builds: List[ChannelBuild] = []
+    try:
+        for name, path in specs:
+            try:
+                build = ChannelBuild(name, path, key)
+            except (OSError, RuntimeError) as e:
+                print(f'[!] {name}: {e}', file=sys.stderr)
+                sys.exit(1)
+            builds.append(build)
+            print(f'{name}: {len(build.scan(args.match))} entries and modules hashed ({path})')
+
+        with instrument.span('toc_diff'):
+            rows = diff(builds, not args.no_verify)
+    finally:
+        for build in builds:
+            build.close()
+
+    print_matrix(rows, channels, [s.strip() for s in args.show.split(',') if s.strip()])
+    counts = Counter(r.status for r in rows)
+    print(f'Identical: {counts["identical"]}, Changed: {counts["changed"]}, Channel-only: {counts["channel-only"]}')
+    # 只有 PYZ 中的模块需要反编译；CArchive 条目（.so、资源）的差异只在矩阵中列出
+    modules = sorted({r.name for r in rows if r.status != 'identical' and r.section != CARCHIVE})
+    with open(args.list, 'w', encoding='utf-8') as w:
+        w.write(''.join(f'{m}\n' for m in modules))
+    print(f'Modules to decompile: {len(modules)} -> {args.list}')
+
+
+if __name__ == '__main__':
+    main()
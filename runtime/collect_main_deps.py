@@ -1,16 +1,24 @@
 import os
 import sys
 import ast
+import json
 import shutil
-import subprocess
-from typing import Set, List, Tuple, Optional, Deque
-from collections import deque
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Set, List, Tuple, Optional
+
+from decompile_cache import default_cache
+import instrument
+from import_graph import GRAPH_DB, ImportGraph
+from pycdc_runner import run_pycdc
 
 
 PYC_MAIN = '/tmp/百世_extracted/main.pyc'
 SRC_TREE = '/tmp/百世_src'
 OUT_ROOT = '/tmp/百世_main'
 PYCDC = '/tmp/pycdc/build/pycdc'
+STATE_NAME = '.collect_state.json'
+STATE_VERSION = 1
 
 
 def ensure_dir(path: str) -> None:
@@ -19,8 +27,8 @@ def ensure_dir(path: str) -> None:
 
 def decompile_main(pyc_path: str, out_py: str) -> None:
     ensure_dir(os.path.dirname(out_py))
-    res = subprocess.run([PYCDC, pyc_path], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    if res.returncode != 0 or not res.stdout:
+    res = run_pycdc(pyc_path, pycdc=PYCDC, cache=default_cache())
+    if not res.ok:
         raise RuntimeError(f'pycdc failed: {res.stderr.decode(errors="ignore")[:200]}')
     with open(out_py, 'wb') as w:
         w.write(res.stdout)
@@ -45,93 +53,238 @@ def parse_imports(py_path: str) -> Set[str]:
     return modules
 
 
-def resolve_module_paths(module: str, src_root: str) -> Tuple[Optional[str], Optional[str]]:
-    # 返回 (模块文件路径, 包目录路径)
-    rel_file = module.replace('.', '/') + '.py'
-    rel_pkg = module.replace('.', '/')
-    src_file = os.path.join(src_root, rel_file)
-    src_pkg = os.path.join(src_root, rel_pkg)
-    return (src_file if os.path.isfile(src_file) else None,
-            src_pkg if os.path.isdir(src_pkg) else None)
-
-
-def copy_module(module: str, src_root: str, out_root: str, copied: Set[str]) -> Tuple[bool, List[str]]:
-    if module in copied:
-        return True, []
-    src_file, src_pkg = resolve_module_paths(module, src_root)
-    collected_files: List[str] = []
-
-    if src_file:
-        rel_file = module.replace('.', '/') + '.py'
-        dst_file = os.path.join(out_root, rel_file)
-        ensure_dir(os.path.dirname(dst_file))
-        shutil.copy2(src_file, dst_file)
-        collected_files.append(dst_file)
-        copied.add(module)
-        return True, collected_files
-    if src_pkg:
-        rel_pkg = module.replace('.', '/')
-        dst_pkg = os.path.join(out_root, rel_pkg)
-        ensure_dir(os.path.dirname(dst_pkg))
-        if os.path.exists(dst_pkg):
-            shutil.rmtree(dst_pkg)
-        shutil.copytree(src_pkg, dst_pkg)
-        # 尝试加入 __init__.py 作为后续解析入口
-        init_py = os.path.join(dst_pkg, '__init__.py')
-        if os.path.isfile(init_py):
-            collected_files.append(init_py)
-        copied.add(module)
-        return True, collected_files
-    return False, []
+def _parse_task(py_path: str) -> Optional[List[str]]:
+    # worker 中解析，语法错误的文件与原先一样跳过
+    try:
+        return sorted(parse_imports(py_path))
+    except Exception:
+        return None
+
+
+class ModuleIndex:
+    """Module name -> source path lookup built from a single walk of the tree."""
+
+    def __init__(self, src_root: str) -> None:
+        self.files: Dict[str, str] = {}
+        self.packages: Dict[str, str] = {}
+        for base, _, files in os.walk(src_root):
+            rel = os.path.relpath(base, src_root)
+            prefix = '' if rel == '.' else rel.replace(os.sep, '.')
+            if prefix:
+                self.packages[prefix] = base
+            for fn in files:
+                if fn.endswith('.py'):
+                    name = fn[:-3]
+                    self.files[f'{prefix}.{name}' if prefix else name] = os.path.join(base, fn)
+
+    def resolve(self, module: str) -> Tuple[Optional[str], Optional[str]]:
+        # 返回 (模块文件路径, 包目录路径)
+        return self.files.get(module), self.packages.get(module)
+
+
+def sync_file(src: str, dst: str, link: bool = True) -> bool:
+    # 目标已是同一 inode，或大小与 mtime 都一致时跳过；返回是否实际写入
+    st = os.stat(src)
+    try:
+        dst_st = os.stat(dst)
+    except FileNotFoundError:
+        dst_st = None
+    if dst_st is not None:
+        if (dst_st.st_ino, dst_st.st_dev) == (st.st_ino, st.st_dev) \
+                or (dst_st.st_size, dst_st.st_mtime_ns) == (st.st_size, st.st_mtime_ns):
+            return False
+        os.remove(dst)
+    ensure_dir(os.path.dirname(dst))
+    if link:
+        try:
+            os.link(src, dst)
+            return True
+        except OSError:
+            # 跨设备等情况退化为复制
+            pass
+    shutil.copy2(src, dst)
+    return True
+
+
+def sync_tree(src_dir: str, dst_dir: str, link: bool = True) -> Tuple[List[str], int]:
+    # 增量同步整个包目录，删除源中已不存在的文件；返回 (目标文件列表, 实际写入数)
+    outputs: List[str] = []
+    written = 0
+    for base, _, files in os.walk(src_dir):
+        for fn in files:
+            src = os.path.join(base, fn)
+            dst = os.path.join(dst_dir, os.path.relpath(src, src_dir))
+            written += sync_file(src, dst, link)
+            outputs.append(dst)
+    live = set(outputs)
+    for base, _, files in os.walk(dst_dir, topdown=False):
+        for fn in files:
+            path = os.path.join(base, fn)
+            if path not in live:
+                os.remove(path)
+        if not os.listdir(base) and not os.path.isdir(os.path.join(src_dir, os.path.relpath(base, dst_dir))):
+            os.rmdir(base)
+    return outputs, written
+
+
+class DependencyCollector:
+    def __init__(self, src_root: str, out_root: str, jobs: int = os.cpu_count() or 1, link: bool = True) -> None:
+        self.src_root = src_root
+        self.out_root = out_root
+        self.jobs = jobs
+        self.link = link
+        self.index = ModuleIndex(src_root)
+        self.copied: Set[str] = set()
+        self.outputs: Set[str] = set()
+        self.written = 0
+        self.state_path = os.path.join(out_root, STATE_NAME)
+        self.state = self._load_state()
+        self.parsed: Dict[str, list] = {}
+
+    def _load_state(self) -> dict:
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return state if state.get('version') == STATE_VERSION else {}
+
+    def save_state(self) -> int:
+        # 删除上次收集过、这次不再需要的输出，再记录本次结果
+        removed = 0
+        for path in set(self.state.get('outputs', [])) - self.outputs:
+            try:
+                os.remove(path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+        state = {'version': STATE_VERSION, 'parsed': self.parsed, 'outputs': sorted(self.outputs)}
+        tmp = self.state_path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as w:
+            json.dump(state, w, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp, self.state_path)
+        return removed
+
+    def parse_many(self, paths: List[str], pool: Optional[ProcessPoolExecutor]) -> Dict[str, Optional[List[str]]]:
+        # 大小与 mtime 未变的文件直接用上次的解析结果，其余在进程池中并行解析
+        previous = self.state.get('parsed', {})
+        results: Dict[str, Optional[List[str]]] = {}
+        todo: List[str] = []
+        for path in paths:
+            st = os.stat(path)
+            row = previous.get(path)
+            if row is not None and row[:2] == [st.st_size, st.st_mtime_ns]:
+                results[path] = row[2]
+                self.parsed[path] = row
+            else:
+                todo.append(path)
+        parsed = pool.map(_parse_task, todo, chunksize=16) if pool is not None and len(todo) > 1 \
+            else map(_parse_task, todo)
+        for path, mods in zip(todo, parsed):
+            st = os.stat(path)
+            results[path] = mods
+            self.parsed[path] = [st.st_size, st.st_mtime_ns, mods]
+        return results
+
+    def copy_module(self, module: str) -> Tuple[bool, List[str]]:
+        # 返回 (是否在源码树中找到, 需要继续解析的源文件)
+        if module in self.copied:
+            return True, []
+        src_file, src_pkg = self.index.resolve(module)
+        if src_file:
+            dst_file = os.path.join(self.out_root, module.replace('.', '/') + '.py')
+            self.written += sync_file(src_file, dst_file, self.link)
+            self.outputs.add(dst_file)
+            self.copied.add(module)
+            return True, [src_file]
+        if src_pkg:
+            dst_pkg = os.path.join(self.out_root, module.replace('.', '/'))
+            outputs, written = sync_tree(src_pkg, dst_pkg, self.link)
+            self.outputs.update(outputs)
+            self.written += written
+            self.copied.add(module)
+            # 尝试加入 __init__.py 作为后续解析入口
+            init_py = os.path.join(src_pkg, '__init__.py')
+            return True, [init_py] if os.path.isfile(init_py) else []
+        return False, []
+
+    def collect(self, entry: str) -> Tuple[Set[str], List[str]]:
+        # 按层并行解析：每一层的文件一起交给进程池，再按原先的顺序处理其导入
+        frontier: List[str] = [entry]
+        seen_files: Set[str] = set()
+        missing: List[str] = []
+        pool = ProcessPoolExecutor(self.jobs) if self.jobs > 1 else None
+        try:
+            while frontier:
+                frontier = [f for f in dict.fromkeys(frontier) if f not in seen_files]
+                seen_files.update(frontier)
+                parsed = self.parse_many(frontier, pool)
+                next_frontier: List[str] = []
+                for cur in frontier:
+                    mods = parsed[cur]
+                    if mods is None:
+                        continue
+                    for mod in mods:
+                        ok, new_files = self.copy_module(mod)
+                        if not ok:
+                            # 仅记录在源码树中不存在的模块；标准库与三方库可能无须复制
+                            missing.append(mod)
+                            continue
+                        next_frontier.extend(nf for nf in new_files if nf not in seen_files)
+                frontier = next_frontier
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        return seen_files, missing
 
 
 def main() -> None:
-    ensure_dir(OUT_ROOT)
-    main_py = os.path.join(OUT_ROOT, 'main.py')
-    decompile_main(PYC_MAIN, main_py)
+    parser = argparse.ArgumentParser(description='Collect the source modules reachable from main.py')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1, help='worker processes for parsing')
+    parser.add_argument('--copy', action='store_true', help='copy files instead of hardlinking them from SRC_TREE')
+    parser.add_argument('--pyc-main', default=PYC_MAIN, help='entry pyc, decompiled with pycdc')
+    parser.add_argument('--main-py', help='use this entry script instead of decompiling --pyc-main')
+    parser.add_argument('--src', default=SRC_TREE, help='decompiled source tree to collect from')
+    parser.add_argument('--out', default=OUT_ROOT)
+    parser.add_argument('--db', default=GRAPH_DB, help='import graph database to update')
+    args = parser.parse_args()
+
+    ensure_dir(args.out)
+    main_py = os.path.join(args.out, 'main.py')
+    if args.main_py:
+        sync_file(args.main_py, main_py, link=False)
+    else:
+        with instrument.span('decompile_main', args.pyc_main):
+            decompile_main(args.pyc_main, main_py)
 
     # 递归解析：从 main.py 出发，逐层收集依赖
-    to_visit_files: Deque[str] = deque([main_py])
-    seen_files: Set[str] = set()
-    copied: Set[str] = set()
-    missing: List[str] = []
-
-    while to_visit_files:
-        cur = to_visit_files.popleft()
-        if cur in seen_files:
-            continue
-        seen_files.add(cur)
-        try:
-            mods = parse_imports(cur)
-        except Exception:
-            continue
-
-        for mod in sorted(mods):
-            ok, new_files = copy_module(mod, SRC_TREE, OUT_ROOT, copied)
-            if not ok:
-                # 仅记录在源码树中不存在的模块；标准库与三方库可能无须复制
-                src_file, src_pkg = resolve_module_paths(mod, SRC_TREE)
-                if not src_file and not src_pkg:
-                    missing.append(mod)
-                continue
-            for nf in new_files:
-                if nf not in seen_files:
-                    to_visit_files.append(nf)
+    collector = DependencyCollector(args.src, args.out, args.jobs, link=not args.copy)
+    collector.outputs.add(main_py)
+    with instrument.span('collect') as attrs:
+        seen_files, missing = collector.collect(main_py)
+        attrs['files'] = len(seen_files)
+    copied = collector.copied
+    removed = collector.save_state()
+
+    # 同步更新持久化的导入图，供 import_graph.py 做反向依赖/可达性查询
+    with ImportGraph(args.db) as graph, instrument.span('import_graph'):
+        graph.update(args.src, {'main': main_py}, args.jobs)
+        unreachable = graph.unreachable('main')
 
     # write a summary
-    with open(os.path.join(OUT_ROOT, '_DEPENDENCY_SUMMARY.txt'), 'w', encoding='utf-8') as w:
+    with open(os.path.join(args.out, '_DEPENDENCY_SUMMARY.txt'), 'w', encoding='utf-8') as w:
         w.write('Collected modules from main.py imports (recursive)\n')
         w.write(f'Files scanned: {len(seen_files)}\n')
         w.write(f'Copied modules/packages: {len(copied)}\n')
+        w.write(f'Unreachable from main (import graph {args.db}): {len(unreachable)}\n')
         if missing:
             w.write('Missing (not found in extracted src tree):\n')
             for m in missing:
                 w.write(f'- {m}\n')
 
-    print(f'Done. OUT={OUT_ROOT}, copied={len(copied)}, missing={len(missing)}, scanned_files={len(seen_files)}')
+    print(f'Done. OUT={args.out}, copied={len(copied)}, missing={len(missing)}, scanned_files={len(seen_files)}')
+    print(f'Sync: {collector.written} file(s) written, {removed} stale output(s) removed')
 
 
 if __name__ == '__main__':
     main()
-
-
@@ -0,0 +1,208 @@
+import os
+import sys
+import json
+import shutil
+import hashlib
+import tempfile
+import functools
+import importlib.metadata
+from typing import Callable, Dict, NamedTuple, Optional, Tuple
+
+
+DEFAULT_ROOT = os.environ.get('DECOMPILE_CACHE_DIR', '/tmp/decompile_cache')
+DEFAULT_MAX_MB = int(os.environ.get('DECOMPILE_CACHE_MB', '512'))
+ENTRY_SUFFIX = '.entry'
+
+
+class CachedResult(NamedTuple):
+    ok: bool
+    output: bytes
+    stderr: bytes
+
+
+@functools.lru_cache(maxsize=None)
+def tool_version(name: str, executable: Optional[str] = None) -> Optional[str]:
+    """Identify a decompiler build for use in cache keys.
+
+    Python packages are identified by their installed version; native tools
+    such as pycdc (which has no ``--version``) by the size and mtime of their
+    binary, so rebuilding the tool invalidates its entries. Returns None when
+    the tool can't be found, which disables caching for it.
+    """
+    if executable is None:
+        try:
+            return f'{name}=={importlib.metadata.version(name)}'
+        except importlib.metadata.PackageNotFoundError:
+            executable = shutil.which(name)
+    if executable is None:
+        return None
+    try:
+        st = os.stat(executable)
+    except OSError:
+        return None
+    return f'{name}@{st.st_size}-{st.st_mtime_ns}'
+
+
+class DecompileCache:
+    """On-disk cache of decompiler results keyed by pyc content and decompiler.
+
+    An entry holds the produced source, or the failure and its stderr, for one
+    (sha256 of the pyc bytes, decompiler id) pair, so unchanged bytecode is
+    never decompiled twice, even across app versions. Entries are single files
+    written atomically, which makes the cache safe to share between worker
+    processes. A hit refreshes the entry's mtime and ``evict`` removes the
+    least recently used entries once the cache exceeds ``max_bytes``.
+    """
+
+    def __init__(self, root: str = DEFAULT_ROOT, max_bytes: int = DEFAULT_MAX_MB * 1024 * 1024) -> None:
+        self.root = os.path.abspath(root)
+        self.max_bytes = max_bytes
+        self.tmp_dir = os.path.join(self.root, 'tmp')
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+        self._digests: Dict[Tuple[str, int, int], str] = {}
+
+    def pyc_digest(self, pyc_path: str) -> str:
+        # 同一进程内按 (路径, 大小, mtime) 记住哈希，避免重复读取
+        st = os.stat(pyc_path)
+        memo_key = (os.path.abspath(pyc_path), st.st_size, st.st_mtime_ns)
+        digest = self._digests.get(memo_key)
+        if digest is None:
+            with open(pyc_path, 'rb') as f:
+                digest = hashlib.sha256(f.read()).hexdigest()
+            self._digests[memo_key] = digest
+        return digest
+
+    def _entry_path(self, pyc_path: str, decompiler: str) -> str:
+        key = hashlib.sha256(f'{self.pyc_digest(pyc_path)}\0{decompiler}'.encode('utf-8')).hexdigest()
+        return os.path.join(self.root, key[:2], key + ENTRY_SUFFIX)
+
+    def get(self, pyc_path: str, decompiler: Optional[str]) -> Optional[CachedResult]:
+        if decompiler is None:
+            return None
+        path = self._entry_path(pyc_path, decompiler)
+        try:
+            with open(path, 'rb') as f:
+                header = json.loads(f.readline())
+                output = f.read()
+            os.utime(path)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return CachedResult(header['ok'], output, header['stderr'].encode('utf-8'))
+
+    def put(self, pyc_path: str, decompiler: Optional[str], ok: bool, output: bytes = b'',
+            stderr: bytes = b'') -> None:
+        if decompiler is None:
+            return
+        path = self._entry_path(pyc_path, decompiler)
+        header = {'ok': ok, 'decompiler': decompiler, 'stderr': stderr.decode('utf-8', errors='replace')}
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.tmp_dir)
+        with os.fdopen(fd, 'wb') as w:
+            w.write(json.dumps(header, ensure_ascii=False).encode('utf-8') + b'\n')
+            w.write(output)
+        os.replace(tmp, path)
+
+    def run(self, pyc_path: str, decompiler: Optional[str], dst: str,
+            decompile: Callable[[], Tuple[bool, str]]) -> Tuple[bool, str]:
+        """Return the cached result for ``pyc_path`` or produce and store it.
+
+        ``decompile`` must write ``dst`` on success and return (ok, stderr).
+        On a hit ``dst`` is rewritten from the cache without running it.
+        """
+        hit = self.get(pyc_path, decompiler)
+        if hit is not None:
+            if hit.ok:
+                with open(dst, 'wb') as w:
+                    w.write(hit.output)
+            return hit.ok, hit.stderr.decode('utf-8', errors='replace')
+        ok, err = decompile()
+        output = b''
+        if ok:
+            try:
+                with open(dst, 'rb') as f:
+                    output = f.read()
+            except OSError:
+                # 反编译器报告成功却没有产出文件，不缓存
+                return ok, err
+        self.put(pyc_path, decompiler, ok, output, err.encode('utf-8'))
+        return ok, err
+
+    def _entries(self):
+        for base, dirs, files in os.walk(self.root):
+            if base == self.tmp_dir:
+                continue
+            for fn in files:
+                if fn.endswith(ENTRY_SUFFIX):
+                    path = os.path.join(base, fn)
+                    try:
+                        st = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    yield path, st.st_size, st.st_mtime_ns
+
+    def evict(self) -> int:
+        # 按最近使用时间（命中时刷新的 mtime）从旧到新删除，直到总大小回到上限以内
+        entries = sorted(self._entries(), key=lambda e: e[2])
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for path, size, _ in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+        return removed
+
+    def stats(self) -> Tuple[int, int]:
+        entries = list(self._entries())
+        return len(entries), sum(size for _, size, _ in entries)
+
+    def clear(self) -> int:
+        removed = 0
+        for path, _, _ in list(self._entries()):
+            os.remove(path)
+            removed += 1
+        return removed
+
+
+def run_cached(cache: Optional[DecompileCache], pyc_path: str, tool: str, dst: str,
+               decompile: Callable[[], Tuple[bool, str]], options: str = '',
+               executable: Optional[str] = None) -> Tuple[bool, str]:
+    # options 区分同一工具的不同调用方式与参数（如 api、cli -p 3.10）
+    # executable：命令行调用时实际运行的程序，按它而不是宿主解释器里安装的包版本区分
+    if cache is None:
+        return decompile()
+    version = tool_version(tool, executable)
+    decompiler = f'{version} {options}'.strip() if version else None
+    return cache.run(pyc_path, decompiler, dst, decompile)
+
+
+def default_cache() -> Optional[DecompileCache]:
+    # DECOMPILE_CACHE_DIR 设为空字符串时关闭缓存
+    return DecompileCache() if DEFAULT_ROOT else None
+
+
+def main() -> None:
+    if len(sys.argv) < 2 or sys.argv[1] not in ('stats', 'evict', 'clear'):
+        print('Usage: decompile_cache.py stats|evict|clear [cache_dir]')
+        sys.exit(1)
+
+    cache = DecompileCache(sys.argv[2] if len(sys.argv) > 2 else DEFAULT_ROOT)
+    if sys.argv[1] == 'evict':
+        print(f'Evicted {cache.evict()} entries from {cache.root}')
+    elif sys.argv[1] == 'clear':
+        print(f'Removed {cache.clear()} entries from {cache.root}')
+    else:
+        entries, size = cache.stats()
+        print(f'Entries: {entries}, size: {size / (1024 * 1024):.1f} MB, limit: {cache.max_bytes / (1024 * 1024):.0f} MB')
+
+
+if __name__ == '__main__':
+    main()
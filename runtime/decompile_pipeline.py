@@ -0,0 +1,285 @@
+import os
+import time
+import zlib
+import queue
+import argparse
+import functools
+import threading
+import importlib.util
+from contextlib import contextmanager
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Iterator, List, Optional, Set, Tuple
+
+import instrument
+import pyz_crypto
+from audit_decompile import REPORT_PATH, AuditResult, audit_pair, write_report
+from decompile_cache import DEFAULT_ROOT
+from decompile_pyc_batch import decompile_one, get_cache, load_decompilers, output_path
+from extract_pyz import PYZ_MAGIC, PyzArchive
+from job_ledger import LEDGER_PATH, JobLedger
+
+
+SRC_ROOT = '/tmp/百世_src'
+PYC_ROOT = '/tmp/百世_extracted/PYZ-00_extracted'
+PYINSTXTRACTOR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'decompiled', 'pyinstxtractor.py')
+QUEUE_SIZE = 64  # 每级队列的上限，下游跟不上时上游阻塞等待
+_DONE = None
+
+
+def load_pyinstxtractor():
+    # 按路径加载，不把 decompiled/ 放进 sys.path（那里残留的 3.10 .pyc 会遮蔽标准库）
+    spec = importlib.util.spec_from_file_location('pyinstxtractor', PYINSTXTRACTOR)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _load_key(pyz: PyzArchive, key: Optional[bytes], key_module: Optional[bytes] = None) -> None:
+    # 解密失败不中断：无法解密的成员照旧计入 encrypted
+    try:
+        if key is None and key_module is not None:
+            key = pyz_crypto.key_from_marshal(key_module, pyz.pyc_magic)
+        cipher = pyz.load_key(key)
+    except (ValueError, RuntimeError) as e:
+        print(f'[!] Cannot decrypt {pyz.path}: {e}')
+        return
+    if cipher is not None:
+        print(f'Encrypted PYZ {pyz.path}: decrypting members with AES-{cipher.mode.upper()}')
+
+
+@contextmanager
+def open_archives(path: str, key: Optional[bytes] = None) -> Iterator[List[PyzArchive]]:
+    """Open the PYZ archives in ``path``: a bare PYZ or a PyInstaller executable.
+
+    For an executable the embedded PYZ is read straight out of the CArchive,
+    so nothing has to be extracted to disk before the pipeline starts.
+    Encrypted archives are decrypted with ``key`` or the bundled key module.
+    """
+    with open(path, 'rb') as f:
+        is_pyz = f.read(4) == PYZ_MAGIC
+    if is_pyz:
+        with PyzArchive(path) as pyz:
+            _load_key(pyz, key)
+            yield [pyz]
+        return
+
+    arch = load_pyinstxtractor().PyInstArchive(path)
+    try:
+        if not (arch.open() and arch.checkFile() and arch.getCArchiveInfo()):
+            raise RuntimeError(f'Not a PYZ or PyInstaller archive: {path}')
+        arch.parseTOC()
+        key_module = arch._readCryptoKeyModule()
+        archives = []
+        for entry in arch.tocList:
+            if entry.typeCmprsData in (b'z', b'Z'):
+                data = arch._readAt(entry.position, entry.cmprsdDataSize)
+                if entry.cmprsFlag == 1:
+                    data = zlib.decompress(data)
+                pyz = PyzArchive(entry.name, data=data, use_index=False)
+                _load_key(pyz, key, key_module)
+                archives.append(pyz)
+        yield archives
+    finally:
+        arch.close()
+
+
+def _decompile(task: Tuple[str, str, str, Optional[str], Tuple[float, float, float]]) -> Tuple[str, float]:
+    # 在 worker 进程中执行，返回 (产出工具, 耗时)
+    src_pyc, out_root, in_root, cache_root, timeouts = task
+    start = time.perf_counter()
+    tool = decompile_one(src_pyc, out_root, in_root, get_cache(cache_root), timeouts)
+    return tool, time.perf_counter() - start
+
+
+class DecompilePipeline:
+    """Extract, decompile and audit each module as soon as the stage before hands it over.
+
+    An extractor thread feeds pycs into a bounded queue, a dispatcher keeps at
+    most ``2 * jobs`` decompiles in flight on a process pool, and finished
+    files are audited on the main thread, which also owns the job ledger.
+    When a stage falls behind the bounded queues block the one before it, so
+    memory stays flat and the total time tends to that of the slowest stage.
+    """
+
+    def __init__(self, pyc_root: str = PYC_ROOT, out_root: str = SRC_ROOT, jobs: int = os.cpu_count() or 1,
+                 queue_size: int = QUEUE_SIZE, cache_root: Optional[str] = DEFAULT_ROOT,
+                 timeouts: Tuple[float, float, float] = (0, 0, 120), ledger: Optional[JobLedger] = None,
+                 skip: Optional[Set[str]] = None, largest_first: bool = False,
+                 only: Optional[Set[str]] = None) -> None:
+        self.pyc_root = os.path.abspath(pyc_root)
+        self.out_root = os.path.abspath(out_root)
+        self.jobs = max(1, jobs)
+        self.cache_root = cache_root
+        self.timeouts = timeouts
+        self.ledger = ledger
+        self.skip = skip or set()  # 续跑时跳过的模块名
+        self.only = only  # 给定时只处理这些模块（如 channel_diff 列出的变更模块）
+        self.largest_first = largest_first
+        self.to_decompile: queue.Queue = queue.Queue(queue_size)
+        self.to_audit: queue.Queue = queue.Queue(queue_size)
+        self.slots = threading.Semaphore(2 * self.jobs)
+        self.error: Optional[BaseException] = None
+        self.encrypted: List[str] = []
+        self.extract_busy = 0.0
+        self.decompile_busy = 0.0
+        self.audit_busy = 0.0
+        self.first_output: Optional[float] = None
+
+    def output_for(self, pyz: PyzArchive, name: str) -> str:
+        return output_path(os.path.join(self.pyc_root, pyz.output_path(name)), self.out_root, self.pyc_root)
+
+    def _extract(self, archives: List[PyzArchive], pattern: str) -> None:
+        try:
+            for pyz in archives:
+                names = pyz.match(pattern)
+                if self.largest_first:
+                    # 按压缩后大小排序，大模块先进队列
+                    names.sort(key=lambda name: pyz.toc[name][2], reverse=True)
+                for name in names:
+                    if name in self.skip or (self.only is not None and name not in self.only):
+                        continue
+                    start = time.perf_counter()
+                    pyc_path = pyz.extract_member(name, self.pyc_root)
+                    self.extract_busy += time.perf_counter() - start
+                    if pyc_path is None:
+                        self.encrypted.append(self.output_for(pyz, name))
+                        continue
+                    self.to_decompile.put(pyc_path)
+        except BaseException as e:
+            self.error = e
+        finally:
+            self.to_decompile.put(_DONE)
+
+    def _forward(self, pyc_path: str, future: Future) -> None:
+        try:
+            tool, seconds = future.result()
+        except Exception as e:
+            tool, seconds = '', 0.0
+            self.error = self.error or e
+        self.to_audit.put((pyc_path, tool, seconds))
+        self.slots.release()
+
+    def _dispatch(self, pool: ProcessPoolExecutor) -> None:
+        try:
+            while True:
+                pyc_path = self.to_decompile.get()
+                if pyc_path is _DONE:
+                    break
+                self.slots.acquire()
+                future = pool.submit(_decompile, (pyc_path, self.out_root, self.pyc_root, self.cache_root, self.timeouts))
+                future.add_done_callback(functools.partial(self._forward, pyc_path))
+        except BaseException as e:
+            self.error = e
+        finally:
+            # 等所有在途任务的回调都把结果交给审计队列后再结束
+            for _ in range(2 * self.jobs):
+                self.slots.acquire()
+            self.to_audit.put(_DONE)
+
+    def _audit(self, pyc_path: str, tool: str, seconds: float) -> AuditResult:
+        py_path = output_path(pyc_path, self.out_root, self.pyc_root)
+        self.decompile_busy += seconds
+        if not tool:
+            result = AuditResult(0.0, py_path, pyc_path, False, 0.0, 0.0, [])
+            status, detail = 'failed', 'all decompilers failed'
+        else:
+            start = time.perf_counter()
+            with instrument.span('audit', py_path):
+                result = audit_pair((py_path, pyc_path))
+            self.audit_busy += time.perf_counter() - start
+            status, detail = ('ok' if result.complete else 'incomplete'), result.describe()
+        if self.ledger is not None:
+            self.ledger.record(py_path, pyc_path, tool or None, status, seconds, detail)
+        return result
+
+    def run(self, archives: List[PyzArchive], pattern: str = '*') -> List[AuditResult]:
+        start = time.perf_counter()
+        results: List[AuditResult] = []
+        with ProcessPoolExecutor(self.jobs, initializer=load_decompilers) as pool:
+            # fork 模式下首个任务会一次拉起全部 worker，先于线程启动完成，避免带着线程 fork
+            pool.submit(os.getpid).result()
+            threads = [threading.Thread(target=self._extract, args=(archives, pattern), daemon=True),
+                       threading.Thread(target=self._dispatch, args=(pool,), daemon=True)]
+            for t in threads:
+                t.start()
+            while True:
+                item = self.to_audit.get()
+                if item is _DONE:
+                    break
+                if self.first_output is None:
+                    self.first_output = time.perf_counter() - start
+                results.append(self._audit(*item))
+            for t in threads:
+                t.join()
+        if self.ledger is not None:
+            for py_path in self.encrypted:
+                self.ledger.record(py_path, None, None, 'encrypted')
+        if self.error is not None:
+            raise self.error
+        return sorted(results, key=lambda r: (r.score, r.py_path))
+
+
+def completed_modules(ledger: JobLedger, pipeline: DecompilePipeline, archives: List[PyzArchive]) -> Set[str]:
+    # 账本中最新一次已完整反编译、且输出仍在的模块
+    done = ledger.succeeded(prefix=pipeline.out_root + os.sep)
+    return {name for pyz in archives for name in pyz.list()
+            if pipeline.output_for(pyz, name) in done and os.path.exists(pipeline.output_for(pyz, name))}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Stream modules from a PYZ or PyInstaller executable through '
+                                                 'extract, decompile and audit stages')
+    parser.add_argument('archive', help='PYZ archive or PyInstaller executable')
+    parser.add_argument('--pyc-root', default=PYC_ROOT)
+    parser.add_argument('--out', default=SRC_ROOT)
+    parser.add_argument('--match', default='*', help='only process modules matching this glob, e.g. "api.*"')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1, help='decompiler worker processes')
+    parser.add_argument('--queue-size', type=int, default=QUEUE_SIZE, help='bound of each inter-stage queue')
+    parser.add_argument('--cache', default=DEFAULT_ROOT, help='decompilation result cache directory')
+    parser.add_argument('--no-cache', action='store_true', help='always run the decompilers')
+    parser.add_argument('--timeout-decompyle3', type=float, default=0, help='seconds before a file is routed to pycdc (0 = no limit)')
+    parser.add_argument('--timeout-uncompyle6', type=float, default=0, help='seconds before a file is routed to pycdc (0 = no limit)')
+    parser.add_argument('--timeout-pycdc', type=float, default=120, help='seconds for the pycdc fallback (0 = no limit)')
+    parser.add_argument('--modules-from', help='only process the module names listed in this file, one per line')
+    parser.add_argument('--largest-first', action='store_true', help='feed the biggest modules first (shorter tail, slower first output)')
+    parser.add_argument('--ledger', default=LEDGER_PATH, help='job ledger recording per-file outcomes')
+    parser.add_argument('--resume', action='store_true', help='skip modules the ledger already records as complete')
+    parser.add_argument('--report', default=REPORT_PATH)
+    parser.add_argument('--key', help='AES key of an encrypted PYZ (default: read pyimod00_crypto_key)')
+    args = parser.parse_args()
+    only = None
+    if args.modules_from:
+        with open(args.modules_from, 'r', encoding='utf-8') as f:
+            only = {line.strip() for line in f if line.strip()}
+
+    with JobLedger(args.ledger, 'decompile_pipeline') as ledger, open_archives(args.archive, args.key.encode('utf-8') if args.key else None) as archives:
+        pipeline = DecompilePipeline(args.pyc_root, args.out, args.jobs, args.queue_size,
+                                     None if args.no_cache else args.cache,
+                                     (args.timeout_decompyle3, args.timeout_uncompyle6, args.timeout_pycdc),
+                                     ledger, largest_first=args.largest_first, only=only)
+        if args.resume:
+            pipeline.skip = completed_modules(ledger, pipeline, archives)
+            print(f'Resume: {len(pipeline.skip)} module(s) already complete')
+        start = time.perf_counter()
+        results = pipeline.run(archives, args.match)
+        elapsed = time.perf_counter() - start
+        if only is None and args.match == '*':
+            # 处理了全部模块，retry_failed 可以只查账本
+            ledger.mark_complete(pipeline.out_root + os.sep)
+
+    incomplete = [r for r in results if not r.complete]
+    write_report(incomplete, args.report)
+    print(f'Modules: {len(results)}, Encrypted: {len(pipeline.encrypted)}, Incomplete: {len(incomplete)}. '
+          f'Output: {pipeline.out_root}')
+    print(f'Elapsed: {elapsed:.1f}s, first module after {pipeline.first_output or 0:.2f}s, '
+          f'{len(results) / elapsed if elapsed else 0:.1f} files/s')
+    # 各阶段的忙碌时间：流水线总时长应接近其中最大的一项，而不是三者之和
+    print(f'Stage busy: extract={pipeline.extract_busy:.1f}s, '
+          f'decompile={pipeline.decompile_busy / pipeline.jobs:.1f}s ({pipeline.jobs} worker(s)), '
+          f'audit={pipeline.audit_busy:.1f}s')
+    if incomplete:
+        print(f'Report: {args.report}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,18 @@
 import os
 import sys
+import math
+import time
+import signal
+import argparse
 import traceback
-from typing import Optional
+import multiprocessing
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+import instrument
+from decompile_cache import DEFAULT_ROOT, DecompileCache, run_cached
+from job_ledger import LEDGER_PATH, JobLedger
+from pycdc_runner import run_pycdc
 
 
 def ensure_dir(path: str) -> None:
@@ -15,57 +26,134 @@ def find_pyc_files(root: str):
                 yield os.path.join(base, fn)
 
 
+_DECOMPILERS: Optional[Dict[str, object]] = None
+
+
+def load_decompilers() -> Dict[str, object]:
+    # 每个进程只导入一次反编译器；进程池 worker 以此作为 initializer 预热
+    global _DECOMPILERS
+    if _DECOMPILERS is None:
+        found: Dict[str, object] = {}
+        try:
+            import decompyle3.main
+            found['decompyle3'] = decompyle3.main
+        except Exception:
+            pass
+        try:
+            import uncompyle6.main
+            found['uncompyle6'] = uncompyle6.main
+        except Exception:
+            pass
+        try:
+            import uncompyle6.api
+            found['uncompyle6.api'] = uncompyle6.api
+        except Exception:
+            pass
+        _DECOMPILERS = found
+    return _DECOMPILERS
+
+
 def try_decompile_with_decompyle3(src_pyc: str, dst_py: str) -> bool:
+    main_mod = load_decompilers().get('decompyle3')
+    if main_mod is None:
+        return False
+    # decompyle3 API stability varies; use "main" facade if present
     try:
-        import decompyle3
-        # decompyle3 API stability varies; use "main" facade if present
+        with open(dst_py, 'w', encoding='utf-8') as w:
+            ok = main_mod.decompile(src_pyc, out=w)
+        return bool(ok)
+    except Exception:
+        # Fallback to decompile_file if exposed
         try:
-            from decompyle3.main import decompile
             with open(dst_py, 'w', encoding='utf-8') as w:
-                ok = decompile(src_pyc, out=w)
-            return bool(ok)
+                main_mod.decompile_file(src_pyc, out=w)
+            return True
         except Exception:
-            # Fallback to decompile_file if exposed
-            try:
-                from decompyle3.main import decompile_file
-                with open(dst_py, 'w', encoding='utf-8') as w:
-                    decompile_file(src_pyc, out=w)
-                return True
-            except Exception:
-                return False
-    except Exception:
-        return False
+            return False
 
 
 def try_decompile_with_uncompyle6(src_pyc: str, dst_py: str) -> bool:
-    try:
-        import uncompyle6
+    decompilers = load_decompilers()
+    main_mod = decompilers.get('uncompyle6')
+    api_mod = decompilers.get('uncompyle6.api')
+    if main_mod is not None:
         try:
-            from uncompyle6.main import decompile
             with open(dst_py, 'w', encoding='utf-8') as w:
-                decompile(src_pyc, out=w)
+                main_mod.decompile(src_pyc, out=w)
             return True
         except Exception:
-            try:
-                from uncompyle6.api import decompile_file
-                with open(dst_py, 'w', encoding='utf-8') as w:
-                    decompile_file(src_pyc, outstream=w)
-                return True
-            except Exception:
-                return False
+            pass
+    # uncompyle6.main 不可用或失败时改用 api.decompile_file
+    if api_mod is None:
+        return False
+    try:
+        with open(dst_py, 'w', encoding='utf-8') as w:
+            api_mod.decompile_file(src_pyc, outstream=w)
+        return True
     except Exception:
         return False
 
 
-def decompile_one(src_pyc: str, out_root: str, in_root: str) -> bool:
-    rel = os.path.relpath(src_pyc, in_root)[:-4] + '.py'
-    dst = os.path.join(out_root, rel)
+_CACHES: Dict[str, DecompileCache] = {}
+
+
+def get_cache(root: Optional[str]) -> Optional[DecompileCache]:
+    # 每个 worker 进程各自持有一个实例，缓存条目是原子写入的单个文件，可安全共享
+    if not root:
+        return None
+    if root not in _CACHES:
+        _CACHES[root] = DecompileCache(root)
+    return _CACHES[root]
+
+
+class DecompileTimeout(BaseException):
+    # 继承 BaseException，避免被反编译器包装函数里的 except Exception 吞掉
+    pass
+
+
+def _on_alarm(signum, frame) -> None:
+    raise DecompileTimeout()
+
+
+@contextmanager
+def deadline(seconds: float):
+    # 进程池任务在 worker 主线程执行，可以用 SIGALRM 打断纯 Python 的反编译器
+    if seconds <= 0:
+        yield
+        return
+    previous = signal.signal(signal.SIGALRM, _on_alarm)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def decompile_one(src_pyc: str, out_root: str, in_root: str, cache: Optional[DecompileCache] = None,
+                  timeouts: Tuple[float, float, float] = (0, 0, 0)) -> str:
+    # 返回产出结果的工具名，失败返回空串；timeouts 依次对应 decompyle3/uncompyle6/pycdc，0 表示不限
+    dst = output_path(src_pyc, out_root, in_root)
     ensure_dir(os.path.dirname(dst))
 
-    if try_decompile_with_decompyle3(src_pyc, dst):
-        return True
-    if try_decompile_with_uncompyle6(src_pyc, dst):
-        return True
+    try:
+        with deadline(timeouts[0]):
+            ok, _ = run_cached(cache, src_pyc, 'decompyle3', dst,
+                               lambda: (try_decompile_with_decompyle3(src_pyc, dst), ''), options='api')
+        if ok:
+            return 'decompyle3'
+        with deadline(timeouts[1]):
+            ok, _ = run_cached(cache, src_pyc, 'uncompyle6', dst,
+                               lambda: (try_decompile_with_uncompyle6(src_pyc, dst), ''), options='api')
+        if ok:
+            return 'uncompyle6'
+    except DecompileTimeout:
+        # 超时的文件多半是病态的大模块，另一个纯 Python 反编译器也会很慢，直接交给最快的 pycdc
+        res = run_pycdc(src_pyc, timeout=timeouts[2] or None, cache=cache)
+        if res.ok:
+            with open(dst, 'wb') as w:
+                w.write(res.stdout)
+            return 'pycdc'
 
     # If both failed, write a stub note with traceback for manual follow-up
     try:
@@ -73,26 +161,119 @@ def decompile_one(src_pyc: str, out_root: str, in_root: str) -> bool:
             w.write(f'Failed to decompile: {src_pyc}\n')
     except Exception:
         pass
-    return False
+    return ''
+
+
+def _decompile_task(task: Tuple[str, str, str, Optional[str], Tuple[float, float, float]]) -> Tuple[str, str, int, float]:
+    # 返回 (pyc 路径, 产出工具, 本次缓存命中数, 耗时)，在主进程汇总统计
+    src_pyc, out_root, in_root, cache_root, timeouts = task
+    cache = get_cache(cache_root)
+    hits = cache.hits if cache is not None else 0
+    start = time.perf_counter()
+    tool = decompile_one(src_pyc, out_root, in_root, cache, timeouts)
+    return src_pyc, tool, (cache.hits - hits) if cache is not None else 0, time.perf_counter() - start
+
+
+def output_path(src_pyc: str, out_root: str, in_root: str) -> str:
+    return os.path.join(out_root, os.path.relpath(src_pyc, in_root)[:-4] + '.py')
+
+
+def plan_tasks(pyc_root: str, skip: Optional[set] = None) -> List[str]:
+    # 按文件大小从大到小排序，大模块先开工，不会在最后拖尾；skip 为续跑时已成功的 pyc
+    # 只 stat 不解析：规划阶段逐个解码整棵树的 pyc 比排序带来的收益还慢
+    pending = [p for p in find_pyc_files(pyc_root) if not skip or p not in skip]
+    return sorted(pending, key=os.path.getsize, reverse=True)
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    return values[min(len(values) - 1, int(len(values) * pct))] if values else 0.0
+
+
+def report_latency(durations: Dict[str, float], finished: List[float]) -> None:
+    if not durations:
+        return
+    ordered = sorted(durations.values())
+    print(f'Per-file: p50={_percentile(ordered, 0.5):.2f}s, p90={_percentile(ordered, 0.9):.2f}s, '
+          f'p99={_percentile(ordered, 0.99):.2f}s, max={ordered[-1]:.2f}s')
+    # 尾部时延：95% 的文件完成之后，还要等多久整批才结束
+    finished = sorted(finished)
+    first = finished[max(0, math.ceil(len(finished) * 0.95) - 1)]
+    print(f'Tail: last 5% finished {finished[-1] - first:.2f}s after the first 95%')
+    for path, seconds in sorted(durations.items(), key=lambda item: item[1], reverse=True)[:5]:
+        print(f'  slowest: {seconds:.2f}s {path}')
 
 
 def main() -> None:
-    if len(sys.argv) < 3:
-        print('Usage: decompile_pyc_batch.py <pyc_root> <out_root>')
-        sys.exit(1)
+    parser = argparse.ArgumentParser(usage='decompile_pyc_batch.py <pyc_root> <out_root> [--jobs N] [--cache DIR | --no-cache] [--resume]')
+    parser.add_argument('pyc_root')
+    parser.add_argument('out_root')
+    parser.add_argument('--jobs', type=int, default=1, help='worker processes, each imports the decompilers once')
+    parser.add_argument('--cache', default=DEFAULT_ROOT, help='decompilation result cache directory')
+    parser.add_argument('--no-cache', action='store_true', help='always run the decompilers')
+    parser.add_argument('--timeout-decompyle3', type=float, default=0, help='seconds before a file is routed to pycdc (0 = no limit)')
+    parser.add_argument('--timeout-uncompyle6', type=float, default=0, help='seconds before a file is routed to pycdc (0 = no limit)')
+    parser.add_argument('--timeout-pycdc', type=float, default=120, help='seconds for the pycdc fallback (0 = no limit)')
+    parser.add_argument('--ledger', default=LEDGER_PATH, help='job ledger recording per-file outcomes')
+    parser.add_argument('--resume', action='store_true', help='skip files the ledger already records as decompiled')
+    args = parser.parse_args()
+    timeouts = (args.timeout_decompyle3, args.timeout_uncompyle6, args.timeout_pycdc)
+    cache_root = None if args.no_cache else args.cache
 
-    pyc_root = os.path.abspath(sys.argv[1])
-    out_root = os.path.abspath(sys.argv[2])
+    pyc_root = os.path.abspath(args.pyc_root)
+    out_root = os.path.abspath(args.out_root)
     ensure_dir(out_root)
 
+    ledger = JobLedger(args.ledger, 'decompile_pyc_batch')
+    skip = None
+    if args.resume:
+        # 账本里最新一次成功且输出仍在的文件不再重跑
+        done = ledger.succeeded(prefix=out_root + os.sep)
+        skip = {p for p in find_pyc_files(pyc_root)
+                if output_path(p, out_root, pyc_root) in done and os.path.exists(output_path(p, out_root, pyc_root))}
+        print(f'Resume: {len(skip)} file(s) already decompiled')
+
     total = 0
     ok = 0
-    for pyc_path in find_pyc_files(pyc_root):
+    hits = 0
+    routes: Dict[str, int] = {}
+    durations: Dict[str, float] = {}
+    finished: List[float] = []
+    start = time.perf_counter()
+    with instrument.span('plan'):
+        tasks = [(pyc_path, out_root, pyc_root, cache_root, timeouts) for pyc_path in plan_tasks(pyc_root, skip)]
+
+    def collect(pyc_path: str, tool: str, task_hits: int, seconds: float) -> None:
+        nonlocal total, ok, hits
         total += 1
-        if decompile_one(pyc_path, out_root, pyc_root):
-            ok += 1
+        ok += bool(tool)
+        hits += task_hits
+        routes[tool or 'failed'] = routes.get(tool or 'failed', 0) + 1
+        durations[pyc_path] = seconds
+        finished.append(time.perf_counter() - start)
+        ledger.record(output_path(pyc_path, out_root, pyc_root), pyc_path, tool or None,
+                      'ok' if tool else 'failed', seconds)
+
+    if args.jobs > 1:
+        with multiprocessing.Pool(args.jobs, initializer=load_decompilers) as pool:
+            # chunksize=1 让 worker 严格按从大到小领取任务
+            for result in pool.imap_unordered(_decompile_task, tasks, chunksize=1):
+                collect(*result)
+    else:
+        load_decompilers()
+        for task in tasks:
+            collect(*_decompile_task(task))
+    # 整棵树都有了记录，retry_failed 可以只查账本
+    ledger.mark_complete(out_root + os.sep)
+    ledger.close()
+    elapsed = time.perf_counter() - start
 
     print(f'Decompiled OK: {ok}/{total}. Output: {out_root}')
+    print(f'Elapsed: {elapsed:.1f}s, {total / elapsed if elapsed else 0:.1f} files/s with {args.jobs} worker(s)')
+    print('Routes: ' + ', '.join(f'{tool}={n}' for tool, n in sorted(routes.items())))
+    report_latency(durations, finished)
+    cache = get_cache(cache_root)
+    if cache is not None:
+        print(f'Cache: {hits} hit(s), {cache.evict()} entries evicted ({cache.root})')
 
 
 if __name__ == '__main__':
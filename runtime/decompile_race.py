@@ -0,0 +1,140 @@
+import os
+import sys
+import shutil
+import argparse
+from collections import Counter
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence
+
+import instrument
+from decompile_cache import DecompileCache, default_cache, tool_version
+from pyc_inspect import PycProfile, SourceScore, profile_pyc, score_source
+from pycdc_runner import DEFAULT_JOBS, DEFAULT_TIMEOUT, PYCDC, CommandResult, race_commands
+
+
+# 名称 -> 命令前缀（末尾追加 pyc 路径），源码都从 stdout 读取
+DECOMPILERS: Dict[str, List[str]] = {
+    'decompyle3': ['decompyle3'],
+    'uncompyle6': ['uncompyle6'],
+    'pycdc': [PYCDC],
+}
+
+
+class RaceResult(NamedTuple):
+    winner: Optional[str]
+    source: bytes
+    scores: Dict[str, SourceScore]
+    results: Dict[str, CommandResult]
+
+
+def decompilers_for(py_version: str, pycdc: str = PYCDC) -> Dict[str, List[str]]:
+    return {
+        'decompyle3': ['decompyle3', '-p', py_version],
+        'uncompyle6': ['uncompyle6', f'--py={py_version}'],
+        'pycdc': [pycdc],
+    }
+
+
+def _tool_env() -> Dict[str, str]:
+    env = os.environ.copy()
+    env['PATH'] = f"{os.path.expanduser('~')}/.local/bin:" + env.get('PATH', '')
+    return env
+
+
+def _decompiler_id(name: str, prefix: Sequence[str]) -> Optional[str]:
+    # 按 _tool_env 下实际运行的程序取版本，而不是宿主解释器里安装的包
+    executable = prefix[0] if os.path.sep in prefix[0] else shutil.which(prefix[0], path=_tool_env()['PATH'])
+    if executable is None:
+        return None
+    # pycdc 的标识与 run_pycdc_many 相同，共享缓存条目；decompyle3/uncompyle6 这里取 stdout，
+    # 与 run_cached 的 'cli ...' 条目（-o 写出的文件）互不相通
+    version = tool_version(name, executable)
+    return f'{version} {" ".join(prefix[1:])}'.strip() if version else None
+
+
+def _profile(pyc_path: str) -> Optional[PycProfile]:
+    try:
+        return profile_pyc(pyc_path)
+    except Exception:
+        return None
+
+
+def _pick(results: Dict[str, CommandResult], profile: Optional[PycProfile]) -> RaceResult:
+    scores = {name: score_source(res.stdout, profile) for name, res in results.items()
+              if res.returncode == 0 and res.stdout}
+    if not scores:
+        return RaceResult(None, b'', scores, results)
+    winner = max(scores, key=lambda name: scores[name].value)
+    return RaceResult(winner, results[winner].stdout, scores, results)
+
+
+def race_decompile_many(pyc_paths: Iterable[str], decompilers: Optional[Dict[str, List[str]]] = None,
+                        jobs: int = DEFAULT_JOBS, timeout: float = DEFAULT_TIMEOUT,
+                        cache: Optional[DecompileCache] = None) -> Dict[str, RaceResult]:
+    """Run every decompiler on each pyc concurrently and keep the best output.
+
+    Outputs are ranked with :func:`pyc_inspect.score_source`; once one of them
+    is perfect the other decompilers still running on that file are killed.
+    Cached results take part in the race without being re-run.
+    """
+    decompilers = decompilers or DECOMPILERS
+    paths = list(pyc_paths)
+    profiles = {p: _profile(p) for p in paths}
+    ids = {name: _decompiler_id(name, prefix) for name, prefix in decompilers.items()}
+    cached: Dict[str, Dict[str, CommandResult]] = {}
+    races = []
+    racing: List[str] = []
+    for p in paths:
+        cached[p] = {}
+        if cache is not None:
+            for name, prefix in decompilers.items():
+                hit = cache.get(p, ids[name])
+                if hit is not None:
+                    cached[p][name] = CommandResult([*prefix, p], 0 if hit.ok else 1, hit.output, hit.stderr)
+        if any(res.ok and score_source(res.stdout, profiles[p]).perfect for res in cached[p].values()):
+            continue
+        commands = {name: [*prefix, p] for name, prefix in decompilers.items() if name not in cached[p]}
+        if not commands:
+            continue
+
+        def done(name: str, res: CommandResult, profile: Optional[PycProfile] = profiles[p]) -> bool:
+            return res.returncode == 0 and score_source(res.stdout, profile).perfect
+
+        races.append((commands, done))
+        racing.append(p)
+
+    with instrument.span('race', files=len(racing)):
+        raced = race_commands(races, jobs, timeout, _tool_env())
+    for p, results in zip(racing, raced):
+        for name, res in results.items():
+            # 超时属于偶发情况，不写入缓存
+            if cache is not None and not res.timed_out:
+                cache.put(p, ids[name], res.ok, res.stdout if res.ok else b'', res.stderr)
+        cached[p].update(results)
+    return {p: _pick(cached[p], profiles[p]) for p in paths}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Race all decompilers on each pyc and keep the best-scoring output')
+    parser.add_argument('pyc_paths', nargs='+')
+    parser.add_argument('--out-dir', help='write <name>.py here instead of printing a summary only')
+    parser.add_argument('--py', default='3.10', help='bytecode version passed to decompyle3/uncompyle6')
+    parser.add_argument('--jobs', type=int, default=DEFAULT_JOBS)
+    parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT)
+    args = parser.parse_args()
+
+    results = race_decompile_many(args.pyc_paths, decompilers_for(args.py), args.jobs, args.timeout, default_cache())
+    winners: Counter = Counter()
+    for pyc_path, race in results.items():
+        winners[race.winner] += 1
+        detail = ', '.join(f'{name}={score.value:.2f}' for name, score in race.scores.items())
+        print(f'{pyc_path}: winner={race.winner} [{detail}]')
+        if args.out_dir and race.winner:
+            os.makedirs(args.out_dir, exist_ok=True)
+            with open(os.path.join(args.out_dir, os.path.basename(pyc_path)[:-1]), 'wb') as w:
+                w.write(race.source)
+    print('Winners: ' + ', '.join(f'{name}={n}' for name, n in winners.most_common()))
+    sys.exit(0 if None not in winners else 1)
+
+
+if __name__ == '__main__':
+    main()
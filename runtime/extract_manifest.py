@@ -0,0 +1,109 @@
+import os
+import json
+from typing import Dict, List, Optional
+
+
+MANIFEST_NAME = '.extract_manifest.json'
+MANIFEST_VERSION = 1
+
+
+class ExtractManifest:
+    """Per-entry record of what a previous extraction wrote into ``out_dir``.
+
+    Each row keeps the entry's metadata (type, sizes), the CRC32 of its
+    compressed bytes and the output file it produced. When the archive's size
+    and mtime are unchanged the metadata alone decides, otherwise the CRC does,
+    so unchanged entries are skipped even if their offsets moved.
+    """
+
+    def __init__(self, out_dir: str, archive_path: str) -> None:
+        self.out_dir = out_dir
+        self.path = os.path.join(out_dir, MANIFEST_NAME)
+        st = os.stat(archive_path)
+        self.archive = [st.st_size, st.st_mtime_ns]
+        self.previous: Dict[str, dict] = {}
+        self.current: Dict[str, dict] = {}
+        self.pyc_magic: Optional[bytes] = None
+
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+        if data.get('version') == MANIFEST_VERSION:
+            self.previous = data.get('entries', {})
+            if data.get('pyc_magic'):
+                self.pyc_magic = bytes.fromhex(data['pyc_magic'])
+        self.same_archive = bool(self.previous) and data.get('archive') == self.archive
+
+    def _output_exists(self, row: dict) -> bool:
+        return row['out'] is None or os.path.exists(os.path.join(self.out_dir, row['out']))
+
+    def check(self, key: str, meta: list, crc: Optional[int] = None) -> bool:
+        # 条目未变（同一归档看元数据，归档变了看 CRC）且输出文件仍在时返回 True 并沿用旧记录
+        prev = self.previous.get(key)
+        if prev is None or prev['meta'] != meta:
+            return False
+        if crc is None:
+            if not self.same_archive:
+                return False
+        elif prev['crc'] != crc:
+            return False
+        if not self._output_exists(prev):
+            return False
+        self.current[key] = prev
+        return True
+
+    def check_prefix(self, prefix: str) -> bool:
+        # 整个子归档（如 PYZ）未变时，一次沿用其全部成员的记录
+        rows = {k: v for k, v in self.previous.items() if k.startswith(prefix)}
+        if not all(self._output_exists(row) for row in rows.values()):
+            return False
+        self.current.update(rows)
+        return True
+
+    def keep(self, key: str) -> None:
+        # 本次未处理但仍存在的条目（如未匹配通配符的成员）沿用旧记录，避免被当作已删除
+        if key in self.previous:
+            self.current[key] = self.previous[key]
+
+    def record(self, key: str, meta: list, crc: Optional[int], out: Optional[str]) -> None:
+        if out is not None:
+            out = os.path.relpath(os.path.join(self.out_dir, out), self.out_dir)
+        self.current[key] = {'meta': meta, 'crc': crc, 'out': out}
+
+    def stale_outputs(self) -> List[str]:
+        live = {row['out'] for row in self.current.values()}
+        return sorted({row['out'] for key, row in self.previous.items()
+                       if key not in self.current and row['out'] is not None and row['out'] not in live})
+
+    def remove_stale(self) -> int:
+        removed = 0
+        for rel in self.stale_outputs():
+            path = os.path.join(self.out_dir, rel)
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            removed += 1
+            # 顺带清理因此变空的目录
+            parent = os.path.dirname(path)
+            while os.path.abspath(parent) != os.path.abspath(self.out_dir):
+                try:
+                    os.rmdir(parent)
+                except OSError:
+                    break
+                parent = os.path.dirname(parent)
+        return removed
+
+    def save(self, pyc_magic: Optional[bytes] = None) -> None:
+        data = {
+            'version': MANIFEST_VERSION,
+            'archive': self.archive,
+            'pyc_magic': (pyc_magic or self.pyc_magic or b'').hex(),
+            'entries': self.current,
+        }
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as w:
+            json.dump(data, w, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp, self.path)
@@ -1,70 +1,309 @@
 import os
-import sys
+import json
 import zlib
 import struct
 import marshal
+import fnmatch
+import argparse
+import threading
+import importlib.util
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Deque, Dict, List, Optional, Tuple
 
+import instrument
+import marshal_lite
+import pyz_crypto
+from cas_store import ContentStore
+from extract_manifest import ExtractManifest
+from pyz_crypto import PyzCipher
 
-def extract_pyz(pyz_path: str, out_dir: str) -> None:
-    with open(pyz_path, 'rb') as f:
-        magic = f.read(4)
-        if magic != b'PYZ\0':
-            raise RuntimeError('Not a PYZ file')
 
-        pyc_magic = f.read(4)
-        # Read TOC position
-        (toc_pos,) = struct.unpack('!i', f.read(4))
-        f.seek(toc_pos, os.SEEK_SET)
-        toc = marshal.load(f)
-        if isinstance(toc, list):
-            toc = dict(toc)
+PYZ_MAGIC = b'PYZ\0'
+INDEX_SUFFIX = '.idx.json'
+INDEX_VERSION = 1
 
-        for key, (is_pkg, pos, length) in toc.items():
+
+class PyzArchive:
+    """Random-access reader for a PyInstaller PYZ archive.
+
+    The TOC is unmarshalled once and cached next to the archive in a
+    ``<pyz>.idx.json`` sidecar, so later opens skip the unmarshal and reading
+    one module costs a single seek and decompress. With a ``cipher`` set,
+    members that do not decompress are decrypted first.
+    """
+
+    def __init__(self, path: str, data=None, use_index: bool = True, cipher: Optional[PyzCipher] = None) -> None:
+        # data: 可选的内存缓冲（如 mmap 的 memoryview 切片），给定时不再打开文件
+        self.path = path
+        self.data = data
+        self.use_index = use_index and data is None
+        self.cipher = cipher
+        self._fp = None
+        self._lock = threading.Lock()
+        self._toc: Optional[Dict[str, Tuple[int, int, int]]] = None
+
+        header = self._read_at(0, 12)
+        if len(header) < 12 or bytes(header[:4]) != PYZ_MAGIC:
+            self.close()
+            raise RuntimeError(f'Not a PYZ file: {path}')
+        self.pyc_magic = bytes(header[4:8])
+        (self.toc_pos,) = struct.unpack('!i', header[8:12])
+
+    def close(self) -> None:
+        if self._fp is not None:
+            self._fp.close()
+            self._fp = None
+
+    def __enter__(self) -> 'PyzArchive':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _read_at(self, pos: int, size: int):
+        if self.data is not None:
+            return self.data[pos:pos + size] if size >= 0 else self.data[pos:]
+        with self._lock:
+            if self._fp is None:
+                self._fp = open(self.path, 'rb')
+            self._fp.seek(pos, os.SEEK_SET)
+            return self._fp.read(size)
+
+    @property
+    def index_path(self) -> str:
+        return self.path + INDEX_SUFFIX
+
+    def _load_index(self) -> Optional[Dict[str, Tuple[int, int, int]]]:
+        try:
+            st = os.stat(self.path)
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                idx = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if idx.get('version') != INDEX_VERSION or idx.get('size') != st.st_size \
+                or idx.get('mtime_ns') != st.st_mtime_ns or idx.get('pyc_magic') != self.pyc_magic.hex():
+            return None
+        return {name: (typecode, pos, length) for name, typecode, pos, length in idx['entries']}
+
+    def _save_index(self, toc: Dict[str, Tuple[int, int, int]]) -> None:
+        try:
+            st = os.stat(self.path)
+            idx = {
+                'version': INDEX_VERSION,
+                'size': st.st_size,
+                'mtime_ns': st.st_mtime_ns,
+                'pyc_magic': self.pyc_magic.hex(),
+                'entries': [[name, *value] for name, value in toc.items()],
+            }
+            tmp = self.index_path + '.tmp'
+            with open(tmp, 'w', encoding='utf-8') as w:
+                json.dump(idx, w, ensure_ascii=False, separators=(',', ':'))
+            os.replace(tmp, self.index_path)
+        except OSError:
+            # 目录只读等情况下放弃缓存，不影响读取
+            pass
+
+    def _unmarshal_toc(self) -> Dict[str, Tuple[int, int, int]]:
+        data = self._read_at(self.toc_pos, -1)
+        if self.pyc_magic == importlib.util.MAGIC_NUMBER:
+            raw = marshal.loads(data)
+        else:
+            # 宿主 Python 与打包版本不同：TOC 只含 list/tuple/str/bytes/int，用纯 Python 解码
+            raw = marshal_lite.loads(data, py2=marshal_lite.is_py2_magic(self.pyc_magic))
+        # From pyinstaller 3.1+ toc is a list of tuples
+        items = raw.items() if isinstance(raw, dict) else raw
+        toc: Dict[str, Tuple[int, int, int]] = {}
+        for key, (typecode, pos, length) in items:
             try:
+                # for Python > 3.3 some keys are bytes object some are str object
                 name = key.decode('utf-8') if isinstance(key, (bytes, bytearray)) else str(key)
-            except Exception:
+            except UnicodeDecodeError:
                 name = str(key)
+            toc[name] = (typecode, pos, length)
+        return toc
 
-            safe_name = name.replace('..', '__').replace('.', os.path.sep)
-            if is_pkg == 1:
-                rel_path = os.path.join(safe_name, '__init__.pyc')
-            else:
-                rel_path = safe_name + '.pyc'
+    @property
+    def toc(self) -> Dict[str, Tuple[int, int, int]]:
+        if self._toc is None:
+            with instrument.span('pyz_toc', self.path) as attrs:
+                toc = self._load_index() if self.use_index else None
+                attrs['indexed'] = toc is not None
+                if toc is None:
+                    toc = self._unmarshal_toc()
+                    if self.use_index:
+                        self._save_index(toc)
+            self._toc = toc
+        return self._toc
 
-            abs_path = os.path.join(out_dir, rel_path)
-            os.makedirs(os.path.dirname(abs_path), exist_ok=True)
+    def list(self) -> List[str]:
+        return list(self.toc)
+
+    def is_package(self, name: str) -> bool:
+        return self.toc[name][0] == 1
+
+    def read_raw(self, name: str) -> bytes:
+        _, pos, length = self.toc[name]
+        return self._read_at(pos, length)
+
+    def read(self, name: str) -> bytes:
+        # 返回 marshal 后的 code 对象字节（不含 pyc 头）；加密成员在未设置密钥时抛出 zlib.error
+        return pyz_crypto.inflate(self.read_raw(name), self.cipher)
+
+    def load_key(self, key: Optional[bytes] = None) -> Optional[PyzCipher]:
+        """Set up decryption from ``key``, or from the ``pyimod00_crypto_key`` module when not given.
+
+        Returns the cipher, or None when no key is found or the members are
+        not encrypted. Raises ValueError when the key does not fit.
+        """
+        key = pyz_crypto.normalize_key(key) if key else pyz_crypto.find_key(self)
+        if key is not None:
+            self.cipher = pyz_crypto.cipher_for(self, key)
+        return self.cipher
 
-            f.seek(pos, os.SEEK_SET)
-            data = f.read(length)
+    def output_path(self, name: str) -> str:
+        # Prevent writing outside the output directory
+        safe_name = name.replace('..', '__').replace('.', os.path.sep)
+        if self.is_package(name):
+            return os.path.join(safe_name, '__init__.pyc')
+        return safe_name + '.pyc'
+
+    def pyc_header(self) -> bytes:
+        # PEP 552 deterministic pycs header fields
+        return self.pyc_magic + b'\0' * 12
+
+    def match(self, pattern: str) -> List[str]:
+        # 同时接受模块名（api.*）与路径（api/*）形式的通配符
+        pattern = pattern.replace('/', '.').replace(os.path.sep, '.')
+        return [name for name in self.toc if fnmatch.fnmatchcase(name, pattern)]
+
+    def extract(self, pattern: str, out_dir: str, store: Optional[ContentStore] = None,
+                manifest: Optional[ExtractManifest] = None, jobs: int = 1) -> Tuple[int, int]:
+        # jobs > 1 时解密、解压与写出在线程池中进行（AES 与 zlib 都会释放 GIL），读取与清单仍在本线程
+        extracted = encrypted = 0
+        header = self.pyc_header()
+        matched = self.match(pattern)
+        if manifest is not None:
+            for name in set(self.toc).difference(matched):
+                manifest.keep(name)
+
+        pending: Deque[Tuple[str, list, Optional[int], str, Future]] = deque()
+
+        def finish(name: str, meta: list, crc: Optional[int], rel_path: str, future: Future) -> None:
+            nonlocal extracted, encrypted
+            if not future.result():
+                if manifest is not None:
+                    manifest.record(name, meta, crc, rel_path + '.encrypted')
+                encrypted += 1
+                return
+            if manifest is not None:
+                manifest.record(name, meta, crc, rel_path)
+            extracted += 1
+
+        with ThreadPoolExecutor(max(1, jobs)) as pool:
+            for name in matched:
+                rel_path = self.output_path(name)
+                abs_path = os.path.join(out_dir, rel_path)
+                meta = [self.toc[name][2]]
+                # 增量模式：同一归档只比元数据，不读成员；归档变了再比压缩数据的 CRC
+                if manifest is not None and manifest.check(name, meta):
+                    continue
+                data = self.read_raw(name)
+                crc = None
+                if manifest is not None:
+                    crc = zlib.crc32(data)
+                    if manifest.check(name, meta, crc):
+                        continue
+
+                pending.append((name, meta, crc, rel_path, pool.submit(self._write_member, abs_path, data, header, store)))
+                # 限制在途成员数，避免读取远快于解密时把整个归档读进内存
+                if len(pending) >= 4 * max(1, jobs):
+                    finish(*pending.popleft())
+            for item in pending:
+                finish(*item)
+        return extracted, encrypted
+
+    def extract_member(self, name: str, out_dir: str, store: Optional[ContentStore] = None) -> Optional[str]:
+        # 解出单个成员，返回 .pyc 路径；无法解密的成员原样写出 .encrypted 并返回 None
+        abs_path = os.path.join(out_dir, self.output_path(name))
+        return abs_path if self._write_member(abs_path, self.read_raw(name), self.pyc_header(), store) else None
+
+    def _write_member(self, abs_path: str, data, header: bytes, store: Optional[ContentStore]) -> bool:
+        with instrument.span('pyz_unpack', abs_path, bytes_read=len(data)) as attrs:
+            os.makedirs(os.path.dirname(abs_path), exist_ok=True)
             try:
-                data = zlib.decompress(data)
-            except Exception:
-                with open(abs_path + '.encrypted', 'wb') as w:
+                with instrument.span('decompress', abs_path):
+                    data = pyz_crypto.inflate(data, self.cipher)
+            except zlib.error:
+                attrs['encrypted'] = True
+                with _open_output(abs_path + '.encrypted', store) as w:
                     w.write(data)
-                continue
-
-            # Prepend pyc header (pyinstxtractor behavior)
-            with open(abs_path, 'wb') as w:
-                w.write(pyc_magic)
-                # PEP 552 deterministic pycs header fields
-                w.write(b'\0' * 4)
-                w.write(b'\0' * 8)
+                return False
+            with _open_output(abs_path, store) as w:
+                w.write(header)
                 w.write(data)
+            return True
+
+
+def _open_output(path: str, store: Optional[ContentStore]):
+    # 指定对象库时输出为指向去重对象的硬链接
+    if store is not None:
+        return store.writer(path)
+    # 之前 --store 运行留下的可能是指向共享对象的硬链接，先删除再写，避免改写对象库
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+    return open(path, 'wb')
+
+
+def extract_pyz(pyz_path: str, out_dir: str, pattern: str = '*', store: Optional[ContentStore] = None,
+                incremental: bool = False, jobs: int = 1, key: Optional[bytes] = None) -> None:
+    manifest = ExtractManifest(out_dir, pyz_path) if incremental else None
+    with PyzArchive(pyz_path) as pyz:
+        try:
+            cipher = pyz.load_key(key)
+        except (ValueError, RuntimeError) as e:
+            # 没有可用的 AES 实现或密钥不对：照旧把加密成员原样写出
+            print(f'[!] Cannot decrypt {pyz_path}: {e}')
+        else:
+            if cipher is not None:
+                print(f'Encrypted PYZ: decrypting members with AES-{cipher.mode.upper()}')
+        extracted, encrypted = pyz.extract(pattern, out_dir, store, manifest, jobs)
+    if encrypted:
+        print(f'{encrypted} member(s) could not be decrypted, written as .encrypted')
+    if manifest is not None:
+        removed = manifest.remove_stale()
+        manifest.save(pyz.pyc_magic)
+        print(f'Incremental: {len(manifest.current)} entries tracked, {removed} stale outputs removed')
 
 
 def main() -> None:
-    if len(sys.argv) < 2:
-        print('Usage: extract_pyz.py <PYZ file> [output_dir]')
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description='Extract modules from a PyInstaller PYZ archive')
+    parser.add_argument('pyz_path')
+    parser.add_argument('out_dir', nargs='?')
+    parser.add_argument('--match', default='*', help='only extract modules matching this glob, e.g. "api.*" or "services/*"')
+    parser.add_argument('--list', action='store_true', help='list module names instead of extracting')
+    parser.add_argument('--store', help='content-addressed store directory; outputs become hardlinks into it')
+    parser.add_argument('--incremental', action='store_true', help='skip members unchanged since the last run')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1, help='threads decrypting and inflating members')
+    parser.add_argument('--key', help='AES key given to PyInstaller --key (default: read pyimod00_crypto_key)')
+    parser.add_argument('--key-pyc', help='path of an extracted pyimod00_crypto_key.pyc')
+    args = parser.parse_args()
+
+    if args.list:
+        with PyzArchive(args.pyz_path) as pyz:
+            for name in pyz.match(args.match):
+                print(name)
+        return
 
-    pyz_path = sys.argv[1]
-    out_dir = sys.argv[2] if len(sys.argv) > 2 else os.path.splitext(pyz_path)[0] + '_extracted'
+    out_dir = args.out_dir or os.path.splitext(args.pyz_path)[0] + '_extracted'
     os.makedirs(out_dir, exist_ok=True)
-    extract_pyz(pyz_path, out_dir)
-    print(f'Extracted: {pyz_path} -> {out_dir}')
+    key = pyz_crypto.key_from_pyc(args.key_pyc) if args.key_pyc else args.key.encode('utf-8') if args.key else None
+    extract_pyz(args.pyz_path, out_dir, args.match, ContentStore(args.store) if args.store else None,
+                args.incremental, args.jobs, key)
+    print(f'Extracted: {args.pyz_path} -> {out_dir}')
 
 
 if __name__ == '__main__':
     main()
-
-
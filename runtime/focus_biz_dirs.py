@@ -1,11 +1,17 @@
 import os
 import shutil
-import subprocess
-from typing import List, Tuple
+from typing import List, Optional, Tuple
+
+import instrument
+from decompile_cache import DecompileCache, default_cache
+from extract_pyz import PyzArchive
+from job_ledger import JobLedger, open_ledger
+from pycdc_runner import run_pycdc_many
 
 
 SRC_TREE = '/tmp/百世_src'
 PYC_TREE = '/tmp/百世_extracted/PYZ-00_extracted'
+PYZ_PATH = '/tmp/百世_extracted/PYZ-00.pyz'
 OUT_ROOT = '/tmp/百世_focus'
 PYCDC = '/tmp/pycdc/build/pycdc'
 TARGET_DIRS = ['api', 'services']
@@ -15,17 +21,19 @@ def ensure_dir(path: str) -> None:
     os.makedirs(path, exist_ok=True)
 
 
-def decompile_pyc(pyc_path: str) -> Tuple[bool, bytes, bytes]:
-    res = subprocess.run([PYCDC, pyc_path], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    return res.returncode == 0 and bool(res.stdout), res.stdout, res.stderr
-
-
-def process_dir(name: str) -> Tuple[int, int, int]:
+def process_dir(name: str, cache: Optional[DecompileCache] = None,
+                ledger: Optional[JobLedger] = None) -> Tuple[int, int, int]:
     src_dir = os.path.join(SRC_TREE, name)
     pyc_dir = os.path.join(PYC_TREE, name)
     out_dir = os.path.join(OUT_ROOT, name)
     ensure_dir(out_dir)
 
+    # PYC 树不存在时，只从 PYZ 中按需解出目标包，无需展开整个归档
+    if not os.path.isdir(pyc_dir) and os.path.isfile(PYZ_PATH):
+        with PyzArchive(PYZ_PATH) as pyz:
+            pyz.extract(name, PYC_TREE)
+            pyz.extract(f'{name}.*', PYC_TREE)
+
     copied_py = 0
     decompiled_ok = 0
     fallback_pyc = 0
@@ -44,6 +52,7 @@ def process_dir(name: str) -> Tuple[int, int, int]:
                 copied_py += 1
 
     # 2) 针对缺失的 .py，尝试用 pycdc 从 .pyc 反编译
+    pending: List[Tuple[str, str]] = []
     if os.path.isdir(pyc_dir):
         for base, _, files in os.walk(pyc_dir):
             for fn in files:
@@ -56,38 +65,51 @@ def process_dir(name: str) -> Tuple[int, int, int]:
                 if os.path.exists(out_py):
                     continue
                 ensure_dir(os.path.dirname(out_py))
-                ok, stdout, stderr = decompile_pyc(pyc_path)
-                if ok:
-                    with open(out_py, 'wb') as w:
-                        w.write(stdout)
-                    decompiled_ok += 1
-                else:
-                    # 3) 反编译失败则附带 .pyc 与失败说明
-                    fallback = out_py + '.pyc'
-                    shutil.copy2(pyc_path, fallback)
-                    with open(out_py + '.FAILED.txt', 'wb') as w:
-                        w.write(stderr or b'empty output')
-                    fallback_pyc += 1
+                pending.append((pyc_path, out_py))
+
+    # 整个目录的 pycdc 调用并发执行，而不是逐个串行
+    with instrument.span('pycdc', name, files=len(pending)):
+        results = run_pycdc_many([pyc_path for pyc_path, _ in pending], pycdc=PYCDC, cache=cache)
+    for pyc_path, out_py in pending:
+        res = results[pyc_path]
+        if ledger is not None:
+            ledger.record(out_py, pyc_path, 'pycdc', 'ok' if res.ok else 'timeout' if res.timed_out else 'failed',
+                          res.seconds, '' if res.ok else res.stderr.decode('utf-8', 'replace'))
+        if res.ok:
+            with open(out_py, 'wb') as w:
+                w.write(res.stdout)
+            decompiled_ok += 1
+        else:
+            # 3) 反编译失败则附带 .pyc 与失败说明
+            fallback = out_py + '.pyc'
+            shutil.copy2(pyc_path, fallback)
+            with open(out_py + '.FAILED.txt', 'wb') as w:
+                w.write(res.stderr or b'empty output')
+            fallback_pyc += 1
 
     return copied_py, decompiled_ok, fallback_pyc
 
 
 def main() -> None:
     ensure_dir(OUT_ROOT)
+    cache = default_cache()
     summary_lines: List[str] = []
     total_copied = total_decompiled = total_fallback = 0
-    for name in TARGET_DIRS:
-        c, d, f = process_dir(name)
-        total_copied += c
-        total_decompiled += d
-        total_fallback += f
-        summary_lines.append(f'{name}: copied_py={c}, decompiled_ok={d}, fallback_pyc={f}')
+    with open_ledger('focus_biz_dirs') as ledger:
+        for name in TARGET_DIRS:
+            c, d, f = process_dir(name, cache, ledger)
+            total_copied += c
+            total_decompiled += d
+            total_fallback += f
+            summary_lines.append(f'{name}: copied_py={c}, decompiled_ok={d}, fallback_pyc={f}')
 
     with open(os.path.join(OUT_ROOT, '_SUMMARY.txt'), 'w', encoding='utf-8') as w:
         w.write('\n'.join(summary_lines) + '\n')
         w.write(f'TOTAL copied_py={total_copied}, decompiled_ok={total_decompiled}, fallback_pyc={total_fallback}\n')
 
     print(f'Done. OUT={OUT_ROOT}; TOTAL copied={total_copied}, decompiled={total_decompiled}, fallback={total_fallback}')
+    if cache is not None:
+        print(f'Cache: {cache.hits} hit(s), {cache.misses} miss(es), {cache.evict()} entries evicted')
 
 
 if __name__ == '__main__':
@@ -0,0 +1,356 @@
+import os
+import ast
+import zlib
+import sqlite3
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import instrument
+import marshal_lite
+from extract_pyz import PyzArchive
+from pyc_inspect import iter_imports, magic_number, read_pyc
+
+
+SRC_TREE = '/tmp/百世_src'
+MAIN_PY = '/tmp/百世_main/main.py'
+PYZ_PATH = '/tmp/百世_extracted/PYZ-00.pyz'
+MAIN_PYC = '/tmp/百世_extracted/main.pyc'
+GRAPH_DB = '/tmp/百世_import_graph.db'
+SCHEMA_VERSION = 2
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS modules (
+    name TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    stamp TEXT,
+    sha256 TEXT,
+    ok INTEGER NOT NULL DEFAULT 1
+);
+CREATE TABLE IF NOT EXISTS imports (
+    importer TEXT NOT NULL,
+    target TEXT NOT NULL,
+    PRIMARY KEY (importer, target)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS imports_target ON imports (target);
+'''
+
+# 从 root 出发沿 imports 走到的所有已知模块；目标必须在 modules 中存在
+CLOSURE_SQL = '''
+WITH RECURSIVE reach(name) AS (
+    SELECT name FROM modules WHERE name = ?
+    UNION
+    SELECT i.target FROM imports i JOIN reach r ON i.importer = r.name JOIN modules m ON m.name = i.target
+)
+SELECT name FROM reach ORDER BY name
+'''
+
+IMPORTERS_SQL = '''
+WITH RECURSIVE rev(name) AS (
+    SELECT ?
+    UNION
+    SELECT i.importer FROM imports i JOIN rev r ON i.target = r.name
+)
+SELECT name FROM rev WHERE name != ? ORDER BY name
+'''
+
+# (模块路径, 模块名, 是否为包, 旧哈希) -> (新哈希, 导入列表或 None, 是否解析成功)
+ScanTask = Tuple[str, str, bool, Optional[str]]
+ScanResult = Tuple[str, Optional[List[str]], bool]
+
+
+def import_candidates(imports: Iterable[Tuple[str, int, Tuple[str, ...]]], module: str,
+                      is_package: bool) -> List[str]:
+    """Turn ``(module, level, fromlist)`` imports into absolute module names.
+
+    Relative imports are resolved against ``module``; ``import a.b.c`` also
+    yields ``a`` and ``a.b`` since their ``__init__`` runs first, and
+    ``from a import b`` yields ``a.b`` in case ``b`` is a submodule.
+    """
+    package = module if is_package else module.rpartition('.')[0]
+    found = set()
+    for name, level, fromlist in imports:
+        if level:
+            parts = package.split('.') if package else []
+            parts = parts[:len(parts) - (level - 1)] if level > 1 else parts
+            base = '.'.join(parts + ([name] if name else []))
+        else:
+            base = name
+        if not base:
+            continue
+        parts = base.split('.')
+        found.update('.'.join(parts[:i]) for i in range(1, len(parts) + 1))
+        found.update(f'{base}.{n}' for n in fromlist if n != '*')
+    found.discard(module)
+    return sorted(found)
+
+
+def scan_imports(source: bytes, module: str, is_package: bool) -> List[str]:
+    imports = []
+    for node in ast.walk(ast.parse(source)):
+        if isinstance(node, ast.Import):
+            imports.extend((alias.name, 0, ()) for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            imports.append((node.module or '', node.level, tuple(alias.name for alias in node.names)))
+    return import_candidates(imports, module, is_package)
+
+
+def _scan_task(task: ScanTask) -> ScanResult:
+    # 哈希未变时不再解析，导入列表为 None
+    path, module, is_package, old_sha = task
+    with open(path, 'rb') as f:
+        data = f.read()
+    sha = hashlib.sha256(data).hexdigest()
+    if sha == old_sha:
+        return sha, None, True
+    if path.endswith('.pyc'):
+        try:
+            code = read_pyc(path)
+            return sha, import_candidates(iter_imports(code, magic_number(data[:4])), module, is_package), True
+        except (marshal_lite.MarshalError, ValueError, IndexError):
+            return sha, [], False
+    try:
+        return sha, scan_imports(data, module, is_package), True
+    except (SyntaxError, ValueError):
+        return sha, [], False
+
+
+_PYZ: Dict[str, PyzArchive] = {}
+
+
+def _scan_pyz_task(task: ScanTask) -> ScanResult:
+    # path 形如 <pyz>:<成员名>；每个 worker 进程各自打开一次归档
+    path, module, is_package, old_sha = task
+    pyz_path, _, member = path.rpartition(':')
+    if pyz_path not in _PYZ:
+        _PYZ[pyz_path] = PyzArchive(pyz_path)
+    pyz = _PYZ[pyz_path]
+    raw = pyz.read_raw(member)
+    sha = hashlib.sha256(raw).hexdigest()
+    if sha == old_sha:
+        return sha, None, True
+    magic = magic_number(pyz.pyc_magic)
+    try:
+        code = marshal_lite.loads(zlib.decompress(raw), py2=marshal_lite.is_py2_magic(pyz.pyc_magic), magic=magic)
+        return sha, import_candidates(iter_imports(code, magic), module, is_package), True
+    except (zlib.error, marshal_lite.MarshalError, ValueError, IndexError):
+        # 加密成员或无法识别的字节码
+        return sha, [], False
+
+
+def _scan_any(task: ScanTask) -> ScanResult:
+    return _scan_task(task) if os.path.isfile(task[0]) else _scan_pyz_task(task)
+
+
+def walk_modules(src_root: str, suffix: str = '.py') -> Dict[str, Tuple[str, str]]:
+    # 模块名 -> (路径, 类型)；同名时优先级 package > module > namespace
+    found: Dict[str, Tuple[str, str]] = {}
+    rank = {'package': 0, 'module': 1, 'namespace': 2}
+
+    def put(name: str, path: str, kind: str) -> None:
+        if name not in found or rank[kind] < rank[found[name][1]]:
+            found[name] = (path, kind)
+
+    for base, _, files in os.walk(src_root):
+        rel = os.path.relpath(base, src_root)
+        prefix = '' if rel == '.' else rel.replace(os.sep, '.')
+        for fn in files:
+            if not fn.endswith(suffix):
+                continue
+            stem = fn[:-len(suffix)]
+            if stem == '__init__' and prefix:
+                put(prefix, os.path.join(base, fn), 'package')
+            else:
+                put(f'{prefix}.{stem}' if prefix else stem, os.path.join(base, fn), 'module')
+        if prefix:
+            put(prefix, base, 'namespace')
+    return found
+
+
+def _file_stamp(path: str) -> str:
+    st = os.stat(path)
+    return f'{st.st_size}:{st.st_mtime_ns}'
+
+
+class ImportGraph:
+    """Module -> imports graph, persisted in SQLite.
+
+    The graph can be built from a source tree, a tree of extracted pycs or a
+    PYZ archive directly; the bytecode sources need no decompilation. Updates
+    rescan only entries whose stamp (size and mtime, or the compressed bytes'
+    hash inside a PYZ) changed and reparse only those whose content hash
+    changed. Closure, reverse-dependency and reachability queries run as
+    recursive SQL over an indexed edge table. One database holds one graph:
+    every update replaces the module set with what it scanned.
+    """
+
+    def __init__(self, db_path: str = GRAPH_DB) -> None:
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path)
+        if self.conn.execute('PRAGMA user_version').fetchone()[0] != SCHEMA_VERSION:
+            self.conn.executescript('DROP TABLE IF EXISTS modules; DROP TABLE IF EXISTS imports;')
+            self.conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+        self.conn.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def __enter__(self) -> 'ImportGraph':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _sync(self, current: Dict[str, Tuple[str, str, Optional[str]]], jobs: int) -> Tuple[int, int, int]:
+        # current: 模块名 -> (路径, 类型, 戳)；返回 (重新解析, 戳变化, 删除) 数
+        known = {row[0]: row[1:] for row in self.conn.execute(
+            'SELECT name, path, kind, stamp, sha256 FROM modules')}
+        removed = [name for name in known if name not in current]
+        tasks: List[ScanTask] = []
+        stamps: Dict[str, Optional[str]] = {}
+        with self.conn:
+            for name in removed:
+                self.conn.execute('DELETE FROM modules WHERE name = ?', (name,))
+                self.conn.execute('DELETE FROM imports WHERE importer = ?', (name,))
+            for name, (path, kind, stamp) in current.items():
+                prev = known.get(name)
+                if kind == 'namespace':
+                    if prev is None or prev[:2] != (path, kind):
+                        self.conn.execute('DELETE FROM imports WHERE importer = ?', (name,))
+                        self.conn.execute('INSERT OR REPLACE INTO modules (name, path, kind) VALUES (?, ?, ?)',
+                                          (name, path, kind))
+                    continue
+                if prev is not None and prev[:3] == (path, kind, stamp):
+                    continue
+                stamps[name] = stamp
+                old_sha = prev[3] if prev is not None and prev[:2] == (path, kind) else None
+                tasks.append((path, name, kind == 'package', old_sha))
+
+            with instrument.span('scan_imports', files=len(tasks)):
+                if jobs > 1 and len(tasks) > 1:
+                    with ProcessPoolExecutor(jobs) as pool:
+                        results = list(pool.map(_scan_any, tasks, chunksize=32))
+                else:
+                    results = [_scan_any(task) for task in tasks]
+
+            reparsed = 0
+            for (path, name, is_package, _), (sha, targets, ok) in zip(tasks, results):
+                kind = 'package' if is_package else 'module'
+                self.conn.execute('INSERT OR REPLACE INTO modules (name, path, kind, stamp, sha256, ok) '
+                                  'VALUES (?, ?, ?, ?, ?, ?)', (name, path, kind, stamps[name], sha, int(ok)))
+                if targets is None:
+                    # 只是戳变了，内容哈希相同，沿用已有的边
+                    continue
+                reparsed += 1
+                self.conn.execute('DELETE FROM imports WHERE importer = ?', (name,))
+                self.conn.executemany('INSERT INTO imports (importer, target) VALUES (?, ?)',
+                                      ((name, target) for target in targets))
+        return reparsed, len(tasks), len(removed)
+
+    def update(self, src_root: str, extra: Optional[Dict[str, str]] = None,
+               jobs: int = os.cpu_count() or 1, suffix: str = '.py') -> Tuple[int, int, int]:
+        # extra: 树之外的入口模块，如 {'main': '/tmp/百世_main/main.py'}；suffix='.pyc' 时直接扫描字节码
+        current = {name: (path, kind, None if kind == 'namespace' else _file_stamp(path))
+                   for name, (path, kind) in walk_modules(src_root, suffix).items()}
+        for name, path in (extra or {}).items():
+            current[name] = (path, 'module', _file_stamp(path))
+        return self._sync(current, jobs)
+
+    def update_from_pyz(self, pyz_path: str, extra: Optional[Dict[str, str]] = None,
+                        jobs: int = os.cpu_count() or 1) -> Tuple[int, int, int]:
+        # 不解包、不反编译，直接从 PYZ 成员的字节码建图；extra 为入口 pyc，如 {'main': main.pyc}
+        pyz_path = os.path.abspath(pyz_path)
+        current: Dict[str, Tuple[str, str, Optional[str]]] = {}
+        with PyzArchive(pyz_path) as pyz:
+            for name, (typecode, pos, length) in pyz.toc.items():
+                kind = 'package' if typecode == 1 else 'module'
+                current[name] = (f'{pyz_path}:{name}', kind, f'{pos}:{length}:{zlib.crc32(pyz.read_raw(name))}')
+        for name, path in (extra or {}).items():
+            current[name] = (path, 'module', _file_stamp(path))
+        return self._sync(current, jobs)
+
+    def modules(self) -> List[str]:
+        return [row[0] for row in self.conn.execute('SELECT name FROM modules ORDER BY name')]
+
+    def path_of(self, module: str) -> Optional[str]:
+        row = self.conn.execute('SELECT path FROM modules WHERE name = ?', (module,)).fetchone()
+        return row[0] if row else None
+
+    def imports_of(self, module: str) -> List[str]:
+        return [row[0] for row in self.conn.execute(
+            'SELECT i.target FROM imports i JOIN modules m ON m.name = i.target WHERE i.importer = ? '
+            'ORDER BY i.target', (module,))]
+
+    def importers(self, module: str, transitive: bool = False) -> List[str]:
+        if transitive:
+            return [row[0] for row in self.conn.execute(IMPORTERS_SQL, (module, module))]
+        return [row[0] for row in self.conn.execute(
+            'SELECT importer FROM imports WHERE target = ? ORDER BY importer', (module,))]
+
+    def closure(self, root: str = 'main') -> List[str]:
+        return [row[0] for row in self.conn.execute(CLOSURE_SQL, (root,))]
+
+    def unreachable(self, root: str = 'main') -> List[str]:
+        reachable = set(self.closure(root))
+        # 包内模块可达时其父包的 __init__ 也会执行，视为可达
+        for name in list(reachable):
+            parts = name.split('.')
+            reachable.update('.'.join(parts[:i]) for i in range(1, len(parts)))
+        return [name for name in self.modules() if name not in reachable]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Persistent import graph of the recovered app')
+    parser.add_argument('--db', default=GRAPH_DB)
+    sub = parser.add_subparsers(dest='cmd', required=True)
+    p = sub.add_parser('update', help='rescan the source tree, reparsing only changed files')
+    p.add_argument('--src', default=SRC_TREE)
+    p.add_argument('--main', default=MAIN_PY, help='entry script registered as module "main"')
+    p.add_argument('--jobs', type=int, default=os.cpu_count() or 1)
+    p = sub.add_parser('update-bytecode', help='build the graph from bytecode, without decompiling')
+    p.add_argument('--pyz', default=PYZ_PATH, help='PYZ archive, read in place')
+    p.add_argument('--pyc-tree', help='scan a tree of extracted .pyc files instead of the PYZ')
+    p.add_argument('--main', default=MAIN_PYC, help='entry pyc registered as module "main"')
+    p.add_argument('--jobs', type=int, default=os.cpu_count() or 1)
+    p = sub.add_parser('importers', help='modules that import MODULE')
+    p.add_argument('module')
+    p.add_argument('--transitive', action='store_true')
+    p = sub.add_parser('imports', help='modules imported by MODULE')
+    p.add_argument('module')
+    p = sub.add_parser('closure', help='modules transitively imported from ROOT')
+    p.add_argument('root', nargs='?', default='main')
+    p = sub.add_parser('unreachable', help='modules not reachable from ROOT')
+    p.add_argument('root', nargs='?', default='main')
+    sub.add_parser('stats')
+    args = parser.parse_args()
+
+    with ImportGraph(args.db) as graph:
+        if args.cmd in ('update', 'update-bytecode'):
+            extra = {'main': args.main} if args.main and os.path.isfile(args.main) else None
+            if args.cmd == 'update':
+                counts = graph.update(args.src, extra, args.jobs)
+            elif args.pyc_tree:
+                counts = graph.update(args.pyc_tree, extra, args.jobs, suffix='.pyc')
+            else:
+                counts = graph.update_from_pyz(args.pyz, extra, args.jobs)
+            reparsed, scanned, removed = counts
+            print(f'Scanned {scanned} changed entries, reparsed {reparsed}, removed {removed} module(s)')
+        elif args.cmd == 'importers':
+            print('\n'.join(graph.importers(args.module, args.transitive)))
+        elif args.cmd == 'imports':
+            print('\n'.join(graph.imports_of(args.module)))
+        elif args.cmd == 'closure':
+            print('\n'.join(graph.closure(args.root)))
+        elif args.cmd == 'unreachable':
+            print('\n'.join(graph.unreachable(args.root)))
+        else:
+            modules = graph.conn.execute('SELECT COUNT(*) FROM modules').fetchone()[0]
+            edges = graph.conn.execute('SELECT COUNT(*) FROM imports').fetchone()[0]
+            failed = graph.conn.execute('SELECT COUNT(*) FROM modules WHERE ok = 0').fetchone()[0]
+            print(f'Modules: {modules}, import edges: {edges}, unparsed: {failed}, db: {args.db}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,234 @@
+import os
+import sys
+import json
+import time
+import atexit
+import argparse
+import threading
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+METRICS_DIR = os.environ.get('RUNTIME_METRICS_DIR', '')  # 为空时不记录，开销只有一次函数调用
+BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 120.0)  # 反编译耗时直方图的上界（秒）
+SUMMARY_TOP = 10
+
+
+class _Span:
+    __slots__ = ('recorder', 'stage', 'file', 'attrs', 'start')
+
+    def __init__(self, recorder: 'Recorder', stage: str, file: Optional[str], attrs: dict) -> None:
+        self.recorder = recorder
+        self.stage = stage
+        self.file = file
+        self.attrs = attrs
+
+    def __enter__(self) -> dict:
+        self.start = time.perf_counter()
+        return self.attrs
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is not None:
+            self.attrs['error'] = exc_type.__name__
+        self.recorder.add(self.stage, time.perf_counter() - self.start, self.file, **self.attrs)
+
+
+class _NullSpan:
+    def __enter__(self) -> dict:
+        return {}
+
+    def __exit__(self, *exc) -> None:
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Recorder:
+    """Collects timing spans per stage and per file for one script run.
+
+    A span is a stage name, an optional file, its wall time and free-form
+    attributes such as ``bytes_read``, ``decompiler`` or ``retry``. Spans are
+    kept in memory and written out as JSON plus Prometheus text on exit;
+    ``report`` merges the files of a whole nightly run.
+    """
+
+    def __init__(self, script: str, out_dir: str = '') -> None:
+        self.script = script
+        self.out_dir = out_dir
+        self.pid = os.getpid()
+        self.started = time.time()
+        self.spans: List[dict] = []
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.out_dir)
+
+    def span(self, stage: str, file: Optional[str] = None, **attrs):
+        # with recorder.span('decompile', path) as attrs: attrs['decompiler'] = ...
+        if not self.out_dir:
+            return _NULL_SPAN
+        return _Span(self, stage, file, attrs)
+
+    def add(self, stage: str, seconds: float, file: Optional[str] = None, **attrs) -> None:
+        if not self.out_dir:
+            return
+        span = {'stage': stage, 'seconds': seconds, 'script': self.script}
+        if file is not None:
+            span['file'] = file
+        span.update(attrs)
+        with self._lock:
+            self.spans.append(span)
+
+    def export(self) -> Optional[str]:
+        # 进程池 worker 由 fork 继承了记录器，只在创建它的进程里导出
+        if not self.out_dir or os.getpid() != self.pid or not self.spans:
+            return None
+        os.makedirs(self.out_dir, exist_ok=True)
+        base = os.path.join(self.out_dir, f'{self.script}.{self.pid}')
+        with open(base + '.json', 'w', encoding='utf-8') as w:
+            json.dump({'script': self.script, 'pid': self.pid, 'started': self.started,
+                       'finished': time.time(), 'spans': self.spans}, w, ensure_ascii=False)
+        with open(base + '.prom', 'w', encoding='utf-8') as w:
+            w.write(prometheus_text(self.spans))
+        print(summary(self.spans), file=sys.stderr)
+        print(f'Metrics: {base}.json', file=sys.stderr)
+        return base
+
+
+def _script_name() -> str:
+    name = os.path.basename(sys.argv[0]) if sys.argv and sys.argv[0] else 'python'
+    return name[:-3] if name.endswith('.py') else name
+
+
+_RECORDER = Recorder(_script_name(), METRICS_DIR)
+if _RECORDER.enabled:
+    atexit.register(_RECORDER.export)
+
+
+def recorder() -> Recorder:
+    return _RECORDER
+
+
+def span(stage: str, file: Optional[str] = None, **attrs):
+    return _RECORDER.span(stage, file, **attrs)
+
+
+def add(stage: str, seconds: float, file: Optional[str] = None, **attrs) -> None:
+    _RECORDER.add(stage, seconds, file, **attrs)
+
+
+def enabled() -> bool:
+    return _RECORDER.enabled
+
+
+def _label(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels) -> str:
+    return '{' + ','.join(f'{k}="{_label(v)}"' for k, v in labels.items()) + '}'
+
+
+def prometheus_text(spans: Iterable[dict]) -> str:
+    """Render spans as Prometheus exposition text (counters per stage, one histogram per decompiler)."""
+    stage_seconds: Dict[Tuple[str, str], float] = defaultdict(float)
+    stage_count: Dict[Tuple[str, str], int] = defaultdict(int)
+    stage_bytes: Dict[Tuple[str, str], int] = defaultdict(int)
+    retries: Dict[str, int] = defaultdict(int)
+    hist: Dict[str, List[int]] = defaultdict(lambda: [0] * len(BUCKETS))
+    hist_sum: Dict[str, float] = defaultdict(float)
+    hist_count: Dict[str, int] = defaultdict(int)
+    for s in spans:
+        key = (s.get('script', ''), s['stage'])
+        stage_seconds[key] += s['seconds']
+        stage_count[key] += 1
+        stage_bytes[key] += s.get('bytes_read', 0)
+        if s.get('retry'):
+            retries[s.get('script', '')] += 1
+        if 'decompiler' in s:
+            tool = s['decompiler'] or 'none'
+            for i, bound in enumerate(BUCKETS):
+                if s['seconds'] <= bound:
+                    hist[tool][i] += 1
+            hist_sum[tool] += s['seconds']
+            hist_count[tool] += 1
+
+    lines = ['# HELP runtime_stage_seconds_total Wall time spent in each stage.',
+             '# TYPE runtime_stage_seconds_total counter']
+    lines += [f'runtime_stage_seconds_total{_labels(script=sc, stage=st)} {v:.6f}'
+              for (sc, st), v in sorted(stage_seconds.items())]
+    lines += ['# HELP runtime_stage_spans_total Number of spans (files or phases) per stage.',
+              '# TYPE runtime_stage_spans_total counter']
+    lines += [f'runtime_stage_spans_total{_labels(script=sc, stage=st)} {v}'
+              for (sc, st), v in sorted(stage_count.items())]
+    lines += ['# HELP runtime_stage_bytes_read_total Bytes read per stage.',
+              '# TYPE runtime_stage_bytes_read_total counter']
+    lines += [f'runtime_stage_bytes_read_total{_labels(script=sc, stage=st)} {v}'
+              for (sc, st), v in sorted(stage_bytes.items()) if v]
+    lines += ['# HELP runtime_retries_total Decompile attempts on files that already had an outcome.',
+              '# TYPE runtime_retries_total counter']
+    lines += [f'runtime_retries_total{_labels(script=sc)} {v}' for sc, v in sorted(retries.items())]
+    lines += ['# HELP runtime_decompile_seconds Per-file decompile latency by decompiler.',
+              '# TYPE runtime_decompile_seconds histogram']
+    for tool in sorted(hist):
+        for bound, n in zip(BUCKETS, hist[tool]):
+            lines.append(f'runtime_decompile_seconds_bucket{_labels(decompiler=tool, le=bound)} {n}')
+        lines.append(f'runtime_decompile_seconds_bucket{_labels(decompiler=tool, le="+Inf")} {hist_count[tool]}')
+        lines.append(f'runtime_decompile_seconds_sum{_labels(decompiler=tool)} {hist_sum[tool]:.6f}')
+        lines.append(f'runtime_decompile_seconds_count{_labels(decompiler=tool)} {hist_count[tool]}')
+    return '\n'.join(lines) + '\n'
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    return values[min(len(values) - 1, int(len(values) * pct))] if values else 0.0
+
+
+def summary(spans: List[dict], top: int = SUMMARY_TOP) -> str:
+    by_stage: Dict[str, List[float]] = defaultdict(list)
+    by_tool: Dict[str, List[float]] = defaultdict(list)
+    for s in spans:
+        by_stage[s['stage']].append(s['seconds'])
+        if 'decompiler' in s:
+            by_tool[s['decompiler'] or 'none'].append(s['seconds'])
+    lines = ['Stages: ' + ', '.join(f'{stage}={sum(v):.2f}s/{len(v)}'
+                                    for stage, v in sorted(by_stage.items(), key=lambda item: -sum(item[1])))]
+    for tool, values in sorted(by_tool.items()):
+        values.sort()
+        lines.append(f'  {tool}: n={len(values)}, p50={_percentile(values, 0.5):.2f}s, '
+                     f'p90={_percentile(values, 0.9):.2f}s, max={values[-1]:.2f}s')
+    files = sorted((s for s in spans if 'file' in s), key=lambda s: s['seconds'], reverse=True)[:top]
+    for s in files:
+        lines.append(f'  slowest {s["stage"]}: {s["seconds"]:.2f}s {s["file"]}')
+    return '\n'.join(lines)
+
+
+def load_spans(paths: Iterable[str]) -> List[dict]:
+    spans: List[dict] = []
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            spans.extend(json.load(f)['spans'])
+    return spans
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Merge the metrics written by runtime scripts run with '
+                                                 'RUNTIME_METRICS_DIR set')
+    parser.add_argument('metrics_dir', nargs='?', default=METRICS_DIR or '.')
+    parser.add_argument('--prom', help='write the merged Prometheus text here (default: <dir>/metrics.prom)')
+    parser.add_argument('--top', type=int, default=SUMMARY_TOP, help='number of slowest files to list')
+    args = parser.parse_args()
+
+    paths = sorted(os.path.join(args.metrics_dir, fn) for fn in os.listdir(args.metrics_dir) if fn.endswith('.json'))
+    spans = load_spans(paths)
+    prom = args.prom or os.path.join(args.metrics_dir, 'metrics.prom')
+    with open(prom, 'w', encoding='utf-8') as w:
+        w.write(prometheus_text(spans))
+    print(f'Runs: {len(paths)}, spans: {len(spans)}')
+    print(summary(spans, args.top))
+    print(f'Prometheus: {prom}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,186 @@
+import sys
+import time
+import sqlite3
+import argparse
+from typing import List, NamedTuple, Optional, Set
+
+import instrument
+
+
+LEDGER_PATH = '/tmp/百世_jobs.db'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY,
+    script TEXT NOT NULL,
+    args TEXT,
+    started REAL NOT NULL,
+    finished REAL
+);
+CREATE TABLE IF NOT EXISTS outcomes (
+    id INTEGER PRIMARY KEY,
+    run_id INTEGER NOT NULL,
+    py_path TEXT NOT NULL,
+    pyc_path TEXT,
+    tool TEXT,
+    status TEXT NOT NULL,
+    seconds REAL,
+    detail TEXT,
+    ts REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS outcomes_path ON outcomes (py_path, id);
+CREATE TABLE IF NOT EXISTS coverage (
+    prefix TEXT NOT NULL,
+    run_id INTEGER NOT NULL,
+    ts REAL NOT NULL
+);
+'''
+
+# 每个文件只看最新一条记录（SQLite 中 MAX() 聚合时其余列取自该行）
+LATEST_SQL = '''
+SELECT MAX(id), run_id, py_path, pyc_path, tool, status, seconds, detail, ts
+FROM outcomes {where} GROUP BY py_path
+'''
+
+
+class Outcome(NamedTuple):
+    id: int
+    run_id: int
+    py_path: str
+    pyc_path: Optional[str]
+    tool: Optional[str]
+    status: str
+    seconds: Optional[float]
+    detail: Optional[str]
+    ts: float
+
+
+class JobLedger:
+    """Append-only record of per-file decompile outcomes shared by the runtime scripts.
+
+    Every attempt is one row (file, tool, status, timing) written as it
+    finishes, so an interrupted run loses nothing already done. The latest
+    row per file is the file's current state: retries and resumes query it
+    instead of walking the tree for ``.FAILED.txt`` sidecars, once a run has
+    marked the tree complete (``mark_complete``). The database runs in WAL
+    mode so several scripts can write to it at once.
+    """
+
+    def __init__(self, path: str = LEDGER_PATH, script: Optional[str] = None) -> None:
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SCHEMA)
+        self.run_id: Optional[int] = None
+        if script is not None:
+            self.start_run(script)
+
+    def close(self) -> None:
+        if self.run_id is not None:
+            with self.conn:
+                self.conn.execute('UPDATE runs SET finished = ? WHERE run_id = ?', (time.time(), self.run_id))
+        self.conn.close()
+
+    def __enter__(self) -> 'JobLedger':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def start_run(self, script: str, args: Optional[str] = None) -> int:
+        with self.conn:
+            cur = self.conn.execute('INSERT INTO runs (script, args, started) VALUES (?, ?, ?)',
+                                    (script, args if args is not None else ' '.join(sys.argv[1:]), time.time()))
+        self.run_id = cur.lastrowid
+        return self.run_id
+
+    def record(self, py_path: str, pyc_path: Optional[str], tool: Optional[str], status: str,
+               seconds: Optional[float] = None, detail: str = '') -> None:
+        # status: ok / failed / timeout / missing；逐条提交，WAL 下代价很小，中断也不丢记录
+        if instrument.enabled():
+            # 该文件之前已有记录即算一次重试
+            retry = self.conn.execute('SELECT 1 FROM outcomes WHERE py_path = ? LIMIT 1', (py_path,)).fetchone()
+            instrument.add('decompile', seconds or 0.0, py_path, decompiler=tool or 'none', status=status,
+                           retry=retry is not None)
+        with self.conn:
+            self.conn.execute(
+                'INSERT INTO outcomes (run_id, py_path, pyc_path, tool, status, seconds, detail, ts) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (self.run_id or 0, py_path, pyc_path, tool, status, seconds, detail[:2000], time.time()))
+
+    def latest(self, status: Optional[str] = None, exclude_status: Optional[str] = None,
+               prefix: Optional[str] = None) -> List[Outcome]:
+        rows = [Outcome(*row) for row in self.conn.execute(
+            LATEST_SQL.format(where='WHERE py_path >= ? AND py_path < ?' if prefix else ''),
+            (prefix, prefix + '\uffff') if prefix else ())]
+        if status is not None:
+            rows = [r for r in rows if r.status == status]
+        if exclude_status is not None:
+            rows = [r for r in rows if r.status != exclude_status]
+        return rows
+
+    def has_records(self, prefix: str) -> bool:
+        return self.conn.execute('SELECT 1 FROM outcomes WHERE py_path >= ? AND py_path < ? LIMIT 1',
+                                 (prefix, prefix + '\uffff')).fetchone() is not None
+
+    def mark_complete(self, prefix: str) -> None:
+        # 本次运行为 prefix 下的每个文件都写了记录；中断或只处理部分模块的运行不要调用
+        with self.conn:
+            self.conn.execute('INSERT INTO coverage (prefix, run_id, ts) VALUES (?, ?, ?)',
+                              (prefix, self.run_id or 0, time.time()))
+
+    def covers(self, prefix: str) -> bool:
+        # 有完整跑完的运行覆盖 prefix（或其上级目录）时，账本之外没有漏掉的文件
+        return any(prefix.startswith(p) for (p,) in self.conn.execute('SELECT DISTINCT prefix FROM coverage'))
+
+    def failures(self, prefix: Optional[str] = None) -> List[Outcome]:
+        # 最新一次尝试仍未成功的文件
+        return self.latest(exclude_status='ok', prefix=prefix)
+
+    def succeeded(self, prefix: Optional[str] = None) -> Set[str]:
+        return {r.py_path for r in self.latest(status='ok', prefix=prefix)}
+
+    def history(self, py_path: str) -> List[Outcome]:
+        return [Outcome(*row) for row in self.conn.execute(
+            'SELECT id, run_id, py_path, pyc_path, tool, status, seconds, detail, ts FROM outcomes '
+            'WHERE py_path = ? ORDER BY id', (py_path,))]
+
+
+def open_ledger(script: str) -> JobLedger:
+    return JobLedger(LEDGER_PATH, script)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Query the decompile job ledger')
+    parser.add_argument('--db', default=LEDGER_PATH)
+    sub = parser.add_subparsers(dest='cmd', required=True)
+    p = sub.add_parser('failures', help='files whose latest attempt did not succeed')
+    p.add_argument('--prefix')
+    p = sub.add_parser('history', help='every attempt for one file')
+    p.add_argument('py_path')
+    sub.add_parser('runs')
+    sub.add_parser('stats')
+    args = parser.parse_args()
+
+    with JobLedger(args.db) as ledger:
+        if args.cmd == 'failures':
+            for r in ledger.failures(args.prefix):
+                print(f'{r.status}\t{r.tool or "-"}\t{r.py_path}\t{(r.detail or "").splitlines()[0] if r.detail else ""}')
+        elif args.cmd == 'history':
+            for r in ledger.history(args.py_path):
+                print(f'run={r.run_id}\t{r.status}\t{r.tool or "-"}\t{r.seconds or 0:.2f}s')
+        elif args.cmd == 'runs':
+            for run_id, script, run_args, started, finished in ledger.conn.execute(
+                    'SELECT run_id, script, args, started, finished FROM runs ORDER BY run_id'):
+                took = f'{finished - started:.1f}s' if finished else 'interrupted'
+                print(f'{run_id}\t{script}\t{took}\t{run_args or ""}')
+        else:
+            counts = {}
+            for r in ledger.latest():
+                counts[r.status] = counts.get(r.status, 0) + 1
+            print(', '.join(f'{status}={n}' for status, n in sorted(counts.items())) or 'empty')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,204 @@
+import struct
+from typing import Any, List, NamedTuple, Optional
+
+
+class MarshalError(ValueError):
+    pass
+
+
+FLAG_REF = 0x80
+
+
+class Code(NamedTuple):
+    # 与宿主版本无关的 code 对象摘要，只保留分析所需字段
+    name: str
+    qualname: str
+    filename: str
+    firstlineno: int
+    flags: int
+    code: bytes
+    consts: tuple
+    names: tuple
+
+
+class _Reader:
+    def __init__(self, data, py2: bool, magic: Optional[int] = None) -> None:
+        self.data = memoryview(data)
+        self.pos = 0
+        self.py2 = py2
+        self.magic = magic
+        self.refs: List[Any] = []      # FLAG_REF 对象表（marshal 版本 3+）
+        self.interned: List[bytes] = []  # Python 2 的 't'/'R' 驻留字符串表
+
+    def take(self, size: int) -> memoryview:
+        if size < 0 or self.pos + size > len(self.data):
+            raise MarshalError('marshal data too short')
+        chunk = self.data[self.pos:self.pos + size]
+        self.pos += size
+        return chunk
+
+    def byte(self) -> int:
+        return self.take(1)[0]
+
+    def int32(self) -> int:
+        return struct.unpack('<i', self.take(4))[0]
+
+    def size(self) -> int:
+        n = self.int32()
+        if n < 0:
+            raise MarshalError('bad marshal size')
+        return n
+
+    def reserve(self, flag: int) -> int:
+        # 容器先占位再读取子对象，与 CPython 中 R_REF 的编号顺序一致
+        if not flag:
+            return -1
+        self.refs.append(None)
+        return len(self.refs) - 1
+
+    def obj(self) -> Any:
+        code = self.byte()
+        flag = code & FLAG_REF
+        t = chr(code & ~FLAG_REF)
+
+        if t == 'r':
+            n = self.int32()
+            if not 0 <= n < len(self.refs) or self.refs[n] is None:
+                raise MarshalError('bad marshal back reference')
+            return self.refs[n]
+
+        if t in '([<>':
+            idx = self.reserve(flag)
+            n = self.size()
+            items = [self.obj() for _ in range(n)]
+            value = {'(': tuple, '[': list, '<': set, '>': frozenset}[t](items)
+        elif t == ')':
+            idx = self.reserve(flag)
+            n = self.byte()
+            value = tuple(self.obj() for _ in range(n))
+        elif t == '{':
+            idx = self.reserve(flag)
+            value = {}
+            while self.data[self.pos:self.pos + 1] != b'0':
+                key = self.obj()
+                value[key] = self.obj()
+            self.pos += 1
+        elif t == 'c':
+            idx = self.reserve(flag)
+            value = self.code()
+        else:
+            value = self.scalar(t)
+            idx = self.reserve(flag)
+
+        if idx >= 0:
+            self.refs[idx] = value
+        return value
+
+    def code(self) -> Code:
+        # 字段布局随版本变化：py2 / 3.0-3.7 / 3.8-3.10（posonlyargcount）/ 3.11+（localsplus）
+        if self.magic is None:
+            raise MarshalError('code objects need the pyc magic number')
+        if self.py2:
+            n_ints = 4
+        elif self.magic < 3410:  # 3410 = 3.8a1，PEP 570 加入 co_posonlyargcount
+            n_ints = 5
+        elif self.magic < 3450:
+            n_ints = 6
+        else:
+            n_ints = 5
+        flags = [self.int32() for _ in range(n_ints)][-1]
+        code = self.obj()
+        consts = self.obj()
+        names = self.obj()
+        if not self.py2 and self.magic >= 3450:
+            self.obj()  # co_localsplusnames
+            self.obj()  # co_localspluskinds
+            filename = self.obj()
+            name = self.obj()
+            qualname = self.obj()
+            firstlineno = self.int32()
+            self.obj()  # co_linetable
+            self.obj()  # co_exceptiontable
+        else:
+            self.obj()  # co_varnames
+            self.obj()  # co_freevars
+            self.obj()  # co_cellvars
+            filename = self.obj()
+            name = self.obj()
+            qualname = name
+            firstlineno = self.int32()
+            self.obj()  # co_lnotab
+        return Code(_text(name), _text(qualname), _text(filename), firstlineno, flags,
+                    bytes(code), tuple(consts), tuple(names))
+
+    def scalar(self, t: str) -> Any:
+        if t == 'N':
+            return None
+        if t == 'F':
+            return False
+        if t == 'T':
+            return True
+        if t == '.':
+            return Ellipsis
+        if t == 'S':
+            return StopIteration
+        if t == 'i':
+            return self.int32()
+        if t == 'I':
+            return struct.unpack('<q', self.take(8))[0]
+        if t == 'l':
+            n = self.int32()
+            value = 0
+            for i, (digit,) in enumerate(struct.iter_unpack('<H', self.take(abs(n) * 2))):
+                value |= digit << (15 * i)
+            return -value if n < 0 else value
+        if t == 'g':
+            return struct.unpack('<d', self.take(8))[0]
+        if t == 'f':
+            return float(bytes(self.take(self.byte())).decode('ascii'))
+        if t == 'y':
+            real, imag = struct.unpack('<dd', self.take(16))
+            return complex(real, imag)
+        if t == 'x':
+            real = float(bytes(self.take(self.byte())).decode('ascii'))
+            return complex(real, float(bytes(self.take(self.byte())).decode('ascii')))
+        if t == 's':
+            return bytes(self.take(self.size()))
+        if t == 't':
+            raw = bytes(self.take(self.size()))
+            if self.py2:
+                self.interned.append(raw)
+                return raw
+            return raw.decode('utf-8', 'surrogatepass')
+        if t == 'R' and self.py2:
+            n = self.int32()
+            if not 0 <= n < len(self.interned):
+                raise MarshalError('bad interned string reference')
+            return self.interned[n]
+        if t == 'u':
+            return bytes(self.take(self.size())).decode('utf-8', 'surrogatepass')
+        if t in 'aA':
+            return bytes(self.take(self.size())).decode('latin-1')
+        if t in 'zZ':
+            return bytes(self.take(self.byte())).decode('latin-1')
+        raise MarshalError(f'unsupported marshal type {t!r} at offset {self.pos - 1}')
+
+
+def _text(value: Any) -> str:
+    return value.decode('utf-8', 'replace') if isinstance(value, bytes) else value
+
+
+def loads(data, py2: bool = False, magic: Optional[int] = None) -> Any:
+    """Decode marshal data independent of the host Python.
+
+    Handles None/bool/int/float, bytes and str in every marshal version, and
+    tuple/list/dict/set containers including version 3+ back references.
+    Code objects are decoded into :class:`Code` summaries when the pyc
+    ``magic`` number is given. Trailing data is ignored like marshal.loads.
+    """
+    return _Reader(data, py2, magic).obj()
+
+
+def is_py2_magic(pyc_magic: bytes) -> bool:
+    # Python 3 的 magic 从 3000 起编号，Python 2.x 则在 20121–62211 之间
+    return struct.unpack('<H', pyc_magic[:2])[0] > 20000
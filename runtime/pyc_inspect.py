@@ -0,0 +1,198 @@
+import re
+import ast
+import struct
+from typing import Iterator, List, NamedTuple, Optional, Tuple
+
+import marshal_lite
+from marshal_lite import Code
+
+
+CO_NEWLOCALS = 0x0002
+DEF_RE = re.compile(rb'^[ \t]*(?:async[ \t]+)?def[ \t]', re.M)
+CLASS_RE = re.compile(rb'^[ \t]*class[ \t]', re.M)
+
+
+def magic_number(pyc_magic: bytes) -> int:
+    return struct.unpack('<H', pyc_magic[:2])[0]
+
+
+def pyc_header_size(magic: int) -> int:
+    # 3.7 (PEP 552) 起 16 字节，3.3 起加入源码大小为 12 字节，更早为 8 字节
+    if marshal_lite.is_py2_magic(magic.to_bytes(2, 'little')):
+        return 8
+    if magic >= 3392:
+        return 16
+    if magic >= 3230:
+        return 12
+    return 8
+
+
+def read_pyc(pyc_path: str) -> Code:
+    """Load the module code object of ``pyc_path`` for any Python version."""
+    with open(pyc_path, 'rb') as f:
+        data = f.read()
+    magic = magic_number(data[:4])
+    return marshal_lite.loads(memoryview(data)[pyc_header_size(magic):],
+                              py2=marshal_lite.is_py2_magic(data[:4]), magic=magic)
+
+
+def iter_code(code: Code) -> Iterator[Code]:
+    # 深度优先遍历嵌套的 code 对象（含自身）
+    yield code
+    for const in code.consts:
+        if isinstance(const, Code):
+            yield from iter_code(const)
+
+
+class Opcodes(NamedTuple):
+    wordcode: bool
+    have_argument: int
+    extended_arg: int
+    load_const: int
+    import_name: int
+    import_from: int
+
+
+def opcodes_for(magic: int) -> Opcodes:
+    # 只需要导入相关的几个操作码；3.13 重新编号，3.6 起为定长 wordcode
+    if marshal_lite.is_py2_magic(magic.to_bytes(2, 'little')):
+        return Opcodes(False, 90, 145, 100, 108, 109)
+    if magic < 3361:
+        return Opcodes(False, 90, 144, 100, 108, 109)
+    if magic < 3550:
+        return Opcodes(True, 90, 144, 100, 108, 109)
+    if magic < 3600:
+        return Opcodes(True, 44, 71, 83, 75, 74)
+    raise ValueError(f'unsupported bytecode magic {magic}')
+
+
+def iter_instructions(code: bytes, ops: Opcodes) -> Iterator[Tuple[int, int]]:
+    ext = 0
+    if ops.wordcode:
+        for i in range(0, len(code) - 1, 2):
+            op, arg = code[i], code[i + 1] | ext
+            if op == ops.extended_arg:
+                ext = arg << 8
+                continue
+            ext = 0
+            # 3.11+ 的内联缓存项（CACHE=0）不是真正的指令
+            if op:
+                yield op, arg
+        return
+    i = 0
+    while i < len(code):
+        op = code[i]
+        if op < ops.have_argument:
+            i += 1
+            yield op, 0
+            continue
+        arg = (code[i + 1] | code[i + 2] << 8 | ext) if i + 2 < len(code) else 0
+        i += 3
+        if op == ops.extended_arg:
+            ext = arg << 16
+            continue
+        ext = 0
+        yield op, arg
+
+
+def _name(value) -> str:
+    return value.decode('utf-8', 'replace') if isinstance(value, bytes) else str(value)
+
+
+def iter_imports(root: Code, magic: int) -> Iterator[Tuple[str, int, Tuple[str, ...]]]:
+    """Yield ``(module, level, fromlist)`` for every import in the bytecode.
+
+    Imports compile to ``LOAD_CONST level; LOAD_CONST fromlist; IMPORT_NAME``
+    followed by one ``IMPORT_FROM`` per imported name, in every nested code
+    object. A level of -1 (Python 2 implicit relative import) reads as 0.
+    """
+    ops = opcodes_for(magic)
+    for code in iter_code(root):
+        recent: List[Tuple[int, int]] = []
+        current: Optional[Tuple[str, int, List[str], bool]] = None
+        for op, arg in iter_instructions(code.code, ops):
+            if op == ops.import_name:
+                if current is not None:
+                    yield current[0], current[1], tuple(current[2])
+                level, fromlist, known = 0, [], False
+                if len(recent) == 2 and recent[0][0] == ops.load_const and recent[1][0] == ops.load_const:
+                    known = True
+                    const_level = code.consts[recent[0][1]]
+                    const_from = code.consts[recent[1][1]]
+                    if isinstance(const_level, int) and const_level > 0:
+                        level = const_level
+                    if isinstance(const_from, tuple):
+                        fromlist = [_name(n) for n in const_from]
+                current = (_name(code.names[arg]), level, fromlist, known)
+            elif op == ops.import_from and current is not None and not current[3]:
+                # 识别不出 fromlist 常量时才用 IMPORT_FROM 补充名称（import a.b as c 也会生成 IMPORT_FROM）
+                name = _name(code.names[arg])
+                if name not in current[2] and not current[0].endswith('.' + name):
+                    current[2].append(name)
+            recent = (recent + [(op, arg)])[-2:]
+        if current is not None:
+            yield current[0], current[1], tuple(current[2])
+
+
+class PycProfile(NamedTuple):
+    functions: int
+    classes: int
+    max_lineno: int
+
+
+def profile_pyc(pyc_path: str) -> PycProfile:
+    functions = classes = max_lineno = 0
+    for code in iter_code(read_pyc(pyc_path)):
+        max_lineno = max(max_lineno, code.firstlineno)
+        # <module>/<lambda>/<listcomp>/<genexpr> 等不对应源码里的 def/class
+        if code.name.startswith('<'):
+            continue
+        # 函数体有 CO_NEWLOCALS，类体没有
+        if code.flags & CO_NEWLOCALS:
+            functions += 1
+        else:
+            classes += 1
+    return PycProfile(functions, classes, max_lineno)
+
+
+class SourceScore(NamedTuple):
+    value: float
+    perfect: bool
+    parses: bool
+    functions: int
+    classes: int
+    lines: int
+
+
+def score_source(source: bytes, profile: Optional[PycProfile]) -> SourceScore:
+    """Rate decompiled ``source`` against what the pyc says it should contain.
+
+    A source that parses is worth 0.6, matching the def/class counts of the
+    code objects 0.3, and reaching the highest first line number seen in the
+    bytecode 0.1. A result is perfect when it parses and both counts match.
+    """
+    if not source.strip():
+        return SourceScore(0.0, False, False, 0, 0, 0)
+    lines = source.count(b'\n') + (not source.endswith(b'\n'))
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, ValueError):
+        tree = None
+    if tree is not None:
+        nodes = list(ast.walk(tree))
+        functions = sum(isinstance(n, (ast.FunctionDef, ast.AsyncFunctionDef)) for n in nodes)
+        classes = sum(isinstance(n, ast.ClassDef) for n in nodes)
+    else:
+        # 无法解析时退化为按行匹配，仍能在失败的结果之间比较
+        functions = len(DEF_RE.findall(source))
+        classes = len(CLASS_RE.findall(source))
+    if profile is None:
+        return SourceScore(0.6 * (tree is not None) + 0.4, tree is not None, tree is not None,
+                           functions, classes, lines)
+
+    expected = profile.functions + profile.classes
+    diff = abs(functions - profile.functions) + abs(classes - profile.classes)
+    defs = max(0.0, 1.0 - diff / max(1, expected))
+    coverage = min(1.0, lines / profile.max_lineno) if profile.max_lineno else 1.0
+    value = 0.6 * (tree is not None) + 0.3 * defs + 0.1 * coverage
+    return SourceScore(value, tree is not None and diff == 0, tree is not None, functions, classes, lines)
@@ -0,0 +1,140 @@
+import os
+import time
+import signal
+import asyncio
+import subprocess
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from decompile_cache import DecompileCache, tool_version
+
+
+PYCDC = '/tmp/pycdc/build/pycdc'
+DEFAULT_JOBS = os.cpu_count() or 4
+DEFAULT_TIMEOUT = 120.0  # 单个文件的超时秒数，超时即 kill 子进程
+
+
+class CommandResult(NamedTuple):
+    args: Sequence[str]
+    returncode: Optional[int]  # None 表示超时或无法启动
+    stdout: bytes
+    stderr: bytes
+    seconds: float = 0.0  # 子进程实际耗时，缓存命中为 0
+
+    @property
+    def ok(self) -> bool:
+        return self.returncode == 0 and bool(self.stdout)
+
+    @property
+    def timed_out(self) -> bool:
+        return self.returncode is None
+
+
+def _kill_group(proc) -> None:
+    # 反编译器可能是包装脚本，按进程组整体杀掉，避免孙进程占着管道不退出
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+async def _run_one(sem: asyncio.Semaphore, args: Sequence[str], timeout: float,
+                   env: Optional[Dict[str, str]]) -> CommandResult:
+    async with sem:
+        start = time.perf_counter()
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                *args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env, start_new_session=True)
+        except OSError as e:
+            return CommandResult(args, None, b'', str(e).encode())
+        try:
+            stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout)
+        except asyncio.TimeoutError:
+            _kill_group(proc)
+            await proc.wait()
+            return CommandResult(args, None, b'', f'timed out after {timeout:.0f}s'.encode(),
+                                 time.perf_counter() - start)
+        except asyncio.CancelledError:
+            # 竞速中被取消的子进程要一并杀掉，不能留在后台继续占用 CPU
+            _kill_group(proc)
+            await proc.wait()
+            raise
+        return CommandResult(args, proc.returncode, stdout, stderr, time.perf_counter() - start)
+
+
+async def _run_all(commands: List[Sequence[str]], jobs: int, timeout: float,
+                   env: Optional[Dict[str, str]]) -> List[CommandResult]:
+    sem = asyncio.Semaphore(max(1, jobs))
+    return await asyncio.gather(*(_run_one(sem, args, timeout, env) for args in commands))
+
+
+async def _race(sem: asyncio.Semaphore, commands: Dict[str, Sequence[str]],
+                done: Callable[[str, CommandResult], bool], timeout: float,
+                env: Optional[Dict[str, str]]) -> Dict[str, CommandResult]:
+    tasks = {asyncio.ensure_future(_run_one(sem, args, timeout, env)): name for name, args in commands.items()}
+    results: Dict[str, CommandResult] = {}
+    pending = set(tasks)
+    while pending:
+        finished, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in finished:
+            name = tasks[task]
+            results[name] = task.result()
+            if done(name, results[name]):
+                for loser in pending:
+                    loser.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+                pending = set()
+                break
+    return results
+
+
+async def _race_all(races: List[Tuple[Dict[str, Sequence[str]], Callable[[str, CommandResult], bool]]],
+                    jobs: int, timeout: float, env: Optional[Dict[str, str]]) -> List[Dict[str, CommandResult]]:
+    sem = asyncio.Semaphore(max(1, jobs))
+    return await asyncio.gather(*(_race(sem, commands, done, timeout, env) for commands, done in races))
+
+
+def run_commands(commands: Iterable[Sequence[str]], jobs: int = DEFAULT_JOBS, timeout: float = DEFAULT_TIMEOUT,
+                 env: Optional[Dict[str, str]] = None) -> List[CommandResult]:
+    """Run subprocesses at most ``jobs`` at a time, capturing output.
+
+    Results come back in the order of ``commands``.
+    """
+    return asyncio.run(_run_all(list(commands), jobs, timeout, env))
+
+
+def race_commands(races: Iterable[Tuple[Dict[str, Sequence[str]], Callable[[str, CommandResult], bool]]],
+                  jobs: int = DEFAULT_JOBS, timeout: float = DEFAULT_TIMEOUT,
+                  env: Optional[Dict[str, str]] = None) -> List[Dict[str, CommandResult]]:
+    """Run groups of competing commands, at most ``jobs`` processes at a time.
+
+    Each race is a ``{name: args}`` dict plus a ``done(name, result)``
+    callback; as soon as it returns True the rest of that race is killed.
+    Returns one ``{name: result}`` dict per race, without the cancelled names.
+    """
+    return asyncio.run(_race_all(list(races), jobs, timeout, env))
+
+
+def run_pycdc_many(pyc_paths: Iterable[str], jobs: int = DEFAULT_JOBS, timeout: float = DEFAULT_TIMEOUT,
+                   pycdc: str = PYCDC, cache: Optional[DecompileCache] = None) -> Dict[str, CommandResult]:
+    paths = list(pyc_paths)
+    results: Dict[str, CommandResult] = {}
+    decompiler = tool_version('pycdc', pycdc) if cache is not None else None
+    if decompiler is not None:
+        # 命中缓存的文件不再启动 pycdc
+        for p in paths:
+            hit = cache.get(p, decompiler)
+            if hit is not None:
+                results[p] = CommandResult([pycdc, p], 0 if hit.ok else 1, hit.output, hit.stderr)
+    # 信号量按提交顺序放行，大文件先跑，避免最后只剩一个超大模块在跑
+    misses = sorted((p for p in paths if p not in results), key=os.path.getsize, reverse=True)
+    for p, res in zip(misses, run_commands([[pycdc, p] for p in misses], jobs, timeout)):
+        results[p] = res
+        # 超时或无法启动属于偶发情况，不写入缓存
+        if decompiler is not None and not res.timed_out:
+            cache.put(p, decompiler, res.ok, res.stdout if res.ok else b'', res.stderr)
+    return {p: results[p] for p in paths}
+
+
+def run_pycdc(pyc_path: str, timeout: float = DEFAULT_TIMEOUT, pycdc: str = PYCDC,
+              cache: Optional[DecompileCache] = None) -> CommandResult:
+    return run_pycdc_many([pyc_path], 1, timeout, pycdc, cache)[pyc_path]
@@ -0,0 +1,129 @@
+import os
+import zlib
+from typing import Optional
+
+import marshal_lite
+from marshal_lite import Code
+from pyc_inspect import magic_number, pyc_header_size, read_pyc
+
+try:
+    from Crypto.Cipher import AES  # pycryptodome，PyInstaller 3.x 用它加密
+except ImportError:
+    AES = None
+try:
+    import tinyaes  # PyInstaller 4.x/5.x 的加密后端
+except ImportError:
+    tinyaes = None
+
+
+CRYPTO_KEY_MODULE = 'pyimod00_crypto_key'
+BLOCK_SIZE = 16
+SAMPLE_MEMBERS = 8  # 判断是否加密、探测加密模式时最多试读的成员数
+
+
+def normalize_key(key) -> bytes:
+    # 与 PyInstaller 的 pyimod02_archive.Cipher 相同：超长截断，不足 16 位左侧补 '0'
+    if isinstance(key, (bytes, bytearray)):
+        key = bytes(key).decode('utf-8')
+    return (key[:BLOCK_SIZE] if len(key) > BLOCK_SIZE else key.zfill(BLOCK_SIZE)).encode('utf-8')
+
+
+def key_from_code(code: Code) -> bytes:
+    # pyimod00_crypto_key 只有一行 key = '...'，第一个字符串常量就是密钥
+    for const in code.consts:
+        if isinstance(const, (str, bytes)) and const:
+            return normalize_key(const)
+    raise ValueError(f'no key constant in {code.filename}')
+
+
+def key_from_marshal(data: bytes, pyc_magic: bytes) -> bytes:
+    # CArchive 中的模块条目：PyInstaller 5.3 之前带 pyc 头，之后只有 marshal 数据
+    if data[2:4] == b'\r\n':
+        pyc_magic = bytes(data[:4])
+        data = memoryview(data)[pyc_header_size(magic_number(pyc_magic)):]
+    return key_from_code(marshal_lite.loads(data, py2=marshal_lite.is_py2_magic(pyc_magic),
+                                            magic=magic_number(pyc_magic)))
+
+
+def key_from_pyc(pyc_path: str) -> bytes:
+    return key_from_code(read_pyc(pyc_path))
+
+
+class PyzCipher:
+    """Decrypts PYZ members written with PyInstaller's ``--key`` option.
+
+    Each member is a 16-byte IV followed by the AES-encrypted zlib stream:
+    AES-CFB through pycryptodome for PyInstaller 3.x, AES-CTR through
+    tinyaes for 4.x and 5.x. pycryptodome covers both modes. The native
+    AES and zlib code release the GIL, so a thread pool decrypts in parallel.
+    """
+
+    MODES = ('ctr', 'cfb')
+
+    def __init__(self, key: bytes, mode: str) -> None:
+        if mode == 'cfb' and AES is None:
+            raise RuntimeError('AES-CFB decryption needs pycryptodome (pip install pycryptodome)')
+        if mode == 'ctr' and AES is None and tinyaes is None:
+            raise RuntimeError('AES-CTR decryption needs tinyaes or pycryptodome (pip install tinyaes)')
+        self.key = key
+        self.mode = mode
+
+    def decrypt(self, data) -> bytes:
+        iv, body = bytes(data[:BLOCK_SIZE]), bytes(data[BLOCK_SIZE:])
+        if self.mode == 'cfb':
+            return AES.new(self.key, AES.MODE_CFB, iv).decrypt(body)
+        if tinyaes is not None:
+            return tinyaes.AES(self.key, iv).CTR_xcrypt_buffer(body)
+        return AES.new(self.key, AES.MODE_CTR, nonce=b'', initial_value=iv).decrypt(body)
+
+    def inflate(self, data) -> bytes:
+        return zlib.decompress(self.decrypt(data))
+
+    @classmethod
+    def detect(cls, key: bytes, sample) -> 'PyzCipher':
+        # 用一个加密成员试出加密模式：模式或密钥不对时解密结果无法 zlib 解压
+        errors = []
+        for mode in cls.MODES:
+            try:
+                cipher = cls(key, mode)
+                cipher.inflate(sample)
+                return cipher
+            except RuntimeError as e:
+                errors.append(str(e))
+            except zlib.error:
+                pass
+        raise ValueError('; '.join(errors) or 'the key does not decrypt the archive')
+
+
+def inflate(data, cipher: Optional[PyzCipher] = None) -> bytes:
+    # 先按未加密处理；解压失败且有密钥时再解密
+    try:
+        return zlib.decompress(data)
+    except zlib.error:
+        if cipher is None:
+            raise
+        return cipher.inflate(data)
+
+
+def cipher_for(pyz, key: bytes) -> Optional[PyzCipher]:
+    """Return the cipher for ``pyz`` (a PyzArchive), or None when its members are not encrypted."""
+    for name in [n for n in pyz.toc if n != CRYPTO_KEY_MODULE][:SAMPLE_MEMBERS]:
+        raw = pyz.read_raw(name)
+        try:
+            zlib.decompress(raw)
+        except zlib.error:
+            return PyzCipher.detect(key, raw)
+    return None
+
+
+def find_key(pyz) -> Optional[bytes]:
+    # 密钥模块可能在 PYZ 内（未加密），或已由 pyinstxtractor 解到 PYZ 旁边
+    if CRYPTO_KEY_MODULE in pyz.toc:
+        try:
+            return key_from_marshal(zlib.decompress(pyz.read_raw(CRYPTO_KEY_MODULE)), pyz.pyc_magic)
+        except (zlib.error, ValueError):
+            pass
+    sibling = os.path.join(os.path.dirname(os.path.abspath(pyz.path)), CRYPTO_KEY_MODULE + '.pyc')
+    if os.path.isfile(sibling):
+        return key_from_pyc(sibling)
+    return None
@@ -0,0 +1,164 @@
+import os
+import sys
+import runpy
+import fnmatch
+import marshal
+import argparse
+import threading
+import importlib.util
+import importlib.machinery
+from importlib.abc import Loader, MetaPathFinder
+from types import CodeType, ModuleType
+from typing import Dict, List, Optional, Sequence
+
+import instrument
+from extract_pyz import PyzArchive
+
+
+PYZ_PATH = '/tmp/百世_extracted/PYZ-00.pyz'
+SRC_ROOT = '/tmp/百世_src'
+
+
+class PyzImporter(MetaPathFinder, Loader):
+    """Imports modules straight out of a PYZ archive, without extracting it.
+
+    Only the TOC is read up front (from the ``.idx.json`` sidecar when
+    present); a member is decompressed and unmarshalled the first time it is
+    imported, and its code object is kept in memory for reloads. A ``.py``
+    file for the same module under one of ``source_roots`` (e.g. a patched
+    decompiled tree) takes precedence over the archive.
+    """
+
+    def __init__(self, pyz: PyzArchive, source_roots: Sequence[str] = (), patterns: Sequence[str] = ('*',)) -> None:
+        if pyz.pyc_magic != importlib.util.MAGIC_NUMBER:
+            # 只有与打包时相同的 Python 版本才能执行其中的 code 对象
+            raise RuntimeError(f'{pyz.path} was built for another Python version '
+                               f'(magic {pyz.pyc_magic.hex()}, running {importlib.util.MAGIC_NUMBER.hex()})')
+        self.pyz = pyz
+        self.source_roots = [os.path.abspath(root) for root in source_roots]
+        self.patterns = list(patterns)
+        self.code_cache: Dict[str, CodeType] = {}
+        self._lock = threading.Lock()
+        self.loaded = 0  # 从归档解压的成员数
+        self.overridden = 0  # 由磁盘 .py 提供的模块数
+
+    def _wanted(self, fullname: str) -> bool:
+        return any(fnmatch.fnmatchcase(fullname, p) for p in self.patterns)
+
+    def _source_override(self, fullname: str) -> Optional[str]:
+        parts = fullname.split('.')
+        for root in self.source_roots:
+            for candidate in (os.path.join(root, *parts, '__init__.py'), os.path.join(root, *parts) + '.py'):
+                if os.path.isfile(candidate):
+                    return candidate
+        return None
+
+    def _package_path(self, fullname: str) -> List[str]:
+        # 包的 __path__ 同时指向磁盘上的同名目录，归档外的子模块（如 .so）仍由 PathFinder 找到
+        parts = fullname.split('.')
+        on_disk = [os.path.join(root, *parts) for root in self.source_roots]
+        return [d for d in on_disk if os.path.isdir(d)] + [os.path.join(self.pyz.path, *parts)]
+
+    def find_spec(self, fullname: str, path=None, target: Optional[ModuleType] = None):
+        if not self._wanted(fullname):
+            return None
+        source = self._source_override(fullname)
+        if source is not None:
+            self.overridden += 1
+            spec = importlib.util.spec_from_file_location(fullname, source)
+            if spec is not None and spec.submodule_search_locations is not None:
+                spec.submodule_search_locations[:] = self._package_path(fullname)
+            return spec
+        if fullname not in self.pyz.toc:
+            return None
+        is_package = self.pyz.is_package(fullname)
+        spec = importlib.machinery.ModuleSpec(fullname, self, origin=self.get_filename(fullname), is_package=is_package)
+        spec.has_location = True  # 让 __file__ 取 origin，业务代码常用 os.path.dirname(__file__)
+        if is_package:
+            spec.submodule_search_locations = self._package_path(fullname)
+        return spec
+
+    def create_module(self, spec) -> Optional[ModuleType]:
+        return None  # 使用默认的模块创建方式
+
+    def exec_module(self, module: ModuleType) -> None:
+        exec(self.get_code(module.__spec__.name), module.__dict__)
+
+    def get_code(self, fullname: str) -> CodeType:
+        with self._lock:
+            code = self.code_cache.get(fullname)
+        if code is None:
+            with instrument.span('pyz_import', fullname):
+                code = marshal.loads(self.pyz.read(fullname))
+            with self._lock:
+                self.code_cache[fullname] = code
+                self.loaded += 1
+        return code
+
+    def is_package(self, fullname: str) -> bool:
+        return self.pyz.is_package(fullname)
+
+    def get_source(self, fullname: str) -> Optional[str]:
+        return None
+
+    def get_filename(self, fullname: str) -> str:
+        # 归档内的虚拟路径，只用于 __file__ 与报错信息
+        return os.path.join(self.pyz.path, self.pyz.output_path(fullname))
+
+    def invalidate_caches(self) -> None:
+        with self._lock:
+            self.code_cache.clear()
+
+
+def install(pyz_path: str = PYZ_PATH, source_roots: Sequence[str] = (), patterns: Sequence[str] = ('*',),
+            key: Optional[bytes] = None) -> PyzImporter:
+    """Put a PyzImporter on ``sys.meta_path``, ahead of the path-based finder.
+
+    Built-in and frozen modules still come from the running interpreter;
+    everything else found in the archive is imported from it.
+    """
+    pyz = PyzArchive(pyz_path)
+    try:
+        pyz.load_key(key)
+        importer = PyzImporter(pyz, source_roots, patterns)
+        pyz.toc  # TOC 损坏时在这里失败，而不是等到第一次 import
+    except BaseException:
+        pyz.close()
+        raise
+    index = next((i for i, finder in enumerate(sys.meta_path) if finder is importlib.machinery.PathFinder),
+                 len(sys.meta_path))
+    sys.meta_path.insert(index, importer)
+    return importer
+
+
+def uninstall(importer: PyzImporter) -> None:
+    if importer in sys.meta_path:
+        sys.meta_path.remove(importer)
+    importer.pyz.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Run a module straight from a PYZ archive, without extracting it')
+    parser.add_argument('module', help='module to run as __main__')
+    parser.add_argument('args', nargs=argparse.REMAINDER, help='arguments passed to the module')
+    parser.add_argument('--pyz', default=PYZ_PATH)
+    parser.add_argument('--src', action='append', default=[],
+                        help=f'directory whose .py files take precedence over the archive, e.g. {SRC_ROOT} (repeatable)')
+    parser.add_argument('--match', action='append', default=[],
+                        help='only import modules matching this glob from the archive, e.g. "api*" (repeatable)')
+    parser.add_argument('--key', help='AES key of an encrypted PYZ (default: read pyimod00_crypto_key)')
+    parser.add_argument('--stats', action='store_true', help='print how many modules came from the archive on exit')
+    args = parser.parse_args()
+
+    importer = install(args.pyz, args.src, args.match or ['*'], args.key.encode('utf-8') if args.key else None)
+    sys.argv = [args.module] + args.args
+    try:
+        runpy.run_module(args.module, run_name='__main__', alter_sys=True)
+    finally:
+        if args.stats:
+            print(f'PYZ importer: {importer.loaded} module(s) loaded from {len(importer.pyz.toc)} in the archive, '
+                  f'{importer.overridden} from source roots', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,102 +1,148 @@
 import os
+import time
+import shutil
 import subprocess
-from typing import List, Tuple
+from typing import List, Optional, Tuple
+
+import instrument
+from audit_decompile import REPORT_PATH, find_incomplete, write_report
+from decompile_cache import DecompileCache, default_cache, run_cached
+from decompile_race import decompilers_for, race_decompile_many
+from job_ledger import JobLedger, open_ledger
+from pycdc_runner import run_pycdc_many
 
 
 SRC_ROOT = '/tmp/百世_src'
 PYC_ROOT = '/tmp/百世_extracted/PYZ-00_extracted'
 PYCDC = '/tmp/pycdc/build/pycdc'
-MIN_LINES = 20  # 阈值：过短文件重试
 PY_VERSIONS = ['3.10']  # 固定为 Python 3.10
 
 
-def count_lines(path: str) -> int:
-    try:
-        with open(path, 'rb') as f:
-            return sum(1 for _ in f)
-    except Exception:
-        return 0
+def _tool_env() -> dict:
+    env = os.environ.copy()
+    env['PATH'] = f"{os.path.expanduser('~')}/.local/bin:" + env.get('PATH', '')
+    return env
 
 
-def find_short_py_files(root: str, min_lines: int) -> List[str]:
-    out: List[str] = []
-    for base, _, files in os.walk(root):
-        for fn in files:
-            if not fn.endswith('.py'):
-                continue
-            p = os.path.join(base, fn)
-            if count_lines(p) < min_lines:
-                out.append(p)
-    return out
+def _tool_path(name: str) -> Optional[str]:
+    # 与 _run_tool 相同的 PATH 下实际会运行的程序，用作缓存键
+    return shutil.which(name, path=_tool_env()['PATH'])
 
 
-def decompyle3_rebuild_any(pyc_path: str, out_dir: str) -> Tuple[bool, str]:
-    env = os.environ.copy()
-    env['PATH'] = f"{os.path.expanduser('~')}/.local/bin:" + env.get('PATH', '')
+def _run_tool(args: List[str]) -> Tuple[bool, str]:
+    r = subprocess.run(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=_tool_env())
+    return r.returncode == 0, r.stderr.decode('utf-8', errors='ignore')
+
+
+def _cli_output(pyc_path: str, out_dir: str) -> str:
+    # decompyle3/uncompyle6 的 -o <dir> 会写出 <dir>/<模块名>.py
+    return os.path.join(out_dir, os.path.basename(pyc_path)[:-1])
+
+
+def decompyle3_rebuild_any(pyc_path: str, out_dir: str, cache: Optional[DecompileCache] = None) -> Tuple[bool, str]:
     last_err = ''
     for ver in PY_VERSIONS:
-        r = subprocess.run(['decompyle3', '-p', ver, '-o', out_dir, pyc_path], stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
-        if r.returncode == 0:
+        ok, last_err = run_cached(cache, pyc_path, 'decompyle3', _cli_output(pyc_path, out_dir),
+                                  lambda: _run_tool(['decompyle3', '-p', ver, '-o', out_dir, pyc_path]),
+                                  options=f'cli -p {ver}', executable=_tool_path('decompyle3'))
+        if ok:
             return True, ''
-        last_err = r.stderr.decode('utf-8', errors='ignore')
     return False, last_err
 
 
-def uncompyle6_rebuild_any(pyc_path: str, out_dir: str) -> Tuple[bool, str]:
-    env = os.environ.copy()
-    env['PATH'] = f"{os.path.expanduser('~')}/.local/bin:" + env.get('PATH', '')
+def uncompyle6_rebuild_any(pyc_path: str, out_dir: str, cache: Optional[DecompileCache] = None) -> Tuple[bool, str]:
     last_err = ''
     for ver in PY_VERSIONS:
-        r = subprocess.run(['uncompyle6', f'--py={ver}', '-o', out_dir, pyc_path], stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
-        if r.returncode == 0:
+        ok, last_err = run_cached(cache, pyc_path, 'uncompyle6', _cli_output(pyc_path, out_dir),
+                                  lambda: _run_tool(['uncompyle6', f'--py={ver}', '-o', out_dir, pyc_path]),
+                                  options=f'cli --py={ver}', executable=_tool_path('uncompyle6'))
+        if ok:
             return True, ''
-        last_err = r.stderr.decode('utf-8', errors='ignore')
     return False, last_err
 
 
-def pycdc_rebuild(pyc_path: str, out_file: str) -> bool:
-    r = subprocess.run([PYCDC, pyc_path], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    if r.returncode == 0 and r.stdout:
-        with open(out_file, 'wb') as w:
-            w.write(r.stdout)
-        return True
-    return False
-
-
-def map_py_to_pyc(py_path: str) -> str:
-    rel = os.path.relpath(py_path, SRC_ROOT)
-    return os.path.join(PYC_ROOT, rel[:-3] + '.pyc')
-
-
-def main() -> None:
-    short_files = find_short_py_files(SRC_ROOT, MIN_LINES)
+def race_rebuild(pairs: List[Tuple[str, str]], cache: Optional[DecompileCache],
+                 ledger: Optional[JobLedger] = None) -> Tuple[int, List[str]]:
+    # 竞速模式：所有反编译器同时跑，按质量评分取最佳，满分结果出现即终止其余进程
     fixed = 0
-    checked = 0
     report: List[str] = []
-    for py in short_files:
-        checked += 1
-        pyc = map_py_to_pyc(py)
-        if not os.path.exists(pyc):
-            report.append(f'NO_PYC: {py}')
-            continue
-        out_dir = os.path.dirname(py)
-        print(f'Checking: {pyc} {py}')
-        # 顺序：decompyle3(多版本) -> uncompyle6(多版本) -> pycdc
-        ok, err1 = decompyle3_rebuild_any(pyc, out_dir)
-        if ok:
-            fixed += 1
-            continue
-        ok, err2 = uncompyle6_rebuild_any(pyc, out_dir)
-        if ok:
-            fixed += 1
-            continue
-        if pycdc_rebuild(pyc, py):
+    results = race_decompile_many([pyc for _, pyc in pairs], decompilers_for(PY_VERSIONS[-1], PYCDC), cache=cache)
+    for py, pyc in pairs:
+        race = results[pyc]
+        if ledger is not None:
+            seconds = max((res.seconds for res in race.results.values()), default=0.0)
+            ledger.record(py, pyc, race.winner or 'race', 'ok' if race.winner else 'failed', seconds)
+        if race.winner:
+            with open(py, 'wb') as w:
+                w.write(race.source)
+            print(f'Rebuilt: {py} <- {race.winner} (score {race.scores[race.winner].value:.2f})')
             fixed += 1
             continue
+        err1 = race.results['decompyle3'].stderr if 'decompyle3' in race.results else b''
+        err2 = race.results['uncompyle6'].stderr if 'uncompyle6' in race.results else b''
         report.append(f'FAILED_RECHECK: {py} | decompyle3_err={len(err1)}B, uncompyle6_err={len(err2)}B')
+    return fixed, report
+
+
+def main() -> None:
+    # 按与 .pyc 的比对结果（函数/类名、字符串常量）挑出不完整的文件，而不是按行数
+    incomplete = find_incomplete(SRC_ROOT, PYC_ROOT)
+    write_report(incomplete, REPORT_PATH)
+    cache = default_cache()
+    with open_ledger('recheck_short_files') as ledger:
+        race = os.environ.get('RACE_DECOMPILERS') == '1'
+        fixed = 0
+        checked = 0
+        report: List[str] = []
+        racing: List[Tuple[str, str]] = []
+        needs_pycdc: List[Tuple[str, str, str, str]] = []  # (py, pyc, decompyle3_err, uncompyle6_err)
+        for audit in incomplete:
+            checked += 1
+            py, pyc = audit.py_path, audit.pyc_path
+            out_dir = os.path.dirname(py)
+            os.makedirs(out_dir, exist_ok=True)
+            print(f'Checking: {pyc} {py} (score {audit.score:.2f})')
+            if race:
+                racing.append((py, pyc))
+                continue
+            # 顺序：decompyle3(多版本) -> uncompyle6(多版本) -> pycdc
+            start = time.perf_counter()
+            ok, err1 = decompyle3_rebuild_any(pyc, out_dir, cache)
+            if ok:
+                ledger.record(py, pyc, 'decompyle3', 'ok', time.perf_counter() - start)
+                fixed += 1
+                continue
+            ok, err2 = uncompyle6_rebuild_any(pyc, out_dir, cache)
+            if ok:
+                ledger.record(py, pyc, 'uncompyle6', 'ok', time.perf_counter() - start)
+                fixed += 1
+                continue
+            needs_pycdc.append((py, pyc, err1, err2))
+
+        if racing:
+            race_fixed, race_report = race_rebuild(racing, cache, ledger)
+            fixed += race_fixed
+            report.extend(race_report)
+
+        # pycdc 兜底统一并发执行
+        with instrument.span('pycdc', files=len(needs_pycdc)):
+            results = run_pycdc_many([pyc for _, pyc, _, _ in needs_pycdc], pycdc=PYCDC, cache=cache)
+        for py, pyc, err1, err2 in needs_pycdc:
+            r = results[pyc]
+            ledger.record(py, pyc, 'pycdc', 'ok' if r.ok else 'timeout' if r.timed_out else 'failed', r.seconds,
+                          '' if r.ok else f'decompyle3: {err1[-500:]}\nuncompyle6: {err2[-500:]}\npycdc: '
+                          + r.stderr[-500:].decode('utf-8', 'replace'))
+            if r.ok:
+                with open(py, 'wb') as w:
+                    w.write(r.stdout)
+                fixed += 1
+                continue
+            report.append(f'FAILED_RECHECK: {py} | decompyle3_err={len(err1)}B, uncompyle6_err={len(err2)}B')
 
     summary = f'Checked={checked}, Fixed={fixed}, Remaining={len(report)}'
     print(summary)
+    if cache is not None:
+        print(f'Cache: {cache.hits} hit(s), {cache.misses} miss(es), {cache.evict()} entries evicted')
     if report:
         with open('/tmp/recheck_report.txt', 'w', encoding='utf-8') as w:
             w.write('\n'.join(report) + '\n' + summary + '\n')
@@ -1,6 +1,14 @@
 import os
+import time
+import shutil
 import subprocess
-from typing import List, Tuple
+from typing import List, Optional, Tuple
+
+import instrument
+from decompile_cache import DecompileCache, default_cache, run_cached
+from decompile_race import race_decompile_many
+from job_ledger import JobLedger, open_ledger
+from pycdc_runner import run_pycdc_many
 
 SRC_ROOT = '/tmp/百世_src'
 PYC_ROOT = '/tmp/百世_extracted/PYZ-00_extracted'
@@ -16,6 +24,17 @@ def find_failed() -> List[str]:
     return failed_notes
 
 
+def find_failed_from_ledger(ledger: JobLedger) -> List[Tuple[str, str, Optional[str]]]:
+    # 账本里最新一次尝试未成功的文件，无需遍历整棵源码树
+    items: List[Tuple[str, str, Optional[str]]] = []
+    for outcome in ledger.failures(prefix=SRC_ROOT + os.sep):
+        py_path = outcome.py_path
+        pyc_path = outcome.pyc_path or os.path.join(PYC_ROOT, os.path.relpath(py_path, SRC_ROOT)[:-3] + '.pyc')
+        note = py_path + '.FAILED.txt'
+        items.append((py_path, pyc_path, note if os.path.exists(note) else None))
+    return items
+
+
 def find_failed_from_report(report_path: str = '/tmp/recheck_report.txt') -> List[str]:
     failed_py_files: List[str] = []
     if not os.path.exists(report_path):
@@ -48,27 +67,39 @@ def map_failed_to_pyc(failed_note: str) -> Tuple[str, str]:
     return py_path, pyc_path
 
 
-def try_decompyle3(pyc_path: str, out_dir: str) -> bool:
+def _tool_env() -> dict:
     env = os.environ.copy()
     env['PATH'] = f"{os.path.expanduser('~')}/.local/bin:" + env.get('PATH', '')
-    r = subprocess.run(['decompyle3', '-o', out_dir, pyc_path], stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
-    return r.returncode == 0
+    return env
 
 
-def try_uncompyle6(pyc_path: str, out_dir: str) -> bool:
-    env = os.environ.copy()
-    env['PATH'] = f"{os.path.expanduser('~')}/.local/bin:" + env.get('PATH', '')
-    r = subprocess.run(['uncompyle6', '-o', out_dir, pyc_path], stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
-    return r.returncode == 0
+def _tool_path(name: str) -> Optional[str]:
+    # 与 _run_tool 相同的 PATH 下实际会运行的程序，用作缓存键
+    return shutil.which(name, path=_tool_env()['PATH'])
+
+
+def _run_tool(args: List[str]) -> Tuple[bool, str]:
+    r = subprocess.run(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=_tool_env())
+    return r.returncode == 0, r.stderr.decode('utf-8', errors='ignore')
+
+
+def _cli_output(pyc_path: str, out_dir: str) -> str:
+    # decompyle3/uncompyle6 的 -o <dir> 会写出 <dir>/<模块名>.py
+    return os.path.join(out_dir, os.path.basename(pyc_path)[:-1])
+
 
+def try_decompyle3(pyc_path: str, out_dir: str, cache: Optional[DecompileCache] = None) -> bool:
+    ok, _ = run_cached(cache, pyc_path, 'decompyle3', _cli_output(pyc_path, out_dir),
+                       lambda: _run_tool(['decompyle3', '-o', out_dir, pyc_path]),
+                       options='cli', executable=_tool_path('decompyle3'))
+    return ok
 
-def try_pycdc(pyc_path: str, out_py: str) -> bool:
-    r = subprocess.run([PYCDC, pyc_path], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    if r.returncode == 0 and r.stdout:
-        with open(out_py, 'wb') as w:
-            w.write(r.stdout)
-        return True
-    return False
+
+def try_uncompyle6(pyc_path: str, out_dir: str, cache: Optional[DecompileCache] = None) -> bool:
+    ok, _ = run_cached(cache, pyc_path, 'uncompyle6', _cli_output(pyc_path, out_dir),
+                       lambda: _run_tool(['uncompyle6', '-o', out_dir, pyc_path]),
+                       options='cli', executable=_tool_path('uncompyle6'))
+    return ok
 
 
 def _safe_remove(path: str) -> None:
@@ -78,70 +109,126 @@ def _safe_remove(path: str) -> None:
         pass
 
 
-def main() -> None:
-    failures = find_failed()
+def race_all(items: List[Tuple[str, str, Optional[str]]], cache: Optional[DecompileCache] = None,
+             ledger: Optional[JobLedger] = None) -> Tuple[int, int]:
+    # 竞速模式：所有反编译器同时跑，取评分最高的输出
+    present = [item for item in items if os.path.exists(item[1])]
+    if ledger is not None:
+        for py_path, pyc_path, _ in items:
+            if not os.path.exists(pyc_path):
+                ledger.record(py_path, pyc_path, None, 'missing')
+    results = race_decompile_many([pyc_path for _, pyc_path, _ in present], cache=cache)
+    fixed = 0
+    for py_path, pyc_path, note in present:
+        race = results[pyc_path]
+        seconds = max((res.seconds for res in race.results.values()), default=0.0)
+        if not race.winner:
+            if ledger is not None:
+                ledger.record(py_path, pyc_path, 'race', 'failed', seconds,
+                              '; '.join(f'{name}: {res.stderr[-200:].decode("utf-8", "replace")}'
+                                        for name, res in race.results.items()))
+            continue
+        if ledger is not None:
+            ledger.record(py_path, pyc_path, race.winner, 'ok', seconds)
+        with open(py_path, 'wb') as w:
+            w.write(race.source)
+        if note:
+            _safe_remove(note)
+        print(f"Fixed: {py_path} <- {race.winner} (score {race.scores[race.winner].value:.2f})")
+        fixed += 1
+    return fixed, len(items) - fixed
+
+
+def retry_all(items: List[Tuple[str, str, Optional[str]]], force_pycdc_only: bool,
+              cache: Optional[DecompileCache] = None, ledger: Optional[JobLedger] = None) -> Tuple[int, int]:
+    # items: (py_path, pyc_path, .FAILED.txt 标记或 None)；每个结果写入账本，中断后可从账本续跑
+    if os.environ.get('RACE_DECOMPILERS') == '1' and not force_pycdc_only:
+        return race_all(items, cache, ledger)
     fixed = 0
     still_failed = 0
-    force_pycdc_only = os.environ.get('FORCE_PYCDC_ONLY') == '1'
-
-    # Case 1: has .FAILED.txt markers
-    for note in failures:
-        print(f"Retrying: {note}")
-        py_path, pyc_path = map_failed_to_pyc(note)
+    needs_pycdc: List[Tuple[str, str, Optional[str]]] = []
+    for py_path, pyc_path, note in items:
         out_dir = os.path.dirname(py_path)
         if not os.path.exists(pyc_path):
+            if ledger is not None:
+                ledger.record(py_path, pyc_path, None, 'missing')
             still_failed += 1
             continue
-        if force_pycdc_only:
-            if try_pycdc(pyc_path, py_path):
-                _safe_remove(note)
-                fixed += 1
-                continue
-        else:
-            if try_decompyle3(pyc_path, out_dir):
-                _safe_remove(note)
-                fixed += 1
-                continue
-            if try_uncompyle6(pyc_path, out_dir):
-                _safe_remove(note)
+        if not force_pycdc_only:
+            start = time.perf_counter()
+            tool = ('decompyle3' if try_decompyle3(pyc_path, out_dir, cache) else
+                    'uncompyle6' if try_uncompyle6(pyc_path, out_dir, cache) else None)
+            if tool:
+                if ledger is not None:
+                    ledger.record(py_path, pyc_path, tool, 'ok', time.perf_counter() - start)
+                if note:
+                    _safe_remove(note)
                 fixed += 1
                 continue
-            if try_pycdc(pyc_path, py_path):
+        needs_pycdc.append((py_path, pyc_path, note))
+
+    # pycdc 兜底统一并发执行
+    with instrument.span('pycdc', files=len(needs_pycdc)):
+        results = run_pycdc_many([pyc_path for _, pyc_path, _ in needs_pycdc], pycdc=PYCDC, cache=cache)
+    for py_path, pyc_path, note in needs_pycdc:
+        r = results[pyc_path]
+        if ledger is not None:
+            status = 'ok' if r.ok else 'timeout' if r.timed_out else 'failed'
+            ledger.record(py_path, pyc_path, 'pycdc', status, r.seconds,
+                          '' if r.ok else r.stderr.decode('utf-8', 'replace'))
+        if r.ok:
+            with open(py_path, 'wb') as w:
+                w.write(r.stdout)
+            if note:
                 _safe_remove(note)
-                fixed += 1
-                continue
+            fixed += 1
+            continue
         still_failed += 1
+    return fixed, still_failed
 
-    # Case 2: fall back to parsing /tmp/recheck_report.txt
-    if not failures:
+
+def main() -> None:
+    force_pycdc_only = os.environ.get('FORCE_PYCDC_ONLY') == '1'
+    cache = default_cache()
+
+    with open_ledger('retry_failed') as ledger:
+        prefix = SRC_ROOT + os.sep
+        items = find_failed_from_ledger(ledger)
+
+        # Case 1: a run that finished the whole tree recorded every file
+        # 账本为准（为空说明全部成功），不再扫描文件系统
+        if ledger.covers(prefix):
+            for py_path, pyc_path, _ in items:
+                print(f"Retrying(from ledger): {pyc_path} -> {py_path}")
+            fixed, still_failed = retry_all(items, force_pycdc_only, cache, ledger)
+            print(f"Retried(from ledger): {len(items)}, Fixed: {fixed}, Remaining: {still_failed}")
+            return
+
+        # Case 2: interrupted or partial runs, and trees produced before the ledger existed:
+        # add the .FAILED.txt markers of files the ledger has no record of
+        recorded = {r.py_path for r in ledger.latest(prefix=prefix)}
+        from_ledger = len(items)
+        for note in find_failed():
+            py_path, pyc_path = map_failed_to_pyc(note)
+            if py_path not in recorded:
+                items.append((py_path, pyc_path, note))
+        if items:
+            for py_path, pyc_path, _ in items:
+                print(f"Retrying: {pyc_path} -> {py_path}")
+            fixed, still_failed = retry_all(items, force_pycdc_only, cache, ledger)
+            print(f"Retried: {len(items)} ({from_ledger} from ledger), Fixed: {fixed}, Remaining: {still_failed}")
+            return
+
+        # Case 3: fall back to parsing /tmp/recheck_report.txt
         failed_py_list = find_failed_from_report()
+        items = []
         for py_path in failed_py_list:
             rel = os.path.relpath(py_path, SRC_ROOT)
             pyc_path = os.path.join(PYC_ROOT, rel[:-3] + '.pyc')
-            out_dir = os.path.dirname(py_path)
             print(f"Retrying(from report): {pyc_path} -> {py_path}")
-            if not os.path.exists(pyc_path):
-                still_failed += 1
-                continue
-            if force_pycdc_only:
-                if try_pycdc(pyc_path, py_path):
-                    fixed += 1
-                    continue
-            else:
-                if try_decompyle3(pyc_path, out_dir):
-                    fixed += 1
-                    continue
-                if try_uncompyle6(pyc_path, out_dir):
-                    fixed += 1
-                    continue
-                if try_pycdc(pyc_path, py_path):
-                    fixed += 1
-                    continue
-            still_failed += 1
-
+            items.append((py_path, pyc_path, None))
+        fixed, still_failed = retry_all(items, force_pycdc_only, cache, ledger)
         print(f"Retried(from report): {len(failed_py_list)}, Fixed: {fixed}, Remaining: {still_failed}")
-    else:
-        print(f"Retried: {len(failures)}, Fixed: {fixed}, Remaining: {still_failed}")
 
 
 if __name__ == '__main__':
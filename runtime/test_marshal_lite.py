@@ -0,0 +1,132 @@
+import marshal
+import struct
+import importlib.util
+
+import pytest
+
+import marshal_lite
+
+
+MAGIC = struct.unpack('<H', importlib.util.MAGIC_NUMBER[:2])[0]
+VERSIONS = range(marshal.version + 1)
+
+SHARED = 'shared-string-value'
+VALUES = [
+    None, True, False, Ellipsis, StopIteration,
+    0, -1, 2 ** 31 - 1, -2 ** 31, 2 ** 40, -2 ** 70, 10 ** 30,
+    1.5, -0.0, 1e300, 3 + 4j,
+    b'', b'bytes\x00\xff', '', 'ascii', 'ünïcödé', 'x' * 300, '\ud800',
+    (), (1,), tuple(range(300)), [], [1, [2, [3, (4, 5)]]],
+    {}, {'a': 1, b'b': (2, 3), 4: [5]}, set(), {1, 2, 3}, frozenset({'a', 'b'}),
+    ((((),),),), ('nested', ('tuple', ('of', ('tuples',)))),
+    (SHARED, SHARED, [SHARED, (SHARED,)]),  # version 3+ 用 FLAG_REF 回引用
+]
+
+
+def _summary(code):
+    # 宿主 code 对象 -> marshal_lite.Code，嵌套的 code 常量同样转换
+    consts = tuple(_summary(c) if hasattr(c, 'co_code') else c for c in code.co_consts)
+    return marshal_lite.Code(code.co_name, code.co_qualname, code.co_filename, code.co_firstlineno,
+                             code.co_flags, code.co_code, consts, code.co_names)
+
+
+def _sample_code():
+    source = '''
+import os
+
+def outer(a, b=1, *args, **kw):
+    def inner():
+        return a + b
+    return inner, os.path.join('x', 'y')
+
+class Klass:
+    def method(self):
+        return [i * i for i in range(3)]
+'''
+    return compile(source, 'sample.py', 'exec')
+
+
+@pytest.mark.parametrize('version', VERSIONS)
+@pytest.mark.parametrize('value', VALUES, ids=repr)
+def test_values_match_marshal(value, version):
+    assert marshal_lite.loads(marshal.dumps(value, version)) == value
+
+
+@pytest.mark.parametrize('version', VERSIONS)
+def test_shared_references_resolve(version):
+    value = marshal_lite.loads(marshal.dumps((SHARED, SHARED, [SHARED]), version))
+    assert value == (SHARED, SHARED, [SHARED])
+    if version >= 3:
+        # 回引用指向同一个对象
+        assert value[0] is value[1] is value[2][0]
+
+
+@pytest.mark.parametrize('version', VERSIONS)
+def test_code_objects(version):
+    code = _sample_code()
+    assert marshal_lite.loads(marshal.dumps(code, version), magic=MAGIC) == _summary(code)
+
+
+@pytest.mark.parametrize('version', VERSIONS)
+def test_pyz_style_toc(version):
+    # PyInstaller 3.1+ 的 PYZ TOC：[(名称, (是否为包, 偏移, 长度)), ...]
+    toc = [('api', (1, 17, 100)), ('api.client', (0, 117, 2 ** 31 - 1)), ('main', (0, 0, 0))]
+    assert marshal_lite.loads(marshal.dumps(toc, version)) == toc
+
+
+def test_code_needs_magic():
+    with pytest.raises(marshal_lite.MarshalError):
+        marshal_lite.loads(marshal.dumps(_sample_code()))
+
+
+def _py38_code(flags):
+    # 3.8-3.10 的 code 对象：6 个 int（含 posonlyargcount），flags 为最后一个
+    def string(raw):
+        return b'z' + bytes([len(raw)]) + raw
+    return b'c' + struct.pack('<6i', 0, 0, 0, 1, 2, flags) + \
+        b's' + struct.pack('<i', 4) + b'd\x00S\x00' + \
+        b')\x01N' + b')\x00' + b')\x00' + b')\x00' + b')\x00' + \
+        string(b'a.py') + string(b'<module>') + struct.pack('<i', 1) + b's' + struct.pack('<i', 0)
+
+
+@pytest.mark.parametrize('magic', [3410, 3413, 3425, 3439])
+def test_py38_code_layout(magic):
+    # 3.8a1（3410）起就带 posonlyargcount，alpha 版本的 pyc 也要按 6 个 int 解析
+    code = marshal_lite.loads(_py38_code(0x40), magic=magic)
+    assert (code.name, code.filename, code.firstlineno, code.flags) == ('<module>', 'a.py', 1, 0x40)
+    assert code.code == b'd\x00S\x00' and code.consts == (None,)
+
+
+def test_truncated_data():
+    with pytest.raises(marshal_lite.MarshalError):
+        marshal_lite.loads(marshal.dumps(('abc', 1))[:-2])
+
+
+def _py2_str(tag, raw):
+    return tag + struct.pack('<i', len(raw)) + raw
+
+
+def _py2_int(value):
+    return b'i' + struct.pack('<i', value)
+
+
+def test_py2_toc():
+    # Python 2.7 的 marshal.dumps(toc)：名称为驻留字符串 't'，重复出现时写成 'R' + 驻留表下标
+    def entry(name, ispkg, pos, length):
+        return b'(' + struct.pack('<i', 2) + name + b'(' + struct.pack('<i', 3) + \
+            _py2_int(ispkg) + _py2_int(pos) + _py2_int(length)
+
+    data = b'[' + struct.pack('<i', 3) + \
+        entry(_py2_str(b't', b'api'), 1, 17, 100) + \
+        entry(_py2_str(b't', b'api.client'), 0, 117, 50) + \
+        entry(b'R' + struct.pack('<i', 0), 0, 167, 8)
+    assert marshal_lite.loads(data, py2=True) == [
+        (b'api', (1, 17, 100)),
+        (b'api.client', (0, 117, 50)),
+        (b'api', (0, 167, 8)),
+    ]
+
+
+def test_py2_magic():
+    assert marshal_lite.is_py2_magic(struct.pack('<H', 62211) + b'\r\n')  # Python 2.7
+    assert not marshal_lite.is_py2_magic(importlib.util.MAGIC_NUMBER)
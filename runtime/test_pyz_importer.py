@@ -0,0 +1,76 @@
+import os
+import sys
+import zlib
+import struct
+import marshal
+import importlib
+import importlib.util
+
+import pytest
+
+import pyz_importer
+from extract_pyz import PyzArchive
+
+
+MODULES = {
+    # 名称: (是否为包, 源码)
+    'demo': (1, 'HERE = __import__("os").path.dirname(__file__)\n'),
+    'demo.sub': (0, 'VALUE = 42\n'),
+}
+
+
+def _write_pyz(path, modules=MODULES, magic=importlib.util.MAGIC_NUMBER):
+    # PyInstaller 3.1+ 的 PYZ 布局：头部 12 字节，成员为 zlib(marshal(code))，末尾是 TOC 列表
+    body = b''
+    toc = []
+    for name, (ispkg, source) in modules.items():
+        data = zlib.compress(marshal.dumps(compile(source, name, 'exec')))
+        toc.append((name, (ispkg, 12 + len(body), len(data))))
+        body += data
+    with open(path, 'wb') as w:
+        w.write(b'PYZ\0' + magic + struct.pack('!i', 12 + len(body)) + body + marshal.dumps(toc))
+    return str(path)
+
+
+@pytest.fixture
+def installed(tmp_path):
+    importer = pyz_importer.install(_write_pyz(tmp_path / 'app.pyz'), patterns=['demo*'])
+    yield importer
+    pyz_importer.uninstall(importer)
+    for name in MODULES:
+        sys.modules.pop(name, None)
+
+
+def test_modules_have_a_file(installed):
+    import demo.sub
+    assert demo.sub.VALUE == 42
+    assert demo.sub.__file__ == os.path.join(installed.pyz.path, 'demo', 'sub.pyc')
+    assert demo.__file__ == os.path.join(installed.pyz.path, 'demo', '__init__.pyc')
+    assert demo.HERE == os.path.join(installed.pyz.path, 'demo')
+    assert installed.loaded == 2
+
+
+def _count_closes(monkeypatch):
+    closed = []
+    close = PyzArchive.close
+    monkeypatch.setattr(PyzArchive, 'close', lambda self: (closed.append(self.path), close(self)))
+    return closed
+
+
+def test_install_closes_archive_of_other_python(tmp_path, monkeypatch):
+    closed = _count_closes(monkeypatch)
+    path = _write_pyz(tmp_path / 'old.pyz', magic=b'\x55\x0d\x0d\x0a')  # Python 3.8
+    meta_path = list(sys.meta_path)
+    with pytest.raises(RuntimeError):
+        pyz_importer.install(path)
+    assert closed == [path]
+    assert sys.meta_path == meta_path
+
+
+def test_install_rejects_non_pyz(tmp_path, monkeypatch):
+    closed = _count_closes(monkeypatch)
+    path = tmp_path / 'bad.pyz'
+    path.write_bytes(b'not a pyz archive')
+    with pytest.raises(RuntimeError):
+        pyz_importer.install(str(path))
+    assert closed == [str(path)]
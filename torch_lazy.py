@@ -0,0 +1,139 @@
+"""
+torch延迟加载代理
+启动时只在sys.modules中放入代理，首次访问torch属性时才加载真实torch，失败则退回存根
+"""
+
+import sys
+import os
+import time
+import types
+import threading
+import importlib
+import importlib.util
+
+# inspect/doctest/pytest 等工具遍历 sys.modules 时会探测这些属性，不应因此加载torch
+_PROBE_ATTRS = frozenset(['__wrapped__', '__origin__', '__code__', '__self__', '__func__', '__test__'])
+_THIS_FILE = os.path.abspath(__file__)
+
+
+def _import_real_torch():
+    """默认加载方式：按正常路径导入torch，失败返回None"""
+    try:
+        return importlib.import_module('torch')
+    except ImportError as e:
+        print(f"PyTorch导入失败: {e}")
+        return None
+
+
+def _load_stub():
+    """退回到torch_stub中的存根"""
+    import torch_stub  # 导入时会把存根放进 sys.modules
+    stub = torch_stub.TorchStub()
+    sys.modules['torch._C'] = torch_stub.TorchStub()
+    return stub
+
+
+def _caller():
+    """找到触发加载的调用位置（跳过本文件与导入机制内部的帧）"""
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if os.path.abspath(filename) != _THIS_FILE and not filename.startswith('<frozen importlib'):
+            return f"{filename}:{frame.f_lineno}"
+        frame = frame.f_back
+    return '<unknown>'
+
+
+class LazyTorch(types.ModuleType):
+    """放在 sys.modules['torch'] 中的代理模块
+
+    只有访问属性（包括 import torch.xxx 时读取 __path__）才会加载真实torch；
+    加载后 sys.modules 换成真实模块，已经拿到代理的地方也会被转发过去。
+    加载前对代理的赋值（如 torch.xxx = ... 的猴子补丁）会在加载后重放到真实模块上。
+    """
+
+    def __init__(self, load=None, fallback=True, spec=None):
+        super().__init__('torch')
+        object.__setattr__(self, '_lazy_target', None)
+        object.__setattr__(self, '_lazy_load', load or _import_real_torch)
+        object.__setattr__(self, '_lazy_fallback', fallback)
+        object.__setattr__(self, '_lazy_lock', threading.RLock())
+        object.__setattr__(self, 'load_info', None)
+        object.__setattr__(self, '_lazy_setattrs', {})
+        # 用真实的 spec，importlib.util.find_spec('torch') 之类的探测不会触发加载
+        object.__setattr__(self, '__spec__', spec)
+        object.__setattr__(self, '__file__', spec.origin if spec is not None else None)
+
+    def _lazy_resolve(self, trigger):
+        with self._lazy_lock:
+            if self._lazy_target is not None:
+                return self._lazy_target
+            where = _caller()
+            start = time.perf_counter()
+            # 让真实torch的 __init__ 能在 sys.modules 中注册自己
+            if sys.modules.get('torch') is self:
+                del sys.modules['torch']
+            try:
+                module = self._lazy_load()
+            except Exception as e:
+                print(f"PyTorch导入失败: {e}")
+                module = None
+            source = 'torch'
+            if module is None:
+                if not self._lazy_fallback:
+                    sys.modules['torch'] = self
+                    raise ImportError(f"torch延迟加载失败（由 torch.{trigger} 触发，位置 {where}）")
+                module = _load_stub()
+                source = 'stub'
+            sys.modules['torch'] = module
+            # 重放加载前的赋值；代理上的副本删掉，之后的读取都转发到真实模块
+            for name, value in self._lazy_setattrs.items():
+                setattr(module, name, value)
+                self.__dict__.pop(name, None)
+            self._lazy_setattrs.clear()
+            seconds = time.perf_counter() - start
+            object.__setattr__(self, '_lazy_target', module)
+            object.__setattr__(self, 'load_info', {'trigger': trigger, 'where': where,
+                                                    'seconds': seconds, 'source': source})
+            print(f"torch延迟加载: 首次访问 torch.{trigger}（{where}），"
+                  f"加载{'真实torch' if source == 'torch' else '存根'}耗时 {seconds:.2f}s")
+            return module
+
+    def __getattr__(self, name):
+        # 只有模块自身没有的属性才会到这里
+        if name in _PROBE_ATTRS:
+            raise AttributeError(name)
+        return getattr(self._lazy_resolve(name), name)
+
+    def __setattr__(self, name, value):
+        with self._lazy_lock:
+            if self._lazy_target is not None:
+                setattr(self._lazy_target, name, value)
+                return
+            self._lazy_setattrs[name] = value
+            super().__setattr__(name, value)
+
+    def __dir__(self):
+        return dir(self._lazy_resolve('__dir__'))
+
+    def __repr__(self):
+        state = 'loaded' if self._lazy_target is not None else 'not loaded'
+        return f"<lazy module 'torch' ({state})>"
+
+
+def install(load=None, fallback=True):
+    """安装代理；torch已经导入时不做任何事，返回 sys.modules['torch']"""
+    if 'torch' in sys.modules:
+        return sys.modules['torch']
+    try:
+        spec = importlib.util.find_spec('torch')
+    except (ImportError, ValueError):
+        spec = None
+    proxy = LazyTorch(load, fallback, spec)
+    sys.modules['torch'] = proxy
+    return proxy
+
+
+if __name__ == "__main__":
+    proxy = install()
+    print(f"已安装torch延迟加载代理: {proxy!r}")
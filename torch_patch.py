@@ -8,8 +8,8 @@ import sys
 import os
 import importlib.util
 
-def patch_torch_import():
-    """修补torch导入问题"""
+def patch_torch_import(lazy=True):
+    """修补torch导入问题；lazy为True时只安装延迟加载代理，首次使用torch时才真正导入"""
     
     # 获取当前目录
     current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -29,12 +29,32 @@ def patch_torch_import():
         os.environ['DYLD_LIBRARY_PATH'] = f"{torch_lib_path}:{os.environ.get('DYLD_LIBRARY_PATH', '')}"
         os.environ['LD_LIBRARY_PATH'] = f"{torch_lib_path}:{os.environ.get('LD_LIBRARY_PATH', '')}"
     
+    # 补丁清单：已打过补丁时只做几次 stat
+    torch_dir = os.path.join(site_packages_path, 'torch')
+    if os.path.isdir(torch_dir):
+        import torch_site_patches
+        try:
+            torch_site_patches.apply_patches(torch_dir, verbose=False)
+        except OSError as e:
+            # 只读安装时无法打补丁，照常启动
+            print(f"torch补丁检查失败: {e}")
+    
+    if lazy:
+        import torch_lazy
+        torch_lazy.install(load=lambda: _import_torch(site_packages_path))
+        print("已安装torch延迟加载代理")
+        return True
+    return _import_torch(site_packages_path) is not None
+
+
+def _import_torch(site_packages_path):
+    """导入真实torch，失败时尝试手动加载torch._C；仍失败返回None"""
     # 尝试修复torch._C导入问题
     try:
         # 先尝试直接导入torch
         import torch
         print("PyTorch导入成功")
-        return True
+        return torch
     except ImportError as e:
         print(f"PyTorch导入失败: {e}")
         
@@ -58,14 +78,14 @@ def patch_torch_import():
                     # 再次尝试导入torch
                     import torch
                     print("PyTorch导入成功（通过手动加载_C）")
-                    return True
+                    return torch
         except Exception as e2:
             print(f"手动加载torch._C失败: {e2}")
     
-    return False
+    return None
 
 if __name__ == "__main__":
-    success = patch_torch_import()
+    success = patch_torch_import(lazy=False)
     if success:
         print("PyTorch补丁应用成功")
     else:
@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+"""
+site-packages/torch 补丁清单
+取代 fix_circular_import.py、fix_tensor_base.py、torch_init_patch.py、patch_torch_final.py、patch_torch_precise.py：
+每个文件的全部修改在一次读写中完成；已打过补丁的文件按内容哈希跳过；
+戳记文件记录各文件的大小与修改时间，什么都没变时启动只需几次 stat
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import hashlib
+from typing import Dict, List, NamedTuple, Tuple
+
+TORCH_DIR = "site-packages/torch"
+STAMP_NAME = ".baishi_patches.json"
+MANIFEST_VERSION = 1
+
+
+class Edit(NamedTuple):
+    """一处修改
+
+    kind:
+      replace      - 把 find 替换为 text；文件中已有 text 视为已应用
+      insert_after - 在 find 之后插入一行 text；find 后已紧跟 text 视为已应用
+      regex        - re.sub(find, text)；表达式需写成打完补丁后不再匹配，重复执行不会叠加
+    already: 文件中出现这段文字也视为已应用（旧脚本打出的写法与 text 不完全相同时使用）
+    """
+    kind: str
+    find: str
+    text: str
+    note: str
+    already: str = ''
+
+
+_TYPES_OLD_IMPORT = '''from torch import (  # noqa: F401
+    device as _device,
+    DispatchKey as DispatchKey,
+    dtype as _dtype,
+    layout as _layout,
+    qscheme as _qscheme,
+    Size as Size,
+    SymBool as SymBool,
+    SymFloat as SymFloat,
+    SymInt as SymInt,
+    Tensor as Tensor,
+)'''
+
+_TYPES_NEW_IMPORT = '''# 延迟导入以避免循环导入问题
+if TYPE_CHECKING:
+    from torch import (  # noqa: F401
+        device as _device,
+        DispatchKey as DispatchKey,
+        dtype as _dtype,
+        layout as _layout,
+        qscheme as _qscheme,
+        Size as Size,
+        SymBool as SymBool,
+        SymFloat as SymFloat,
+        SymInt as SymInt,
+        Tensor as Tensor,
+    )
+else:
+    # 运行时使用延迟导入
+    def _get_device():
+        from torch import device
+        return device
+    def _get_dispatch_key():
+        from torch import DispatchKey
+        return DispatchKey
+    def _get_dtype():
+        from torch import dtype
+        return dtype
+    def _get_layout():
+        from torch import layout
+        return layout
+    def _get_qscheme():
+        from torch import qscheme
+        return qscheme
+    def _get_size():
+        from torch import Size
+        return Size
+    def _get_symbool():
+        from torch import SymBool
+        return SymBool
+    def _get_symfloat():
+        from torch import SymFloat
+        return SymFloat
+    def _get_symint():
+        from torch import SymInt
+        return SymInt
+    def _get_tensor():
+        from torch import Tensor
+        return Tensor
+
+    # 创建延迟导入的代理对象
+    class _LazyImport:
+        def __init__(self, getter):
+            self._getter = getter
+            self._value = None
+
+        def __getattr__(self, name):
+            if self._value is None:
+                self._value = self._getter()
+            return getattr(self._value, name)
+
+        def __call__(self, *args, **kwargs):
+            if self._value is None:
+                self._value = self._getter()
+            return self._value(*args, **kwargs)
+
+    _device = _LazyImport(_get_device)
+    DispatchKey = _LazyImport(_get_dispatch_key)
+    _dtype = _LazyImport(_get_dtype)
+    _layout = _LazyImport(_get_layout)
+    _qscheme = _LazyImport(_get_qscheme)
+    Size = _LazyImport(_get_size)
+    SymBool = _LazyImport(_get_symbool)
+    SymFloat = _LazyImport(_get_symfloat)
+    SymInt = _LazyImport(_get_symint)
+    Tensor = _LazyImport(_get_tensor)'''
+
+_STORAGE_OLD_IMPORT = "from torch.types import _bool, _int, Storage"
+
+_STORAGE_NEW_IMPORT = '''# 延迟导入以避免循环导入问题
+try:
+    from torch.types import _bool, _int, Storage
+except ImportError:
+    # 如果导入失败，使用占位符
+    _bool = bool
+    _int = int
+    Storage = object'''
+
+_INIT_IMPORTS = '''import builtins
+import ctypes
+import functools
+import glob
+import importlib
+import inspect
+import math
+import os
+import platform
+import sys
+import textwrap
+import threading'''
+
+_INIT_DUMMY_C_IMPORT = '''# 导入虚拟_C模块以绕过C扩展问题
+try:
+    from . import _C
+    print("使用虚拟torch._C模块")
+except ImportError:
+    pass
+'''
+
+_INIT_OLD_CHECK = '''    # The __file__ check only works for Python 3.7 and above.
+    if _C_for_compiled_check.__file__ is None:
+        raise ImportError(
+            textwrap.dedent(
+                """
+                Failed to load PyTorch C extensions:
+                    It appears that PyTorch has loaded the `torch/_C` folder
+                    of the PyTorch repository rather than the C extensions which
+                    are expected in the `torch._C` namespace. This can occur when
+                    using the `install` workflow. e.g.
+                        $ python setup.py install && python -c "import torch"
+
+                    This error can generally be solved using the `develop` workflow
+                        $ python setup.py develop && python -c "import torch"  # This should succeed
+                    or by running Python from a different directory.
+                """
+            )
+        )'''
+
+_INIT_NEW_CHECK = '''    # The __file__ check only works for Python 3.7 and above.
+    # 跳过C扩展检查以允许应用程序运行
+    if _C_for_compiled_check.__file__ is None:
+        print("警告: PyTorch C扩展未正确加载，但继续运行...")
+        # 创建一个虚拟的_C模块
+        class DummyC:
+            def __getattr__(self, name):
+                def dummy(*args, **kwargs):
+                    print(f"警告: torch._C.{name} 被调用但C扩展未加载")
+                    return None
+                return dummy
+        _C_for_compiled_check = DummyC()'''
+
+# 文件（相对 torch 目录）-> 按顺序应用的修改
+PATCHES: Dict[str, List[Edit]] = {
+    '__init__.py': [
+        Edit('insert_after', _INIT_IMPORTS, _INIT_DUMMY_C_IMPORT, '导入虚拟_C模块（原 patch_torch_final.py）'),
+        # patch_torch_precise.py 按行改写，结果与 _INIT_NEW_CHECK 不同，但同样带有这行注释
+        Edit('replace', _INIT_OLD_CHECK, _INIT_NEW_CHECK,
+             '跳过C扩展检查（原 torch_init_patch.py / patch_torch_precise.py）', '    # 跳过C扩展检查'),
+    ],
+    '_tensor.py': [
+        # 原 fix_tensor_base.py；只匹配尚未注释的行，重复执行不会再加 #
+        Edit('regex', r'(?m)^([ \t]*)(\w+[ \t]*=[ \t]*_C\.TensorBase\.\w+)', r'\1# \2', '注释 _C.TensorBase 赋值'),
+        Edit('regex', r'"torch\._C\.TensorBase"', '"DummyTensorBase"', '替换类型注解中的 TensorBase'),
+        Edit('regex', r'(?m)^([^#\n]*?)(_C\.TensorBase\.\w+)', r'\1# \2', '注释其余 _C.TensorBase 引用'),
+    ],
+    'types.py': [
+        Edit('replace', _TYPES_OLD_IMPORT, _TYPES_NEW_IMPORT, '延迟导入 torch 类型（原 fix_circular_import.py）'),
+    ],
+    'storage.py': [
+        Edit('replace', _STORAGE_OLD_IMPORT, _STORAGE_NEW_IMPORT, 'torch.types 导入失败时用占位符（原 fix_circular_import.py）'),
+    ],
+}
+
+
+def manifest_digest() -> str:
+    """清单内容的哈希；清单一改，戳记与记录的文件哈希全部作废"""
+    h = hashlib.sha256(str(MANIFEST_VERSION).encode())
+    for name in sorted(PATCHES):
+        h.update(name.encode('utf-8'))
+        for edit in PATCHES[name]:
+            h.update(repr(tuple(edit[:3])).encode('utf-8'))
+    return h.hexdigest()
+
+
+def apply_edit(content: str, edit: Edit) -> Tuple[str, str]:
+    """返回 (新内容, 状态)；状态为 applied / already / missing"""
+    if edit.already and edit.already in content:
+        return content, 'already'
+    if edit.kind == 'replace':
+        # 先查 text：替换后的内容可能包含 find 本身（如 storage.py），不能再替换一次
+        if edit.text in content:
+            return content, 'already'
+        if edit.find in content:
+            return content.replace(edit.find, edit.text), 'applied'
+        return content, 'missing'
+    if edit.kind == 'insert_after':
+        if edit.find + '\n' + edit.text in content:
+            return content, 'already'
+        if edit.find in content:
+            return content.replace(edit.find, edit.find + '\n' + edit.text, 1), 'applied'
+        return content, 'missing'
+    if edit.kind == 'regex':
+        new, count = re.subn(edit.find, edit.text, content)
+        return new, 'applied' if count else 'already'
+    raise ValueError(f"未知的修改类型: {edit.kind}")
+
+
+def _stat_key(path: str) -> List[int]:
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def load_stamp(torch_dir: str) -> dict:
+    try:
+        with open(os.path.join(torch_dir, STAMP_NAME), 'r', encoding='utf-8') as f:
+            stamp = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return stamp if stamp.get('manifest') == manifest_digest() else {}
+
+
+def save_stamp(torch_dir: str, files: Dict[str, dict]) -> None:
+    """写入戳记；只读安装时抛出 OSError，由调用方决定是否提示"""
+    path = os.path.join(torch_dir, STAMP_NAME)
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as w:
+        json.dump({'manifest': manifest_digest(), 'files': files}, w, ensure_ascii=False, indent=1)
+    os.replace(tmp, path)
+
+
+def is_current(torch_dir: str, stamp: dict) -> bool:
+    """戳记中的每个文件大小与修改时间都没变：不读任何文件即可确认已打过补丁"""
+    files = stamp.get('files')
+    if not files or set(files) != set(PATCHES):
+        return False
+    try:
+        return all(_stat_key(os.path.join(torch_dir, name)) == files[name]['stat'] for name in PATCHES)
+    except OSError:
+        return False
+
+
+def patch_file(path: str, edits: List[Edit], patched_sha: str = '') -> Tuple[str, List[Tuple[Edit, str]]]:
+    """一次读入、依次应用全部修改、最多一次写回；返回 (补丁后内容的哈希, 各修改状态)"""
+    with open(path, 'rb') as f:
+        raw = f.read()
+    sha = _sha256(raw)
+    if sha == patched_sha:
+        # 与上次打完补丁的内容相同，无需逐条检查
+        return sha, [(edit, 'already') for edit in edits]
+
+    content = raw.decode('utf-8')
+    results = []
+    for edit in edits:
+        content, status = apply_edit(content, edit)
+        results.append((edit, status))
+    data = content.encode('utf-8')
+    if data != raw:
+        tmp = path + '.patch.tmp'
+        try:
+            with open(tmp, 'wb') as w:
+                w.write(data)
+            os.replace(tmp, path)
+        except OSError:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+    return _sha256(data), results
+
+
+def apply_patches(torch_dir: str = TORCH_DIR, verbose: bool = True) -> bool:
+    """应用全部补丁；全部修改已应用（或刚应用）时返回True"""
+    if not os.path.isdir(torch_dir):
+        print(f"目录不存在: {torch_dir}")
+        return False
+
+    stamp = load_stamp(torch_dir)
+    if is_current(torch_dir, stamp):
+        return True
+
+    start = time.perf_counter()
+    recorded = stamp.get('files', {})
+    files: Dict[str, dict] = {}
+    ok = True
+    for name, edits in PATCHES.items():
+        path = os.path.join(torch_dir, name)
+        if not os.path.exists(path):
+            print(f"文件不存在: {path}")
+            ok = False
+            continue
+        try:
+            sha, results = patch_file(path, edits, recorded.get(name, {}).get('sha256', ''))
+        except OSError as e:
+            # 只读安装等情况：写不回去，本文件保持原样
+            print(f"无法修补 {path}: {e}")
+            ok = False
+            continue
+        for edit, status in results:
+            if status == 'missing':
+                ok = False
+                print(f"未找到需要修补的代码: {name}: {edit.note}")
+            elif status == 'applied' and verbose:
+                print(f"已修补 {name}: {edit.note}")
+        files[name] = {'sha256': sha, 'stat': _stat_key(path)}
+
+    # 有修改找不到位置时不写戳记，下次启动仍会重新检查
+    if ok:
+        try:
+            save_stamp(torch_dir, files)
+        except OSError as e:
+            # 补丁都已就位，只是下次启动需要重新读一遍文件
+            if verbose:
+                print(f"无法写入补丁戳记: {e}")
+    if verbose:
+        print(f"torch补丁检查完成，用时 {time.perf_counter() - start:.3f}s")
+    return ok
+
+
+if __name__ == "__main__":
+    target = sys.argv[1] if len(sys.argv) > 1 else TORCH_DIR
+    if apply_patches(target):
+        print("所有修复完成！")
+    else:
+        print("部分修复失败")
+        sys.exit(1)